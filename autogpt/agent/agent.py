@@ -1,18 +1,23 @@
 import json
 import signal
 import sys
+import threading
 from datetime import datetime
 from pathlib import Path
 
 from colorama import Fore, Style
 
+from autogpt.agent.context_overflow import route_command_result
 from autogpt.config import Config
 from autogpt.config.ai_config import AIConfig
 from autogpt.json_utils.utilities import extract_json_from_response, validate_json
+from autogpt.llm.api_manager import ApiManager
 from autogpt.llm.chat import chat_with_ai
+from autogpt.llm.prompt_compiler import PromptCompiler
 from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS
 from autogpt.llm.utils import count_string_tokens
 from autogpt.log_cycle.log_cycle import (
+    CONTEXT_ROUTE_FILE_NAME,
     FULL_MESSAGE_HISTORY_FILE_NAME,
     NEXT_ACTION_FILE_NAME,
     USER_INPUT_FILE_NAME,
@@ -77,12 +82,15 @@ class Agent:
         self.config = config
         self.ai_config = ai_config
         self.system_prompt = system_prompt
+        self.prompt_compiler = PromptCompiler()
         self.triggering_prompt = triggering_prompt
         self.workspace = Workspace(workspace_directory, config.restrict_to_workspace)
         self.created_at = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.cycle_count = 0
         self.log_cycle_handler = LogCycleHandler()
         self.smart_token_limit = OPEN_AI_CHAT_MODELS.get(config.smart_llm).max_tokens
+        self.next_cycle_model: str | None = None
+        self._preparation: threading.Thread | None = None
 
 
     def start_interaction_loop(self):
@@ -109,6 +117,8 @@ class Agent:
 
         signal.signal(signal.SIGINT, signal_handler)
 
+        ApiManager.set_current_agent(f"{self.ai_config.ai_name}_{self.created_at}")
+
         while True:
             # Discontinue if continuous limit is reached
             self.cycle_count += 1
@@ -132,14 +142,18 @@ class Agent:
                 )
                 break
             # Send message to AI, get response
+            # A cycle may be routed to a larger-context model to fit a long result
+            model = self.next_cycle_model or self.config.smart_llm
+            self.next_cycle_model = None
+            self._wait_for_preparation()
             with Spinner("Thinking... ", plain_output=self.config.plain_output):
                 assistant_reply = chat_with_ai(
                     self.config,
                     self,
                     self.system_prompt,
                     self.triggering_prompt,
-                    self.smart_token_limit,
-                    self.config.smart_llm,
+                    OPEN_AI_CHAT_MODELS[model].max_tokens,
+                    model,
                 )
 
             try:
@@ -275,22 +289,41 @@ class Agent:
                     command_name, arguments = plugin.pre_command(
                         command_name, arguments
                     )
+                # Do the work for the next prompt that doesn't need the command result
+                # while the command executes
+                self._start_preparation(self.config.smart_llm)
                 command_result = execute_command(
                     command_name=command_name,
                     arguments=arguments,
                     agent=self,
                 )
-                result = f"Command {command_name} returned: " f"{command_result}"
-
-                result_tlength = count_string_tokens(
-                    str(command_result), self.config.smart_llm
-                )
+                self._wait_for_preparation()
                 memory_tlength = count_string_tokens(
                     str(self.history.summary_message()), self.config.smart_llm
                 )
-                if result_tlength + memory_tlength + 600 > self.smart_token_limit:
-                    result = f"Failure: command {command_name} returned too much output. \
-                        Do not execute this command again with the same arguments."
+                route = route_command_result(
+                    command_name, str(command_result), memory_tlength, self.config
+                )
+                result = route.result
+                if route.path != "fits":
+                    logger.typewriter_log(
+                        "COMMAND OUTPUT TOO LONG: ",
+                        Fore.YELLOW,
+                        f"{route.result_tokens} tokens; handled by {route.path}"
+                        + (f" to {route.model}" if route.path == "upgrade" else ""),
+                    )
+                    self.log_cycle_handler.log_cycle(
+                        self.ai_config.ai_name,
+                        self.created_at,
+                        self.cycle_count,
+                        route.to_log(),
+                        CONTEXT_ROUTE_FILE_NAME,
+                    )
+                if route.path == "upgrade":
+                    self.next_cycle_model = route.model
+                    # The next prompt was prepared for the smart LLM; prepare it for
+                    # the model the next cycle will run on instead
+                    self._start_preparation(route.model)
 
                 for plugin in self.config.plugins:
                     if not plugin.can_handle_post_command():
@@ -310,6 +343,27 @@ class Agent:
                     "SYSTEM: ", Fore.YELLOW, "Unable to execute command"
                 )
 
+    def _start_preparation(self, model: str) -> None:
+        """Start preparing the next prompt for `model` in the background"""
+        self._wait_for_preparation()
+        self._preparation = threading.Thread(
+            target=self._prepare_next_prompt, args=(model,), daemon=True
+        )
+        self._preparation.start()
+
+    def _wait_for_preparation(self) -> None:
+        if self._preparation is not None:
+            self._preparation.join()
+            self._preparation = None
+
+    def _prepare_next_prompt(self, model: str) -> None:
+        """Compile the prompt and count the tokens of the history for the next cycle"""
+        try:
+            self.prompt_compiler.compile(self, self.system_prompt, model)
+            self.history.prepare_context(model)
+        except Exception as e:
+            logger.debug(f"Could not prepare the next prompt: {e}")
+
     def _resolve_pathlike_command_args(self, command_args):
         if "directory" in command_args and command_args["directory"] in {"", "/"}:
             command_args["directory"] = str(self.workspace.root)
@@ -0,0 +1,155 @@
+"""Handling of command results that don't fit in the agent's context window"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Literal
+
+from autogpt.config import Config
+from autogpt.llm.auxiliary import auxiliary_request
+from autogpt.llm.base import ChatModelInfo
+from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS
+from autogpt.llm.utils import count_string_tokens
+from autogpt.logs import logger
+from autogpt.processing.text import summarize_text
+
+RESERVED_TOKENS = 600
+"""Tokens to keep free for the rest of the prompt besides the result and summary"""
+
+MIN_COMPRESSED_RESULT_TOKENS = 100
+"""Minimum budget for a summarized result, below which summarizing is pointless"""
+
+
+@dataclass
+class ContextRoute:
+    """How a command result is passed on to the next cycle
+
+    Attributes:
+        path: "fits" if the result fits as it is, "upgrade" if the next cycle runs on
+            a model with a larger context window, "compress" if the result has been
+            summarized, or "fail" if the result had to be dropped.
+        model: The model with which to run the next cycle.
+        result: The message with the result of the command to add to the history.
+        result_tokens: The number of tokens of the full command output.
+        token_limit: The context window of `model`.
+    """
+
+    path: Literal["fits", "upgrade", "compress", "fail"]
+    model: str
+    result: str
+    result_tokens: int
+    token_limit: int
+
+    def to_log(self) -> dict:
+        return {
+            "path": self.path,
+            "model": self.model,
+            "result_tokens": self.result_tokens,
+            "token_limit": self.token_limit,
+        }
+
+
+def route_command_result(
+    command_name: str, command_result: str, summary_tokens: int, config: Config
+) -> ContextRoute:
+    """Decide how to pass a command result to the next cycle.
+
+    A result that fits in the context window of the smart LLM next to the running
+    summary is passed on as it is. Otherwise, depending on the configured
+    `context_overflow_strategy`:
+    - "upgrade": run the next cycle on the smallest larger-context variant of the
+      smart LLM which fits the result, or else summarize the result like "compress";
+    - "compress": summarize the result, if the summary fits;
+    - "fail": drop the result and tell the agent not to repeat the command.
+
+    Args:
+        command_name: The name of the executed command.
+        command_result: The output of the command.
+        summary_tokens: The number of tokens of the running summary of the history.
+        config: The config, which determines the smart LLM and strategy.
+    """
+    model = config.smart_llm
+    token_limit = OPEN_AI_CHAT_MODELS[model].max_tokens
+    result = f"Command {command_name} returned: {command_result}"
+    result_tokens = count_string_tokens(command_result, model)
+
+    def fits(tokens: int, limit: int) -> bool:
+        return tokens + summary_tokens + RESERVED_TOKENS <= limit
+
+    if fits(result_tokens, token_limit):
+        return ContextRoute("fits", model, result, result_tokens, token_limit)
+
+    strategy = config.context_overflow_strategy
+    if strategy == "upgrade":
+        for larger_model in get_larger_context_models(model):
+            if fits(result_tokens, larger_model.max_tokens):
+                logger.debug(
+                    f"Command result of {result_tokens} tokens doesn't fit in the"
+                    f" context of {model}; running the next cycle on"
+                    f" {larger_model.name}"
+                )
+                return ContextRoute(
+                    "upgrade",
+                    larger_model.name,
+                    result,
+                    result_tokens,
+                    larger_model.max_tokens,
+                )
+
+    budget = token_limit - summary_tokens - RESERVED_TOKENS
+    if strategy in ("upgrade", "compress") and budget >= MIN_COMPRESSED_RESULT_TOKENS:
+        logger.debug(
+            f"Command result of {result_tokens} tokens doesn't fit in the context;"
+            f" summarizing it within {budget} tokens"
+        )
+        try:
+            with auxiliary_request():
+                summary, _ = summarize_text(
+                    command_result,
+                    config,
+                    instruction=(
+                        "keep all details which may be needed for the next step,"
+                        " such as names, numbers, paths, URLs and error messages"
+                    ),
+                )
+        except Exception as e:
+            logger.warn(f"Could not summarize command output: {e}")
+        else:
+            compressed_result = (
+                f"Command {command_name} returned too much output to show in full."
+                f" Summary of the output: {summary}"
+            )
+            if count_string_tokens(compressed_result, model) <= budget:
+                return ContextRoute(
+                    "compress", model, compressed_result, result_tokens, token_limit
+                )
+
+    return ContextRoute(
+        "fail",
+        model,
+        f"Failure: command {command_name} returned too much output."
+        " Do not execute this command again with the same arguments.",
+        result_tokens,
+        token_limit,
+    )
+
+
+def get_larger_context_models(model: str) -> list[ChatModelInfo]:
+    """Get the variants of a model with a larger context window, smallest first
+
+    e.g. gpt-4-32k for gpt-4, or gpt-3.5-turbo-16k-0613 for gpt-3.5-turbo-0613
+    """
+    base_name = _strip_context_size(model)
+    token_limit = OPEN_AI_CHAT_MODELS[model].max_tokens
+    return sorted(
+        (
+            info
+            for name, info in OPEN_AI_CHAT_MODELS.items()
+            if _strip_context_size(name) == base_name and info.max_tokens > token_limit
+        ),
+        key=lambda info: info.max_tokens,
+    )
+
+
+def _strip_context_size(model: str) -> str:
+    return re.sub(r"-\d+k(?=-|$)", "", model)
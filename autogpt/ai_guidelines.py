@@ -2,9 +2,16 @@
 This module implements user defined guidelines that monitor recent messages
 for 
 '''
+import re
 import time
 import yaml
 import json
+import numpy as np
+import contextvars
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from colorama import Fore
 from openai.error import RateLimitError
 from prompt_toolkit import ANSI, PromptSession
@@ -13,8 +20,39 @@ from prompt_toolkit.history import InMemoryHistory
 from autogpt.config import Config
 from autogpt.logs import logger
 from autogpt.llm.utils import count_message_tokens, create_chat_completion
+from autogpt.llm.auxiliary import auxiliary_request
 from autogpt.llm.base import ChatSequence, Message
+from autogpt.llm.priority import RequestPriority, request_priority
 from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS, OpenAIFunctionSpec
+from autogpt.memory.vector.utils import get_embedding
+from autogpt.processing.text import summarize_text
+
+MONITOR_JUDGED_CONTEXT_TOKENS = 1000
+"""Budget of the already judged messages that are sent verbatim with a check; older
+ones are condensed into a rolling summary"""
+MONITOR_RESPONSE_TOKENS = 500
+"""Tokens reserved for the verdict of a check"""
+MAX_CACHED_VERDICTS = 1000
+MAX_JUDGED_HASHES = 10000
+
+RISKY_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'\brm\s+-\w*[rf]', r'\bsudo\b', r'\bchmod\b', r'\bkill\b',
+    r'\bexecute_(shell|python)', r'\bdelete_file\b',
+    r'\b(password|passwd|credential|secret|api[ _-]?key|token)s?\b',
+    r'\b(buy|purchase|payment|transfer|wire)\b',
+)]
+"""Patterns in new messages which always require a check by the LLM, on top of the
+patterns of the guidelines themselves"""
+EMBEDDING_CHUNK_CHARS = 8000
+"""Messages are embedded in chunks of this many characters, to stay well within the
+token limit of the embedding model"""
+
+TIME_MESSAGE_START = 'The current time and date is'
+TRUNCATION_MARK = ' [truncated]'
+JUDGED_MESSAGES_HEADER = 'The following messages have already been checked, ' \
+        'and are only given as context:'
+NEW_MESSAGES_HEADER = 'The following messages are new. Only report violations ' \
+        'that occur in these new messages:'
 
 terminal_session = PromptSession(history=InMemoryHistory())
 
@@ -70,6 +108,18 @@ class AIGuidelines:
             self.save()
         self.gprompt = self.construct_full_prompt()
         self.bsilent = bsilent
+        # State of the incremental checks, see exec_monitor
+        self._monitor_lock = threading.Lock()
+        self._judged_summary = ''
+        self._judged_summary_tokens = 0
+        self._judged_messages: list[tuple[Message, int]] = []
+        self._judged_hashes: OrderedDict[str, None] = OrderedDict()
+        self._verdicts: OrderedDict[str, tuple[bool, str]] = OrderedDict()
+        self._gprompt_tokens: dict[tuple[str, str], int] = {}
+        self._guideline_embeddings: tuple[tuple, np.ndarray] | None = None
+        # One check at a time; a check that falls behind delays the next, not the agent
+        self._monitor_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='guidelines_monitor')
 
 
     def load(self):
@@ -80,6 +130,8 @@ class AIGuidelines:
             guidelines_data = {}
 
         self.ai_guidelines = guidelines_data.get('guidelines', [])
+        # Regexes by guideline number; a match always has that guideline checked
+        self.guideline_patterns = guidelines_data.get('patterns') or {}
         return
 
     def create_guidelines(self):
@@ -151,10 +203,14 @@ class AIGuidelines:
 
     def save(self):
         guidelines_data = {"guidelines": self.ai_guidelines}
+        if self.guideline_patterns:
+            guidelines_data['patterns'] = self.guideline_patterns
         with open(self.filename, "w", encoding="utf-8") as file:
             yaml.dump(guidelines_data, file)
 
-    def construct_full_prompt(self):
+    def construct_full_prompt(self, guideline_nums: list[int] | None = None):
+        """Construct the prompt of the checks, with all guidelines or only the given
+        ones. The guidelines keep their numbers in either case."""
         full_prompt = """You are a critical component within a system that implements a general AI that attempts to
 achieve goals set by the user in an autonamous manner.
 Your role is to make sure that the other components of the system are abiding by the background guidelines
@@ -175,15 +231,49 @@ is even more important than success at achieving your goals:\n\n
 
         # Construct full prompt
         for irule, rule in enumerate(self.ai_guidelines):
-            full_prompt += f"{irule+1}. {rule}\n"
+            if guideline_nums is None or irule+1 in guideline_nums:
+                full_prompt += f"{irule+1}. {rule}\n"
 
         full_prompt += "Please respond either with a detailed report of the guideline violation or with the single word \"continue\"."
         return full_prompt
 
 
+    def submit_monitor(self, config, context_messages : list[dict[str, str]], model: str | None = None) -> Future:
+        """Start exec_monitor in the background, so that the guideline check can run
+        concurrently with the main chat completion of the cycle.
+
+        Returns:
+            Future: Resolves to the (bviolation, alert_msg) tuple of exec_monitor.
+        """
+        if self.bsilent:
+            future = Future()
+            future.set_result((False, 'continue'))
+            return future
+
+        # Snapshot the messages, and keep the caller's context (e.g. the agent that
+        # the API usage is attributed to)
+        context = contextvars.copy_context()
+        return self._monitor_executor.submit(
+                context.run, self.exec_monitor, config, list(context_messages), model)
+
+    @auxiliary_request()
+    @request_priority(RequestPriority.MONITORING)
     def exec_monitor(self, config, context_messages : list[dict[str, str]], model: str | None = None):
-        """Interact with the OpenAI API, sending the prompt, user input, message history,
-        and permanent memory."""
+        """Interact with the OpenAI API, sending the prompt and the messages added to
+        the context since the last check to be evaluated for guideline violation.
+
+        The check is incremental: messages that have already been judged are only sent
+        as context, as a rolling summary plus the most recent ones verbatim, so the size
+        of a check doesn't grow with the length of the run. Verdicts are cached by the
+        content of the messages they judged.
+
+        Args:
+            context_messages : list[dict[str, str]] : The list of all messages built up
+            so far as the context that will, with plugin additions, be sent to the model
+
+        Returns:
+            tuple[bool, str]: Whether there is a violation, and the alert message.
+        """
         if self.bsilent:
             return False, 'continue'
 
@@ -191,67 +281,226 @@ is even more important than success at achieving your goals:\n\n
         if model is None:
             model = config.fast_llm
         token_limit = OPEN_AI_CHAT_MODELS.get(model).max_tokens
+        with self._monitor_lock:
+            new_messages = self._get_new_messages(context_messages, model)
+            if not new_messages:
+                logger.debug("Guidelines Monitoring: no new messages to check")
+                return False, 'continue'
+
+            gprompt = self.gprompt
+            if config.guidelines_prefilter:
+                guideline_nums = self._prefilter(config, new_messages)
+                if guideline_nums is not None and not guideline_nums:
+                    logger.debug("Guidelines Monitoring: new messages are clearly safe")
+                    self._mark_judged(new_messages)
+                    return False, 'continue'
+                if guideline_nums is not None:
+                    logger.debug(f"Guidelines Monitoring: checking guidelines {guideline_nums}")
+                    gprompt = self.construct_full_prompt(guideline_nums)
+
+            verdict_key = _hash_messages([model, gprompt] + [m for m, _ in new_messages])
+            if verdict_key in self._verdicts:
+                logger.debug("Guidelines Monitoring: reusing the verdict on these messages")
+                self._verdicts.move_to_end(verdict_key)
+                return self._verdicts[verdict_key]
+
+            self._condense_judged_messages(config, model)
+            lmessages, current_tokens_used = self._build_monitor_prompt(
+                    model, gprompt, new_messages, token_limit)
+            verdict = self._request_verdict(
+                    config, model, gprompt, lmessages, token_limit - current_tokens_used)
+
+            self._verdicts[verdict_key] = verdict
+            while len(self._verdicts) > MAX_CACHED_VERDICTS:
+                self._verdicts.popitem(last=False)
+            self._mark_judged(new_messages)
+            return verdict
+
+    def _mark_judged(self, new_messages: list[tuple[Message, int]]):
+        for message, tokens in new_messages:
+            self._judged_hashes[_hash_messages([message])] = None
+            self._judged_messages.append((message, tokens))
+        while len(self._judged_hashes) > MAX_JUDGED_HASHES:
+            self._judged_hashes.popitem(last=False)
+
+    def _prefilter(self, config, new_messages: list[tuple[Message, int]]) -> list[int] | None:
+        """Score the new messages against the guidelines locally, by the cosine
+        similarity of their embeddings and by regex rules.
+
+        Returns:
+            list[int]: The numbers of the guidelines to check with the LLM, or an empty
+            list if the messages are clearly safe. None if the scoring failed, in
+            which case all guidelines should be checked.
+        """
+        if not self.ai_guidelines:
+            return []
+        texts = [m.content for m, _ in new_messages]
+        risky = any(p.search(t) for p in RISKY_PATTERNS for t in texts)
+        pattern_hits = set()
+        for guideline_num, patterns in self.guideline_patterns.items():
+            if any(re.search(p, t, re.IGNORECASE) for p in patterns for t in texts):
+                pattern_hits.add(int(guideline_num))
+
+        chunks = [t[i:i + EMBEDDING_CHUNK_CHARS]
+                  for t in texts for i in range(0, len(t), EMBEDDING_CHUNK_CHARS)]
+        try:
+            guideline_vectors = self._get_guideline_embeddings(config)
+            message_vectors = _normalize_rows(get_embedding(chunks, config)) \
+                    if chunks else np.zeros((0, guideline_vectors.shape[1]))
+        except Exception as e:
+            logger.warn(f"Could not score the messages against the guidelines: {e}")
+            return None
+        # Similarity of each guideline to its most similar chunk
+        scores = (message_vectors @ guideline_vectors.T).max(axis=0, initial=-1.0)
+        logger.debug(f"Guidelines Monitoring: similarity scores {np.round(scores, 3)}")
+
+        if not risky and not pattern_hits \
+                and scores.max() < config.guidelines_safe_similarity:
+            return []
+        ranked = [int(i) + 1 for i in np.argsort(-scores, kind='stable')]
+        forced = sorted(n for n in pattern_hits if 1 <= n <= len(self.ai_guidelines))
+        return forced + [n for n in ranked if n not in forced][:config.guidelines_top_k]
+
+    def _get_guideline_embeddings(self, config) -> np.ndarray:
+        """Get the normalized embeddings of the guidelines, embedding them only once"""
+        key = tuple(self.ai_guidelines)
+        if self._guideline_embeddings is None or self._guideline_embeddings[0] != key:
+            vectors = _normalize_rows(get_embedding(list(self.ai_guidelines), config))
+            self._guideline_embeddings = (key, vectors)
+        return self._guideline_embeddings[1]
+
+    def _get_new_messages(self, context_messages : list[dict[str, str]], model: str) -> list[tuple[Message, int]]:
+        """Get the messages of the context that haven't been judged yet, with their
+        token counts"""
+        new_messages = []
+        new_hashes = set()
+        for imsg, message in enumerate(context_messages):
+            message : dict[str, str]
+            if imsg == 0:
+                c_sys_msg_start = 'You are '
+                assert 'role' in message and message['role'] == 'system' and\
+                        'content' in message and \
+                        message['content'][:len(c_sys_msg_start)] == c_sys_msg_start,\
+                        'Error! AUto-GPT code has changed so that the initial message is unexpected'
+                continue
+            elif imsg == len(context_messages) - 1:
+                c_last_msg_start = 'Determine exactly'
+                assert 'role' in message and message['role'] == 'user' and\
+                        'content' in message and \
+                        message['content'][:len(c_last_msg_start)] == c_last_msg_start,\
+                        'Error! AUto-GPT code has changed so that the last message is unexpected'
+                continue
+            elif message['content'].startswith(TIME_MESSAGE_START):
+                # Changes every cycle, but there's nothing in it to check
+                continue
+            model_message = Message(message['role'], message['content'])
+            message_hash = _hash_messages([model_message])
+            if message_hash in self._judged_hashes or message_hash in new_hashes:
+                continue
+            new_hashes.add(message_hash)
+            new_messages.append((model_message, count_message_tokens([model_message], model)))
+        return new_messages
+
+    def _condense_judged_messages(self, config, model: str):
+        """Fold the oldest judged messages into the rolling summary once the judged
+        messages that are sent verbatim exceed MONITOR_JUDGED_CONTEXT_TOKENS"""
+        judged_tokens = sum(tokens for _, tokens in self._judged_messages)
+        if judged_tokens <= MONITOR_JUDGED_CONTEXT_TOKENS:
+            return
+
+        to_condense = []
+        while self._judged_messages and judged_tokens > MONITOR_JUDGED_CONTEXT_TOKENS // 2:
+            message, tokens = self._judged_messages.pop(0)
+            to_condense.append(message)
+            judged_tokens -= tokens
+
+        text = '\n'.join(f'{m.role.capitalize()}: {m.content}' for m in to_condense)
+        if self._judged_summary:
+            text = f'Earlier events: {self._judged_summary}\n{text}'
+        try:
+            self._judged_summary, _ = summarize_text(
+                text,
+                config,
+                instruction='keep everything that may be relevant to checking later '
+                    'actions of the AI against guidelines for its behavior',
+            )
+            self._judged_summary_tokens = count_message_tokens(
+                    [self._judged_summary_message()], model)
+        except Exception as e:
+            # The messages have been judged, so dropping them only costs context
+            logger.warn(f"Could not summarize the checked messages: {e}")
+
+    def _judged_summary_message(self) -> Message:
+        return Message('system', 'Summary of the earlier messages, which have '
+                f'already been checked:\n{self._judged_summary}')
+
+    def _build_monitor_prompt(self, model: str, gprompt: str, new_messages: list[tuple[Message, int]],
+                              token_limit: int) -> tuple[ChatSequence, int]:
+        """Build the prompt of a check, truncating it to fit the token limit"""
+        if self._gprompt_tokens.get((model, gprompt)) is None:
+            self._gprompt_tokens[(model, gprompt)] = count_message_tokens(
+                    [Message("system", gprompt)], model)
+        new_header = Message('system', NEW_MESSAGES_HEADER)
+        budget = token_limit - MONITOR_RESPONSE_TOKENS - self._gprompt_tokens[(model, gprompt)] \
+                - count_message_tokens([new_header], model)
+
+        # Make sure the new messages fit, by truncating the largest ones
+        new_messages = list(new_messages)
+        new_tokens = sum(tokens for _, tokens in new_messages)
+        while new_tokens > budget:
+            ilargest = max(range(len(new_messages)), key=lambda i: new_messages[i][1])
+            message, tokens = new_messages[ilargest]
+            max_tokens = max(tokens - (new_tokens - budget), 0)
+            if not message.content:
+                break # nothing left to cut
+            keep = len(message.content) * max_tokens // tokens - len(TRUNCATION_MARK)
+            content = message.content[:keep] + TRUNCATION_MARK if keep > 0 else ''
+            message = Message(message.role, content)
+            truncated_tokens = count_message_tokens([message], model)
+            new_messages[ilargest] = (message, truncated_tokens)
+            new_tokens += truncated_tokens - tokens
+        budget -= new_tokens
+
+        # Fill the rest with the context of already judged messages, most recent first
+        context = []
+        if self._judged_summary and self._judged_summary_tokens <= budget:
+            context.append(self._judged_summary_message())
+            budget -= self._judged_summary_tokens
+        judged_header = Message('system', JUDGED_MESSAGES_HEADER)
+        budget -= count_message_tokens([judged_header], model)
+        judged_messages = []
+        for message, tokens in reversed(self._judged_messages):
+            if tokens > budget:
+                break
+            judged_messages.insert(0, message)
+            budget -= tokens
+        if judged_messages:
+            context += [judged_header] + judged_messages
+
+        lmessages = ChatSequence.for_model(model, [Message("system", gprompt)])
+        lmessages.extend(context + [new_header] + [m for m, _ in new_messages])
+        current_tokens_used = token_limit - MONITOR_RESPONSE_TOKENS - budget
+        if not judged_messages:
+            current_tokens_used -= count_message_tokens([judged_header], model)
+        return lmessages, current_tokens_used
+
+    def _request_verdict(self, config, model: str, gprompt: str, lmessages: ChatSequence,
+                         tokens_remaining: int):
+        # Debug print the current context
+        logger.debug("Guidelines Monitoring...")
+        logger.debug(f"Guidelines Tokens remaining for response: {tokens_remaining}")
+        logger.debug("------------ CONTEXT SENT TO AI ---------------")
+        for message in lmessages:
+            message : Message
+            # Skip printing the prompt
+            if message.role == "system" and message.content == gprompt:
+                continue
+            logger.debug(f"{message.role.capitalize()}: {message.content}")
+            logger.debug("")
+        logger.debug("----------- END OF CONTEXT ----------------")
+
         while True:
             try:
-                """
-                Interact with the OpenAI API, sending the xurrent prompt to be evaluated for 
-                    guideline violation.
-
-                Args:
-                    messages : list[dict[str, str]] : The list of all messages built up so far as the context
-                    that will, with plugin additions, be sent ot the model
-
-                Returns:
-                    str: The AI's response.
-                """
-
-                system_msg = Message("system", self.gprompt)
-                lmessages = ChatSequence.for_model(model,[system_msg])
-                current_tokens_used = count_message_tokens([system_msg], model)
-                for imsg, message in enumerate(context_messages):
-                    message : dict[str, str]
-                    if imsg == 0:
-                        c_sys_msg_start = 'You are '
-                        assert 'role' in message and message['role'] == 'system' and\
-                                'content' in message and \
-                                message['content'][:len(c_sys_msg_start)] == c_sys_msg_start,\
-                                'Error! AUto-GPT code has changed so that the initial message is unexpected'
-                        continue
-                    elif imsg == len(context_messages) - 1:
-                        c_last_msg_start = 'Determine exactly'
-                        assert 'role' in message and message['role'] == 'user' and\
-                                'content' in message and \
-                                message['content'][:len(c_last_msg_start)] == c_last_msg_start,\
-                                'Error! AUto-GPT code has changed so that the last message is unexpected'
-                        continue
-                    model_message = Message(message['role'], message['content'])
-                    current_tokens_used += count_message_tokens([model_message], model)
-                    lmessages.append(model_message)
-                # c_violation_report_start = 'Guidelines Violation'
-                # prompt_msg = Message('user', 'Please do nothing other than check this history '\
-                #         'for guideline violations. If there are violations, start your response '\
-                #         f'with the words \"{c_violation_report_start}\" '\
-                #         'and if no violations are found, respond with the single word "continue".')
-                # current_tokens_used += count_message_tokens([prompt_msg], model)
-                # lmessages.append(prompt_msg)
-                # Calculate remaining tokens
-                tokens_remaining = token_limit - current_tokens_used
-                # assert tokens_remaining >= 0, "Tokens remaining is negative.
-
-                # Debug print the current context
-                logger.debug("Guidelines Monitoring...")
-                logger.debug(f"Guidelines Send Token Count: {current_tokens_used}")
-                logger.debug(f"Guidelines Tokens remaining for response: {tokens_remaining}")
-                logger.debug("------------ CONTEXT SENT TO AI ---------------")
-                for message in lmessages:
-                    message : Message
-                    # Skip printing the prompt
-                    if message.role == "system" and message.content == self.gprompt:
-                        continue
-                    logger.debug(f"{message.role.capitalize()}: {message.content}")
-                    logger.debug("")
-                logger.debug("----------- END OF CONTEXT ----------------")
-
                 # TODO: use a model defined elsewhere, so that model can contain
                 # temperature and other settings we care about
                 violation_reply = create_chat_completion(
@@ -284,3 +533,19 @@ is even more important than success at achieving your goals:\n\n
                 # TODO: When we switch to langchain, this is built in
                 print("Error: ", "API Rate Limit Reached. Waiting 10 seconds...")
                 time.sleep(10)
+
+
+def _normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _hash_messages(messages: list) -> str:
+    hasher = hashlib.sha256()
+    for message in messages:
+        if isinstance(message, Message):
+            message = f'{message.role}\0{message.content}'
+        hasher.update(message.encode('utf-8'))
+        hasher.update(b'\1')
+    return hasher.hexdigest()
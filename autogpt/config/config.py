@@ -17,6 +17,21 @@ AZURE_CONFIG_FILE = os.path.join(os.path.dirname(__file__), "../..", "azure.yaml
 PLUGINS_CONFIG_FILE = os.path.join(
     os.path.dirname(__file__), "../..", "plugins_config.yaml"
 )
+LLM_RESPONSE_CACHE_FILE = os.path.join(
+    os.path.dirname(__file__), "../..", "data", "llm_response_cache.sqlite3"
+)
+EMBEDDING_CACHE_FILE = os.path.join(
+    os.path.dirname(__file__), "../..", "data", "embedding_cache.sqlite3"
+)
+SUMMARY_CACHE_FILE = os.path.join(
+    os.path.dirname(__file__), "../..", "data", "summary_cache.sqlite3"
+)
+OPENAI_MODELS_CACHE_FILE = os.path.join(
+    os.path.dirname(__file__), "../..", "data", "openai_models.json"
+)
+OPENAI_RATE_LIMIT_STATE_FILE = os.path.join(
+    os.path.dirname(__file__), "../..", "data", "openai_rate_limits.json"
+)
 GPT_4_MODEL = "gpt-4"
 GPT_3_MODEL = "gpt-3.5-turbo"
 
@@ -53,8 +68,49 @@ class Config(SystemSettings):
     smart_llm: str = "gpt-4"
     temperature: float = 0
     openai_functions: bool = False
+    openai_streaming: bool = False
     embedding_model: str = "text-embedding-ada-002"
+    embedding_batch_wait_ms: float = 5
+    embedding_batch_max_size: int = 256
+    embedding_cache: bool = False
+    embedding_cache_file: str = EMBEDDING_CACHE_FILE
+    embedding_cache_max_size_mb: int = 500
     browse_spacy_language_model: str = "en_core_web_sm"
+    # Response cache
+    llm_response_cache: bool = False
+    llm_response_cache_file: str = LLM_RESPONSE_CACHE_FILE
+    llm_response_cache_max_size_mb: int = 100
+    llm_response_cache_max_temperature: float = 0
+    # Summary cache
+    summary_cache: bool = False
+    summary_cache_file: str = SUMMARY_CACHE_FILE
+    summary_cache_min_similarity: float = 0.98
+    summary_cache_max_entries: int = 10000
+    # Rate limits per model, keyed by model name (prefix) or "*" for all models
+    openai_requests_per_minute: Dict[str, int] = Field(default_factory=dict)
+    openai_tokens_per_minute: Dict[str, int] = Field(default_factory=dict)
+    openai_rate_limit_state_file: Optional[str] = OPENAI_RATE_LIMIT_STATE_FILE
+    # Cached list of the models available to the API key, refreshed after the TTL
+    openai_models_cache_file: Optional[str] = OPENAI_MODELS_CACHE_FILE
+    openai_models_cache_ttl: int = 86400
+    # HTTP connections to the OpenAI API
+    openai_http_pool_size: int = 10
+    openai_http_keep_alive: float = 60
+    openai_connect_timeout: float = 10
+    openai_read_timeout: float = 600
+    # Hedging of slow chat completion requests
+    openai_hedge_percentile: float = 0
+    openai_hedge_min_delay: float = 2.0
+    # Local pre-filter of the guideline checks, see AIGuidelines
+    guidelines_prefilter: bool = False
+    guidelines_safe_similarity: float = 0.8
+    guidelines_top_k: int = 3
+    # What to do with command results that don't fit in the context window:
+    # "fail", "compress" or "upgrade" (to a larger-context model)
+    context_overflow_strategy: str = "fail"
+    # Number of trimmed cycles the running summary may lag behind while it is being
+    # updated in the background, before a cycle waits for the update
+    running_summary_max_lag: int = 1
     # Run loop configuration
     continuous_mode: bool = False
     continuous_limit: int = 0
@@ -135,6 +191,17 @@ class Config(SystemSettings):
     # Stable Diffusion
     sd_webui_auth: Optional[str] = None
 
+    def get_openai_credentials(self, model: str) -> dict[str, str]:
+        """Get the credentials and endpoint kwargs for an OpenAI API call."""
+        credentials = {"api_key": self.openai_api_key}
+        if self.use_azure:
+            credentials.update(self.get_azure_kwargs(model))
+        elif self.openai_api_base:
+            credentials["api_base"] = self.openai_api_base
+        if self.openai_organization:
+            credentials["organization"] = self.openai_organization
+        return credentials
+
     def get_azure_kwargs(self, model: str) -> dict[str, str]:
         """Get the kwargs for the Azure API."""
 
@@ -202,7 +269,24 @@ class ConfigBuilder(Configurable[Config]):
             "fast_llm": os.getenv("FAST_LLM", os.getenv("FAST_LLM_MODEL")),
             "smart_llm": os.getenv("SMART_LLM", os.getenv("SMART_LLM_MODEL")),
             "embedding_model": os.getenv("EMBEDDING_MODEL"),
+            "embedding_cache": os.getenv("EMBEDDING_CACHE", "False") == "True",
+            "embedding_cache_file": os.getenv("EMBEDDING_CACHE_FILE"),
             "browse_spacy_language_model": os.getenv("BROWSE_SPACY_LANGUAGE_MODEL"),
+            "llm_response_cache": os.getenv("LLM_RESPONSE_CACHE", "False") == "True",
+            "llm_response_cache_file": os.getenv("LLM_RESPONSE_CACHE_FILE"),
+            "summary_cache": os.getenv("SUMMARY_CACHE", "False") == "True",
+            "context_overflow_strategy": os.getenv("CONTEXT_OVERFLOW_STRATEGY"),
+            "summary_cache_file": os.getenv("SUMMARY_CACHE_FILE"),
+            "openai_requests_per_minute": _parse_rate_limits(
+                os.getenv("OPENAI_REQUESTS_PER_MINUTE")
+            ),
+            "openai_tokens_per_minute": _parse_rate_limits(
+                os.getenv("OPENAI_TOKENS_PER_MINUTE")
+            ),
+            "openai_rate_limit_state_file": os.getenv("OPENAI_RATE_LIMIT_STATE_FILE"),
+            "openai_models_cache_file": os.getenv("OPENAI_MODELS_CACHE_FILE"),
+            "guidelines_prefilter": os.getenv("GUIDELINES_PREFILTER", "False")
+            == "True",
             "openai_api_key": os.getenv("OPENAI_API_KEY"),
             "use_azure": os.getenv("USE_AZURE") == "True",
             "azure_config_file": os.getenv("AZURE_CONFIG_FILE", AZURE_CONFIG_FILE),
@@ -211,6 +295,7 @@ class ConfigBuilder(Configurable[Config]):
             "restrict_to_workspace": os.getenv("RESTRICT_TO_WORKSPACE", "True")
             == "True",
             "openai_functions": os.getenv("OPENAI_FUNCTIONS", "False") == "True",
+            "openai_streaming": os.getenv("OPENAI_STREAMING", "False") == "True",
             "elevenlabs_api_key": os.getenv("ELEVENLABS_API_KEY"),
             "streamelements_voice": os.getenv("STREAMELEMENTS_VOICE"),
             "text_to_speech_provider": os.getenv("TEXT_TO_SPEECH_PROVIDER"),
@@ -284,6 +369,70 @@ class ConfigBuilder(Configurable[Config]):
             config_dict["redis_port"] = int(os.getenv("REDIS_PORT"))
         with contextlib.suppress(TypeError):
             config_dict["temperature"] = float(os.getenv("TEMPERATURE"))
+        with contextlib.suppress(TypeError):
+            config_dict["llm_response_cache_max_size_mb"] = int(
+                os.getenv("LLM_RESPONSE_CACHE_MAX_SIZE_MB")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["llm_response_cache_max_temperature"] = float(
+                os.getenv("LLM_RESPONSE_CACHE_MAX_TEMPERATURE")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["summary_cache_min_similarity"] = float(
+                os.getenv("SUMMARY_CACHE_MIN_SIMILARITY")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["summary_cache_max_entries"] = int(
+                os.getenv("SUMMARY_CACHE_MAX_ENTRIES")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["openai_models_cache_ttl"] = int(
+                os.getenv("OPENAI_MODELS_CACHE_TTL")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["guidelines_safe_similarity"] = float(
+                os.getenv("GUIDELINES_SAFE_SIMILARITY")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["guidelines_top_k"] = int(os.getenv("GUIDELINES_TOP_K"))
+        with contextlib.suppress(TypeError):
+            config_dict["running_summary_max_lag"] = int(
+                os.getenv("RUNNING_SUMMARY_MAX_LAG")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["embedding_batch_wait_ms"] = float(
+                os.getenv("EMBEDDING_BATCH_WAIT_MS")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["embedding_batch_max_size"] = int(
+                os.getenv("EMBEDDING_BATCH_MAX_SIZE")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["embedding_cache_max_size_mb"] = int(
+                os.getenv("EMBEDDING_CACHE_MAX_SIZE_MB")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["openai_http_pool_size"] = int(
+                os.getenv("OPENAI_HTTP_POOL_SIZE")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["openai_http_keep_alive"] = float(
+                os.getenv("OPENAI_HTTP_KEEP_ALIVE")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["openai_connect_timeout"] = float(
+                os.getenv("OPENAI_CONNECT_TIMEOUT")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["openai_read_timeout"] = float(os.getenv("OPENAI_READ_TIMEOUT"))
+        with contextlib.suppress(TypeError):
+            config_dict["openai_hedge_percentile"] = float(
+                os.getenv("OPENAI_HEDGE_PERCENTILE")
+            )
+        with contextlib.suppress(TypeError):
+            config_dict["openai_hedge_min_delay"] = float(
+                os.getenv("OPENAI_HEDGE_MIN_DELAY")
+            )
 
         if config_dict["use_azure"]:
             azure_config = cls.load_azure_config(config_dict["azure_config_file"])
@@ -364,3 +513,16 @@ def _safe_split(s: Union[str, None], sep: str = ",") -> list[str]:
     if s is None:
         return []
     return s.split(sep)
+
+
+def _parse_rate_limits(s: Union[str, None]) -> Dict[str, int]:
+    """Parse rate limits of the form "3500" or "gpt-4=200,gpt-3.5-turbo=3500".
+
+    A limit without a model name applies to all models without a limit of their own.
+    """
+    limits = {}
+    for limit in _safe_split(s):
+        model, _, value = limit.strip().rpartition("=")
+        if value:
+            limits[model.strip() or "*"] = int(value)
+    return limits
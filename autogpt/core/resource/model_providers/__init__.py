@@ -1,9 +1,11 @@
+from autogpt.core.resource.model_providers.embedding_cache import EmbeddingCache
 from autogpt.core.resource.model_providers.openai import (
     OPEN_AI_MODELS,
     OpenAIModelName,
     OpenAIProvider,
     OpenAISettings,
 )
+from autogpt.core.resource.model_providers.rate_limiter import RateLimiter
 from autogpt.core.resource.model_providers.schema import (
     Embedding,
     EmbeddingModelProvider,
@@ -30,6 +32,7 @@ __all__ = [
     "ModelProvider",
     "ModelProviderName",
     "ModelProviderSettings",
+    "EmbeddingCache",
     "EmbeddingModelProvider",
     "EmbeddingModelProviderModelResponse",
     "LanguageModelProvider",
@@ -41,4 +44,5 @@ __all__ = [
     "OPEN_AI_MODELS",
     "OpenAIProvider",
     "OpenAISettings",
+    "RateLimiter",
 ]
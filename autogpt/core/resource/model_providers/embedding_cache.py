@@ -0,0 +1,271 @@
+"""Persistent cache of embeddings, keyed by model and a hash of the embedded text"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of parameters per statement to 999 in older versions
+_MAX_QUERY_PARAMETERS = 900
+
+
+class EmbeddingCache:
+    """Disk-backed cache of embedding vectors, evicted LRU by total size.
+
+    The vectors are stored as float32 in a flat file next to the SQLite index, which
+    maps each entry to its offset in that file. Lookups read the vectors through a
+    memory map, so a hit costs no more than a copy of the vector. The slots of
+    evicted entries are reused for new vectors of the same size.
+
+    The cache can be shared by several processes: all reads and writes happen in
+    an exclusive SQLite transaction, so a slot can't be reused while it is read.
+
+    Args:
+        file_path: Path of the SQLite file that holds the index. The vectors are
+            stored in a file with the same name and the suffix ".f32".
+        max_size: Maximum total size of the cached vectors, in bytes.
+    """
+
+    def __init__(self, file_path: str | Path, max_size: int):
+        self.file_path = Path(file_path)
+        self.vectors_path = self.file_path.with_suffix(".f32")
+        self.max_size = max_size
+
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.file_path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._vectors_fd = os.open(
+            self.vectors_path,
+            os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0),
+            0o644,
+        )
+        self._vectors: Optional[np.memmap] = None
+
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " offset INTEGER NOT NULL,"
+                " dimensions INTEGER NOT NULL,"
+                " last_used REAL NOT NULL"
+                ")"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used"
+                " ON embeddings (last_used)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS free_slots ("
+                " offset INTEGER PRIMARY KEY,"
+                " dimensions INTEGER NOT NULL"
+                ")"
+            )
+        logger.debug(f"Initialized {__class__.__name__} at {self.file_path}")
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Get the content address of the embedding of `text` by `model`"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Look up a cached embedding, marking it as recently used if present."""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> list[Optional[np.ndarray]]:
+        """Look up the cached embeddings of several texts at once.
+
+        Returns:
+            list: The embedding of each text, or None for texts that are not cached.
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found: dict[str, np.ndarray] = {}
+
+        with self._transaction() as connection:
+            for i in range(0, len(unique_keys), _MAX_QUERY_PARAMETERS):
+                chunk = unique_keys[i : i + _MAX_QUERY_PARAMETERS]
+                for key, offset, dimensions in connection.execute(
+                    "SELECT key, offset, dimensions FROM embeddings"
+                    f" WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    found[key] = self._read_vector(offset, dimensions)
+            if found:
+                now = time.time()
+                connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+
+        logger.debug(f"Embedding cache: {len(found)}/{len(unique_keys)} hits")
+        return [found.get(key) for key in keys]
+
+    def put(self, model: str, text: str, embedding: Sequence[float]) -> None:
+        """Store an embedding, evicting the least recently used entries if needed."""
+        self.put_many(model, [text], [embedding])
+
+    def put_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float] | np.ndarray],
+    ) -> None:
+        """Store the embeddings of several texts at once."""
+        vectors = {
+            self.make_key(model, text): np.asarray(embedding, dtype=np.float32)
+            for text, embedding in zip(texts, embeddings)
+        }
+        vectors = {k: v for k, v in vectors.items() if v.nbytes <= self.max_size}
+        if not vectors:
+            return
+
+        with self._transaction() as connection:
+            now = time.time()
+            total_size = self._total_size(connection)
+            for key, vector in vectors.items():
+                row = connection.execute(
+                    "SELECT offset, dimensions FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] == len(vector):
+                    offset = row[0]
+                else:
+                    if row:
+                        connection.execute(
+                            "DELETE FROM embeddings WHERE key = ?", (key,)
+                        )
+                        self._free_slot(connection, *row)
+                        total_size -= row[1] * 4
+                    # Evict before allocating, so that the freed slots can be reused
+                    total_size += vector.nbytes
+                    if total_size > self.max_size:
+                        total_size -= self._evict(
+                            connection, total_size - self.max_size
+                        )
+                    offset = self._allocate_slot(connection, len(vector))
+                self._write_vector(offset, vector)
+                connection.execute(
+                    "INSERT OR REPLACE INTO embeddings"
+                    " (key, offset, dimensions, last_used) VALUES (?, ?, ?, ?)",
+                    (key, offset, len(vector), now),
+                )
+
+    def clear(self) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM embeddings")
+            connection.execute("DELETE FROM free_slots")
+            self._vectors = None
+            os.ftruncate(self._vectors_fd, 0)
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached vectors, in bytes"""
+        with self._lock:
+            return self._total_size(self._connection)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def _read_vector(self, offset: int, dimensions: int) -> np.ndarray:
+        if self._vectors is None or offset + dimensions > len(self._vectors):
+            # The file has grown since it was mapped, possibly through another process
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r")
+        return np.array(self._vectors[offset : offset + dimensions])
+
+    def _write_vector(self, offset: int, vector: np.ndarray) -> None:
+        if hasattr(os, "pwrite"):
+            os.pwrite(self._vectors_fd, vector.tobytes(), offset * 4)
+        else:
+            # There is no pwrite on Windows. The file position is only moved by the
+            # thread holding the lock, so seeking before the write is safe.
+            os.lseek(self._vectors_fd, offset * 4, os.SEEK_SET)
+            os.write(self._vectors_fd, vector.tobytes())
+
+    def _allocate_slot(self, connection: sqlite3.Connection, dimensions: int) -> int:
+        """Get the offset of a free slot for a vector, reusing evicted slots first"""
+        row = connection.execute(
+            "SELECT offset FROM free_slots WHERE dimensions = ? LIMIT 1", (dimensions,)
+        ).fetchone()
+        if row:
+            connection.execute("DELETE FROM free_slots WHERE offset = ?", row)
+            return row[0]
+        end = os.fstat(self._vectors_fd).st_size // 4
+        os.ftruncate(self._vectors_fd, (end + dimensions) * 4)
+        return end
+
+    @staticmethod
+    def _free_slot(connection: sqlite3.Connection, offset: int, dimensions: int):
+        connection.execute(
+            "INSERT OR REPLACE INTO free_slots (offset, dimensions) VALUES (?, ?)",
+            (offset, dimensions),
+        )
+
+    @staticmethod
+    def _total_size(connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            "SELECT COALESCE(SUM(dimensions), 0) * 4 FROM embeddings"
+        ).fetchone()[0]
+
+    def _evict(self, connection: sqlite3.Connection, excess: int) -> int:
+        """Evict the least recently used entries to free `excess` bytes.
+
+        Returns:
+            int: The number of bytes freed.
+        """
+        freed = 0
+        evicted: list[tuple[Any, ...]] = []
+        for key, offset, dimensions in connection.execute(
+            "SELECT key, offset, dimensions FROM embeddings ORDER BY last_used ASC"
+        ):
+            evicted.append((key, offset, dimensions))
+            freed += dimensions * 4
+            if freed >= excess:
+                break
+        connection.executemany(
+            "DELETE FROM embeddings WHERE key = ?", [(key,) for key, *_ in evicted]
+        )
+        for _, offset, dimensions in evicted:
+            self._free_slot(connection, offset, dimensions)
+        logger.debug(f"Evicted {len(evicted)} embeddings ({freed} bytes) from cache")
+        return freed
+
+
+_caches: dict[Path, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(file_path: str | Path, max_size: int) -> EmbeddingCache:
+    """Get the shared EmbeddingCache for the given file, creating it if necessary."""
+    file_path = Path(file_path).resolve()
+    with _caches_lock:
+        if file_path not in _caches:
+            _caches[file_path] = EmbeddingCache(file_path, max_size)
+        cache = _caches[file_path]
+    cache.max_size = max_size
+    return cache
@@ -1,10 +1,12 @@
+import asyncio
+import contextlib
 import enum
 import functools
 import logging
 import math
-import time
-from typing import Callable, ParamSpec, TypeVar
+from typing import AsyncIterator, Callable, Optional, ParamSpec, TypeVar
 
+import aiohttp
 import openai
 from openai.error import APIError, RateLimitError
 
@@ -13,6 +15,15 @@ from autogpt.core.configuration import (
     SystemConfiguration,
     UserConfigurable,
 )
+from autogpt.core.resource.model_providers.embedding_cache import (
+    EmbeddingCache,
+    get_embedding_cache,
+)
+from autogpt.core.resource.model_providers.rate_limiter import (
+    RateLimiter,
+    estimate_request_tokens,
+    get_retry_after,
+)
 from autogpt.core.resource.model_providers.schema import (
     Embedding,
     EmbeddingModelProvider,
@@ -100,6 +111,15 @@ OPEN_AI_MODELS = {
 
 class OpenAIConfiguration(SystemConfiguration):
     retries_per_request: int = UserConfigurable()
+    requests_per_minute: dict[str, int] = UserConfigurable(default_factory=dict)
+    tokens_per_minute: dict[str, int] = UserConfigurable(default_factory=dict)
+    rate_limit_state_file: Optional[str] = UserConfigurable(default=None)
+    connection_pool_size: int = UserConfigurable(default=10)
+    keep_alive_seconds: float = UserConfigurable(default=60)
+    connect_timeout: float = UserConfigurable(default=10)
+    read_timeout: float = UserConfigurable(default=600)
+    embedding_cache_file: Optional[str] = UserConfigurable(default=None)
+    embedding_cache_max_size_mb: int = UserConfigurable(default=500)
 
 
 class OpenAIModelProviderBudget(ModelProviderBudget):
@@ -150,13 +170,33 @@ class OpenAIProvider(
 
         self._logger = logger
 
+        rate_limiter = None
+        if (
+            self._configuration.requests_per_minute
+            or self._configuration.tokens_per_minute
+        ):
+            rate_limiter = RateLimiter(
+                requests_per_minute=self._configuration.requests_per_minute,
+                tokens_per_minute=self._configuration.tokens_per_minute,
+                state_file=self._configuration.rate_limit_state_file,
+            )
+
         retry_handler = _OpenAIRetryHandler(
             logger=self._logger,
             num_retries=self._configuration.retries_per_request,
+            rate_limiter=rate_limiter,
         )
 
         self._create_completion = retry_handler(_create_completion)
         self._create_embedding = retry_handler(_create_embedding)
+        self._embedding_cache: Optional[EmbeddingCache] = None
+        if self._configuration.embedding_cache_file:
+            self._embedding_cache = get_embedding_cache(
+                self._configuration.embedding_cache_file,
+                self._configuration.embedding_cache_max_size_mb * 2**20,
+            )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
     def get_token_limit(self, model_name: str) -> int:
         """Get the token limit for a given model."""
@@ -176,10 +216,11 @@ class OpenAIProvider(
     ) -> LanguageModelProviderModelResponse:
         """Create a completion using the OpenAI API."""
         completion_kwargs = self._get_completion_kwargs(model_name, functions, **kwargs)
-        response = await self._create_completion(
-            messages=model_prompt,
-            **completion_kwargs,
-        )
+        async with self._shared_session():
+            response = await self._create_completion(
+                messages=model_prompt,
+                **completion_kwargs,
+            )
         response_args = {
             "model_info": OPEN_AI_LANGUAGE_MODELS[model_name],
             "prompt_tokens_used": response.usage.prompt_tokens,
@@ -203,8 +244,23 @@ class OpenAIProvider(
         **kwargs,
     ) -> EmbeddingModelProviderModelResponse:
         """Create an embedding using the OpenAI API."""
+        if self._embedding_cache is not None and (
+            cached := self._embedding_cache.get(model_name, text)
+        ) is not None:
+            return EmbeddingModelProviderModelResponse(
+                model_info=OPEN_AI_EMBEDDING_MODELS[model_name],
+                prompt_tokens_used=0,
+                completion_tokens_used=0,
+                embedding=embedding_parser(cached.tolist()),
+            )
+
         embedding_kwargs = self._get_embedding_kwargs(model_name, **kwargs)
-        response = await self._create_embedding(text=text, **embedding_kwargs)
+        async with self._shared_session():
+            response = await self._create_embedding(text=text, **embedding_kwargs)
+
+        embedding = response.embeddings[0]
+        if self._embedding_cache is not None:
+            self._embedding_cache.put(model_name, text, embedding)
 
         response_args = {
             "model_info": OPEN_AI_EMBEDDING_MODELS[model_name],
@@ -213,7 +269,7 @@ class OpenAIProvider(
         }
         response = EmbeddingModelProviderModelResponse(
             **response_args,
-            embedding=embedding_parser(response.embeddings[0]),
+            embedding=embedding_parser(embedding),
         )
         self._budget.update_usage_and_cost(response)
         return response
@@ -236,6 +292,7 @@ class OpenAIProvider(
         """
         completion_kwargs = {
             "model": model_name,
+            "request_timeout": self._get_request_timeout(),
             **kwargs,
             **self._credentials.unmasked(),
         }
@@ -261,12 +318,43 @@ class OpenAIProvider(
         """
         embedding_kwargs = {
             "model": model_name,
+            "request_timeout": self._get_request_timeout(),
             **kwargs,
             **self._credentials.unmasked(),
         }
 
         return embedding_kwargs
 
+    def _get_request_timeout(self) -> tuple[float, float]:
+        return (self._configuration.connect_timeout, self._configuration.read_timeout)
+
+    @contextlib.asynccontextmanager
+    async def _shared_session(self) -> AsyncIterator[aiohttp.ClientSession]:
+        """Make the OpenAI client use the provider's pooled keep-alive session.
+
+        By default, the OpenAI client opens a new session (and connection) per call.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._configuration.connection_pool_size,
+                    keepalive_timeout=self._configuration.keep_alive_seconds,
+                ),
+            )
+        token = openai.aiosession.set(self._session)
+        try:
+            yield self._session
+        finally:
+            openai.aiosession.reset(token)
+
+    async def close(self) -> None:
+        """Close the provider's HTTP connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
     def __repr__(self):
         return "OpenAIProvider()"
 
@@ -319,6 +407,8 @@ class _OpenAIRetryHandler:
         num_retries int: Number of retries. Defaults to 10.
         backoff_base float: Base for exponential backoff. Defaults to 2.
         warn_user bool: Whether to warn the user. Defaults to True.
+        rate_limiter RateLimiter: Limiter to hold back calls until they fit in the
+            rate limits. Rate limit errors are backed off exponentially without one.
     """
 
     _retry_limit_msg = "Error: Reached rate limit, passing..."
@@ -334,11 +424,13 @@ class _OpenAIRetryHandler:
         num_retries: int = 10,
         backoff_base: float = 2.0,
         warn_user: bool = True,
+        rate_limiter: Optional[RateLimiter] = None,
     ):
         self._logger = logger
         self._num_retries = num_retries
         self._backoff_base = backoff_base
         self._warn_user = warn_user
+        self._rate_limiter = rate_limiter
 
     def _log_rate_limit_error(self) -> None:
         self._logger.debug(self._retry_limit_msg)
@@ -346,28 +438,40 @@ class _OpenAIRetryHandler:
             self._logger.warning(self._api_key_error_msg)
             self._warn_user = False
 
-    def _backoff(self, attempt: int) -> None:
+    async def _backoff(self, attempt: int) -> None:
         backoff = self._backoff_base ** (attempt + 2)
         self._logger.debug(self._backoff_msg.format(backoff=backoff))
-        time.sleep(backoff)
+        await asyncio.sleep(backoff)
 
     def __call__(self, func: Callable[_P, _T]) -> Callable[_P, _T]:
         @functools.wraps(func)
         async def _wrapped(*args: _P.args, **kwargs: _P.kwargs) -> _T:
             num_attempts = self._num_retries + 1  # +1 for the first attempt
+            model = kwargs.get("model")
+            tokens = (
+                estimate_request_tokens(*args, **kwargs) if self._rate_limiter else 0
+            )
             for attempt in range(1, num_attempts + 1):
+                if self._rate_limiter and model:
+                    await self._rate_limiter.aacquire(model, tokens)
                 try:
                     return await func(*args, **kwargs)
 
-                except RateLimitError:
+                except RateLimitError as e:
                     if attempt == num_attempts:
                         raise
                     self._log_rate_limit_error()
+                    if (
+                        self._rate_limiter
+                        and model
+                        and self._rate_limiter.penalize(model, get_retry_after(e))
+                    ):
+                        continue
 
                 except APIError as e:
                     if (e.http_status != 502) or (attempt == num_attempts):
                         raise
 
-                self._backoff(attempt)
+                await self._backoff(attempt)
 
         return _wrapped
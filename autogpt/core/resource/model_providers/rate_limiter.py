@@ -0,0 +1,278 @@
+"""Token-bucket rate limiting of API requests, shareable between processes"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT_KEY = "*"
+
+# How often async waiters check whether it's their turn
+_POLL_INTERVAL = 0.05
+
+
+class RateLimiter:
+    """Proactive requests/min and tokens/min limiter with a bucket per model.
+
+    Instead of sending requests until the API answers with a 429 and then backing off
+    exponentially, callers reserve capacity before each request and are blocked only
+    as long as it takes for their reservation to be covered.
+
+    Callers that `acquire` capacity wait in a queue per model, ordered by priority.
+    When the limits are reached, a request is only let through once no request of a
+    higher priority is waiting for the same model, so background work can't hold up
+    latency-critical requests. Within a priority, requests go in the order they came.
+    Lower priority requests also leave some capacity unused, which keeps requests of
+    higher priority from other processes sharing the buckets from having to wait.
+
+    If `state_file` is given, the buckets are stored in that file and shared by all
+    processes using it, e.g. several agents running against the same organization.
+
+    Args:
+        requests_per_minute: Request limit per model. Keys are model names or model
+            name prefixes (e.g. "gpt-4"); the limit under "*" applies to other models.
+        tokens_per_minute: Token limit per model, with keys as above.
+        state_file: Path of a file through which to share the buckets.
+        priority_headroom: Fraction of the limits that each priority level below the
+            highest (0) leaves unused.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[dict[str, int]] = None,
+        tokens_per_minute: Optional[dict[str, int]] = None,
+        state_file: Optional[str | Path] = None,
+        priority_headroom: float = 0.1,
+    ):
+        self.priority_headroom = priority_headroom
+        self.requests_per_minute = requests_per_minute or {}
+        self.tokens_per_minute = tokens_per_minute or {}
+        if state_file and fcntl is None:
+            logger.warning(
+                "Sharing rate limits through a file is not supported on this platform;"
+                " rate limits will only apply within this process."
+            )
+            state_file = None
+        self.state_file = Path(state_file) if state_file else None
+        self._state: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._waiting: dict[str, list[tuple[int, int]]] = {}
+        self._waiting_changed = threading.Condition()
+        self._sequence = itertools.count()
+
+    def get_limits(self, model: str) -> tuple[Optional[int], Optional[int]]:
+        """Get the (requests/min, tokens/min) limits that apply to a model"""
+        return (
+            _lookup_limit(self.requests_per_minute, model),
+            _lookup_limit(self.tokens_per_minute, model),
+        )
+
+    def try_reserve(self, model: str, tokens: int = 0, priority: int = 0) -> float:
+        """Reserve capacity for one request of `tokens` tokens, if available now.
+
+        The buckets are never put into debt. A request of more tokens than the
+        tokens/min limit only needs a full bucket. Requests of a lower priority need
+        some headroom to be left in the buckets (see `acquire`).
+
+        Returns:
+            float: 0 if the capacity was reserved, or else the number of seconds until
+                it will be available.
+        """
+        rpm, tpm = self.get_limits(model)
+        if not (rpm or tpm):
+            return 0.0
+
+        headroom = min(priority * self.priority_headroom, 0.9)
+        with self._transaction() as state:
+            now = time.time()
+            bucket = self._refill(state, model, rpm, tpm, now)
+
+            wait = max(bucket.get("blocked_until", 0.0) - now, 0.0)
+            if rpm:
+                needed = min(1 + headroom * rpm, rpm)
+                if bucket["requests"] < needed:
+                    wait = max(wait, (needed - bucket["requests"]) * 60 / rpm)
+            if tpm:
+                needed = min(min(tokens, tpm) + headroom * tpm, tpm)
+                if bucket["tokens"] < needed:
+                    wait = max(wait, (needed - bucket["tokens"]) * 60 / tpm)
+            if not wait:
+                bucket["requests"] -= 1
+                bucket["tokens"] -= tokens
+            return wait
+
+    def acquire(self, model: str, tokens: int = 0, priority: int = 0) -> None:
+        """Block until a request of `tokens` tokens may be sent.
+
+        Args:
+            model: The model to which the request will be sent.
+            tokens: The estimated number of tokens of the request.
+            priority: The priority of the request; lower values go first.
+        """
+        if not any(self.get_limits(model)):
+            return
+
+        entry = self._enqueue(model, priority)
+        try:
+            with self._waiting_changed:
+                while True:
+                    wait = None
+                    if self._waiting[model][0] == entry:
+                        if not (wait := self.try_reserve(model, tokens, priority)):
+                            return
+                        logger.debug(
+                            f"Rate limiting {model}: waiting {wait:.2f} seconds"
+                        )
+                    # Woken up early if a request of a higher priority comes in
+                    self._waiting_changed.wait(wait)
+        finally:
+            self._dequeue(model, entry)
+
+    async def aacquire(self, model: str, tokens: int = 0, priority: int = 0) -> None:
+        """Wait until a request of `tokens` tokens may be sent. See `acquire`."""
+        if not any(self.get_limits(model)):
+            return
+
+        entry = self._enqueue(model, priority)
+        try:
+            while True:
+                wait = _POLL_INTERVAL
+                with self._waiting_changed:
+                    if self._waiting[model][0] == entry:
+                        if not (wait := self.try_reserve(model, tokens, priority)):
+                            return
+                        logger.debug(
+                            f"Rate limiting {model}: waiting {wait:.2f} seconds"
+                        )
+                await asyncio.sleep(min(wait, _POLL_INTERVAL))
+        finally:
+            self._dequeue(model, entry)
+
+    def _enqueue(self, model: str, priority: int) -> tuple[int, int]:
+        entry = (priority, next(self._sequence))
+        with self._waiting_changed:
+            heapq.heappush(self._waiting.setdefault(model, []), entry)
+            self._waiting_changed.notify_all()
+        return entry
+
+    def _dequeue(self, model: str, entry: tuple[int, int]) -> None:
+        with self._waiting_changed:
+            waiting = self._waiting[model]
+            waiting.remove(entry)
+            heapq.heapify(waiting)
+            if not waiting:
+                del self._waiting[model]
+            self._waiting_changed.notify_all()
+
+    def penalize(self, model: str, retry_after: Optional[float] = None) -> bool:
+        """Register a rate limit error returned by the API.
+
+        Empties the buckets of the model, so that subsequent requests wait until the
+        limits have recovered, and blocks the model until `retry_after` if given.
+
+        Returns:
+            bool: Whether the limiter will hold back the next request to this model.
+                If not, the caller has to back off by itself.
+        """
+        rpm, tpm = self.get_limits(model)
+        if not (rpm or tpm or retry_after):
+            return False
+
+        with self._transaction() as state:
+            now = time.time()
+            bucket = self._refill(state, model, rpm, tpm, now)
+            bucket["requests"] = min(bucket["requests"], 0.0)
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+            if retry_after:
+                bucket["blocked_until"] = max(
+                    bucket.get("blocked_until", 0.0), now + retry_after
+                )
+        return True
+
+    @staticmethod
+    def _refill(
+        state: dict[str, dict[str, float]],
+        model: str,
+        rpm: Optional[int],
+        tpm: Optional[int],
+        now: float,
+    ) -> dict[str, float]:
+        bucket = state.setdefault(
+            model, {"requests": rpm or 0, "tokens": tpm or 0, "updated": now}
+        )
+        elapsed = max(now - bucket["updated"], 0.0)
+        if rpm:
+            bucket["requests"] = min(rpm, bucket["requests"] + elapsed * rpm / 60)
+        if tpm:
+            bucket["tokens"] = min(tpm, bucket["tokens"] + elapsed * tpm / 60)
+        bucket["updated"] = now
+        return bucket
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[dict[str, Any]]:
+        with self._lock:
+            if not self.state_file:
+                yield self._state
+                return
+
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "r+", encoding="utf-8") as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    try:
+                        state = json.loads(file.read() or "{}")
+                    except json.JSONDecodeError:
+                        state = {}
+                    yield state
+                    file.seek(0)
+                    file.truncate()
+                    json.dump(state, file)
+                    file.flush()
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _lookup_limit(limits: dict[str, int], model: str) -> Optional[int]:
+    """Get the limit for the longest key that `model` starts with"""
+    matches = [
+        key for key in limits if key != DEFAULT_LIMIT_KEY and model.startswith(key)
+    ]
+    if matches:
+        return limits[max(matches, key=len)]
+    return limits.get(DEFAULT_LIMIT_KEY)
+
+
+def estimate_request_tokens(*args, max_tokens: Optional[int] = None, **kwargs) -> int:
+    """Rough token count of an API request, for reserving rate limit capacity.
+
+    The API counts a request's `max_tokens` against the tokens/min limit up front, so
+    it is added to a ~4 characters per token estimate of the prompt.
+    """
+    prompt = [a for a in args if isinstance(a, (str, list))] + [
+        kwargs[k] for k in ("messages", "prompt", "input", "functions") if k in kwargs
+    ]
+    return len(json.dumps(prompt, default=str)) // 4 + (max_tokens or 0)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Get the Retry-After duration of an API error response, if any"""
+    headers = getattr(error, "headers", None) or {}
+    with contextlib.suppress(TypeError, ValueError):
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    return None
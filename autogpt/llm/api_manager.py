@@ -1,6 +1,18 @@
 from __future__ import annotations
 
-from typing import List, Optional
+import bisect
+import contextvars
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional
 
 import openai
 from openai import Model
@@ -9,21 +21,85 @@ from autogpt.llm.base import CompletionModelInfo
 from autogpt.logs import logger
 from autogpt.singleton import Singleton
 
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, math.inf)
+
+_current_agent: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_agent", default=None
+)
+
+
+@dataclass
+class UsageStats:
+    """Token usage and cost of a set of API calls"""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+
+@dataclass
+class LatencyHistogram:
+    """Counts of API call latencies, by upper bound (in seconds) of LATENCY_BUCKETS"""
+
+    counts: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    count: int = 0
+    total_seconds: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Get the upper bound of the bucket containing the given percentile"""
+        if not self.count:
+            return None
+        rank = percentile / 100 * self.count
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
 
 class ApiManager(metaclass=Singleton):
+    """Keeps track of the usage and cost of API calls.
+
+    All updates are made under a lock, so API calls can be metered from any thread.
+    Usage is also tracked per model and per agent; API calls are attributed to the
+    agent set with `set_current_agent` or `attribute_to_agent` in the calling context.
+    """
+
     def __init__(self):
+        self._lock = threading.RLock()
         self.total_prompt_tokens = 0
         self.total_completion_tokens = 0
         self.total_cost = 0
         self.total_budget = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced_calls: dict[str, int] = {}
+        self.usage_by_model: dict[str, UsageStats] = {}
+        self.usage_by_agent: dict[str, UsageStats] = {}
+        self.latencies: dict[str, LatencyHistogram] = {}
         self.models: Optional[list[Model]] = None
+        self._refreshing_models: set[str] = set()
 
     def reset(self):
-        self.total_prompt_tokens = 0
-        self.total_completion_tokens = 0
-        self.total_cost = 0
-        self.total_budget = 0.0
-        self.models = None
+        with self._lock:
+            self.total_prompt_tokens = 0
+            self.total_completion_tokens = 0
+            self.total_cost = 0
+            self.total_budget = 0.0
+            self.cache_hits = 0
+            self.cache_misses = 0
+            self.coalesced_calls = {}
+            self.usage_by_model = {}
+            self.usage_by_agent = {}
+            self.latencies = {}
+            self.models = None
 
     def update_cost(self, prompt_tokens, completion_tokens, model):
         """
@@ -40,15 +116,87 @@ class ApiManager(metaclass=Singleton):
         model = model[:-3] if model.endswith("-v2") else model
         model_info = OPEN_AI_MODELS[model]
 
-        self.total_prompt_tokens += prompt_tokens
-        self.total_completion_tokens += completion_tokens
-        self.total_cost += prompt_tokens * model_info.prompt_token_cost / 1000
+        cost = prompt_tokens * model_info.prompt_token_cost / 1000
         if issubclass(type(model_info), CompletionModelInfo):
-            self.total_cost += (
-                completion_tokens * model_info.completion_token_cost / 1000
-            )
+            cost += completion_tokens * model_info.completion_token_cost / 1000
+
+        agent = _current_agent.get()
+        with self._lock:
+            self.total_prompt_tokens += prompt_tokens
+            self.total_completion_tokens += completion_tokens
+            self.total_cost += cost
+
+            usages = [self.usage_by_model.setdefault(model, UsageStats())]
+            if agent is not None:
+                usages.append(self.usage_by_agent.setdefault(agent, UsageStats()))
+            for usage in usages:
+                usage.requests += 1
+                usage.prompt_tokens += prompt_tokens
+                usage.completion_tokens += completion_tokens
+                usage.cost += cost
 
-        logger.debug(f"Total running cost: ${self.total_cost:.3f}")
+            total_cost = self.total_cost
+
+        logger.debug(f"Total running cost: ${total_cost:.3f}")
+
+    def record_latency(self, model: str, seconds: float):
+        """
+        Record the latency of an API call.
+
+        Args:
+        model (str): The model used for the API call.
+        seconds (float): The duration of the API call.
+        """
+        with self._lock:
+            self.latencies.setdefault(model, LatencyHistogram()).observe(seconds)
+
+    def update_cache_stats(self, hit: bool):
+        """
+        Record a lookup in the LLM response cache.
+
+        Args:
+        hit (bool): Whether the lookup was served from the cache.
+        """
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def record_coalesced_call(self, kind: str):
+        """
+        Record an API call that was not made because an identical one was in flight.
+
+        Args:
+        kind (str): The kind of API call, e.g. "chat_completion" or "embedding".
+        """
+        with self._lock:
+            self.coalesced_calls[kind] = self.coalesced_calls.get(kind, 0) + 1
+
+    @staticmethod
+    def set_current_agent(agent_id: Optional[str]):
+        """
+        Attribute the API calls made from now on in the current context to an agent.
+
+        Args:
+        agent_id (str): The ID of the agent, or None to stop attributing API calls.
+        """
+        _current_agent.set(agent_id)
+
+    @staticmethod
+    @contextmanager
+    def attribute_to_agent(agent_id: str) -> Iterator[None]:
+        """
+        Attribute the API calls made within this context to an agent.
+
+        Args:
+        agent_id (str): The ID of the agent.
+        """
+        token = _current_agent.set(agent_id)
+        try:
+            yield
+        finally:
+            _current_agent.reset(token)
 
     def set_total_budget(self, total_budget):
         """
@@ -95,16 +243,180 @@ class ApiManager(metaclass=Singleton):
         """
         return self.total_budget
 
-    def get_models(self, **openai_credentials) -> List[Model]:
+    def get_cache_hits(self):
+        """
+        Get the number of chat completions served from the response cache.
+
+        Returns:
+        int: The number of cache hits.
+        """
+        return self.cache_hits
+
+    def get_cache_misses(self):
+        """
+        Get the number of cacheable chat completions not found in the response cache.
+
+        Returns:
+        int: The number of cache misses.
+        """
+        return self.cache_misses
+
+    def get_coalesced_calls(self) -> dict[str, int]:
+        """
+        Get the number of API calls saved by sharing identical calls in flight.
+
+        Returns:
+        dict[str, int]: The number of coalesced calls per kind of API call.
+        """
+        with self._lock:
+            return dict(self.coalesced_calls)
+
+    def get_usage_by_model(self) -> dict[str, UsageStats]:
+        """
+        Get the usage of API calls per model.
+
+        Returns:
+        dict[str, UsageStats]: Copies of the usage stats, by model.
+        """
+        with self._lock:
+            return {m: UsageStats(**vars(u)) for m, u in self.usage_by_model.items()}
+
+    def get_usage_by_agent(self) -> dict[str, UsageStats]:
+        """
+        Get the usage of API calls per agent.
+
+        Returns:
+        dict[str, UsageStats]: Copies of the usage stats, by agent ID.
+        """
+        with self._lock:
+            return {a: UsageStats(**vars(u)) for a, u in self.usage_by_agent.items()}
+
+    def get_latency_histogram(self, model: str) -> LatencyHistogram:
+        """
+        Get the histogram of the latencies of API calls to a model.
+
+        Returns:
+        LatencyHistogram: A copy of the latency histogram.
+        """
+        with self._lock:
+            histogram = self.latencies.get(model, LatencyHistogram())
+            return LatencyHistogram(
+                list(histogram.counts), histogram.count, histogram.total_seconds
+            )
+
+    def get_models(
+        self,
+        cache_file: Optional[str | Path] = None,
+        cache_ttl: float = 0,
+        **openai_credentials,
+    ) -> List[Model]:
         """
         Get list of available GPT models.
 
+        If a cache file is given, the list is read from there, so only the first
+        call for a set of credentials waits for the API. Once the cached list is
+        older than `cache_ttl` seconds, it is still returned, but refreshed in the
+        background for the next run.
+
         Returns:
         list: List of available GPT models.
 
         """
-        if self.models is None:
-            all_models = openai.Model.list(**openai_credentials)["data"]
-            self.models = [model for model in all_models if "gpt" in model["id"]]
+        if self.models is not None:
+            return self.models
+
+        if not cache_file or cache_ttl <= 0:
+            self.models = _fetch_models(openai_credentials)
+            return self.models
+
+        cache_file = Path(cache_file)
+        cache_key = _models_cache_key(openai_credentials)
+        cached = _load_cached_models(cache_file, cache_key)
+        if cached is None:
+            self.models = _fetch_models(openai_credentials)
+            _store_cached_models(cache_file, cache_key, self.models)
+            return self.models
 
+        models, fetched_at = cached
+        self.models = models
+        if time.time() - fetched_at > cache_ttl:
+            self._refresh_models_in_background(
+                cache_file, cache_key, openai_credentials
+            )
         return self.models
+
+    def _refresh_models_in_background(
+        self, cache_file: Path, cache_key: str, openai_credentials: dict
+    ) -> None:
+        with self._lock:
+            if cache_key in self._refreshing_models:
+                return
+            self._refreshing_models.add(cache_key)
+
+        def refresh():
+            try:
+                models = _fetch_models(openai_credentials)
+                _store_cached_models(cache_file, cache_key, models)
+                self.models = models
+                logger.debug(f"Refreshed the list of models in {cache_file}")
+            except Exception as e:
+                logger.debug(f"Could not refresh the list of models: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing_models.discard(cache_key)
+
+        threading.Thread(target=refresh, name="refresh-models", daemon=True).start()
+
+
+def _fetch_models(openai_credentials: dict) -> list[Model]:
+    all_models = openai.Model.list(**openai_credentials)["data"]
+    return [model for model in all_models if "gpt" in model["id"]]
+
+
+def _models_cache_key(openai_credentials: dict) -> str:
+    """Get the key of the models available with a set of credentials.
+
+    Azure deployment IDs are left out, as they differ per model but not per account.
+    The key is a hash, so the API key isn't written to the cache file.
+    """
+    credentials = {
+        k: v
+        for k, v in openai_credentials.items()
+        if k not in ("deployment_id", "engine")
+    }
+    return hashlib.sha256(json.dumps(credentials, sort_keys=True).encode()).hexdigest()
+
+
+def _load_cached_models(
+    cache_file: Path, cache_key: str
+) -> Optional[tuple[list[Model], float]]:
+    try:
+        entry = json.loads(cache_file.read_text())[cache_key]
+        models = [Model.construct_from(model) for model in entry["models"]]
+        return models, float(entry["fetched_at"])
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        if not isinstance(e, KeyError):
+            logger.debug(f"Ignoring invalid models cache {cache_file}: {e}")
+        return None
+
+
+def _store_cached_models(cache_file: Path, cache_key: str, models: list) -> None:
+    try:
+        cache = json.loads(cache_file.read_text())
+        if not isinstance(cache, dict):
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    cache[cache_key] = {"fetched_at": time.time(), "models": models}
+
+    # Write to a temporary file first, so concurrent readers never see a partial file
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=cache_file.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.replace(temp_path, cache_file)
+    except OSError as e:
+        logger.debug(f"Could not write models cache {cache_file}: {e}")
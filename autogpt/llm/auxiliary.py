@@ -0,0 +1,27 @@
+"""Marks LLM requests that are not an agent's main completion"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+from typing import Iterator
+
+_auxiliary_request: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "auxiliary_request", default=False
+)
+
+
+def is_auxiliary_request() -> bool:
+    """Whether the requests made in the current context are helper calls, like
+    guideline checks and summaries, rather than the agent's main completion"""
+    return _auxiliary_request.get()
+
+
+@contextlib.contextmanager
+def auxiliary_request() -> Iterator[None]:
+    """Mark the API requests made within this block as helper calls, which may run
+    alongside the agent's main completion"""
+    token = _auxiliary_request.set(True)
+    try:
+        yield
+    finally:
+        _auxiliary_request.reset(token)
@@ -3,8 +3,6 @@ from __future__ import annotations
 import time
 from typing import TYPE_CHECKING
 
-from autogpt.llm.providers.openai import get_openai_command_specs
-
 if TYPE_CHECKING:
     from autogpt.agent.agent import Agent
 
@@ -61,11 +59,15 @@ def chat_with_ai(
     # logger.debug(f"Memory Stats: {agent.memory.get_stats()}")
     relevant_memory = []
 
+    compiled_prompt = agent.prompt_compiler.compile(agent, system_prompt, model)
+    time_message = Message(
+        "system", f"The current time and date is {time.strftime('%c')}"
+    )
     message_sequence = ChatSequence.for_model(
         model,
         [
-            Message("system", system_prompt),
-            Message("system", f"The current time and date is {time.strftime('%c')}"),
+            compiled_prompt.system_message,
+            time_message,
             # Message(
             #     "system",
             #     f"This reminds you of these events from your past:\n{relevant_memory}\n\n",
@@ -77,7 +79,8 @@ def chat_with_ai(
     next_message_to_add_index = len(agent.history) - 1
     insertion_index = len(message_sequence)
     # Count the currently used tokens
-    current_tokens_used = message_sequence.token_length
+    current_tokens_used = compiled_prompt.system_message_tokens
+    current_tokens_used += count_message_tokens([time_message], model)
 
     # while current_tokens_used > 2500:
     #     # remove memories until we are under 2500 tokens
@@ -95,20 +98,22 @@ def chat_with_ai(
     user_input_msg = Message("user", triggering_prompt)
     current_tokens_used += count_message_tokens([user_input_msg], model)
 
-    current_tokens_used += 500  # Reserve space for new_summary_message
-    current_tokens_used += 500  # Reserve space for the openai functions TODO improve
-
-    # Add Messages until the token limit is reached or there are no more messages to add.
-    for cycle in reversed(list(agent.history.per_cycle(agent.config))):
-        messages_to_add = [msg for msg in cycle if msg is not None]
-        tokens_to_add = count_message_tokens(messages_to_add, model)
-        if current_tokens_used + tokens_to_add > send_token_limit:
-            break
+    # Reserve space for new_summary_message, assuming the summary keeps its size
+    summary_tokens_reserved = 0
+    if len(agent.history) > 0:
+        summary_tokens_reserved = count_message_tokens(
+            [agent.history.summary_message()], model
+        )
+    current_tokens_used += summary_tokens_reserved
+    current_tokens_used += compiled_prompt.functions_tokens
 
-        # Add the most recent message to the start of the chain,
-        #  after the system prompts.
-        message_sequence.insert(insertion_index, *messages_to_add)
-        current_tokens_used += tokens_to_add
+    # Add the most recent cycles until the token limit is reached or there are no
+    # more cycles to add, after the system prompts.
+    messages_to_add, tokens_to_add = agent.history.context_window(
+        agent.config, model, send_token_limit - current_tokens_used
+    )
+    message_sequence.insert(insertion_index, *messages_to_add)
+    current_tokens_used += tokens_to_add
 
     # Update & add summary of trimmed messages
     if len(agent.history) > 0:
@@ -117,7 +122,7 @@ def chat_with_ai(
         )
         tokens_to_add = count_message_tokens([new_summary_message], model)
         message_sequence.insert(insertion_index, new_summary_message)
-        current_tokens_used += tokens_to_add - 500
+        current_tokens_used += tokens_to_add - summary_tokens_reserved
 
         # FIXME: uncomment when memory is back in use
         # memory_store = get_memory(config)
@@ -197,8 +202,9 @@ def chat_with_ai(
     assistant_reply = create_chat_completion(
         prompt=message_sequence,
         config=agent.config,
-        functions=get_openai_command_specs(agent),
+        functions=compiled_prompt.functions,
         max_tokens=tokens_remaining,
+        stop_when_complete=True,
     )
 
     # Update full message history
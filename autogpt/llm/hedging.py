@@ -0,0 +1,180 @@
+"""Hedged requests: duplicate slow requests and use whichever returns first"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from autogpt.logs import logger
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of the observed latencies of successful requests, per key"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.setdefault(key, deque(maxlen=self.window))
+            latencies.append(seconds)
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        """Get a percentile of the latencies for `key`, or None if too few are known"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        index = max(math.ceil(percentile / 100 * len(latencies)) - 1, 0)
+        return latencies[index]
+
+
+class HedgingPolicy:
+    """Sends a duplicate request when a request is slower than usual.
+
+    A request which has not returned after the given percentile of the latencies
+    observed for its key gets a duplicate. The first successful result is used, and
+    the other request is left to finish in the background; its result is discarded.
+
+    Requests are run in daemon threads in a copy of the caller's context, so context
+    variables (e.g. for metering) also apply to a request that finishes after its
+    result has been discarded.
+
+    Args:
+        percentile: Latency percentile after which to send a duplicate request.
+        min_delay: Minimum number of seconds to wait before sending a duplicate.
+        tracker: Latencies on which to base the hedging delay.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_delay: float = 1.0,
+        tracker: Optional[LatencyTracker] = None,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.tracker = tracker or LatencyTracker()
+
+    def get_delay(self, key: str) -> Optional[float]:
+        """Get the number of seconds after which to hedge a request, if known"""
+        latency = self.tracker.percentile(key, self.percentile)
+        return None if latency is None else max(latency, self.min_delay)
+
+    def run(
+        self,
+        key: str,
+        request: Callable[[], T],
+        hedge_request: Optional[Callable[[], T]] = None,
+    ) -> T:
+        """Run `request`, hedging it with `hedge_request` (default: `request`).
+
+        Raises:
+            Exception: The error of the first request if all requests failed.
+        """
+        delay = self.get_delay(key)
+        if delay is None:
+            return self._timed(key, request)()
+
+        futures = [self._start(key, request)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            logger.debug(
+                f"Request to {key} took longer than {delay:.1f}s, sending a duplicate"
+            )
+            futures.append(self._start(key, hedge_request or request))
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in futures:
+                if future in done and future.exception() is None:
+                    if len(futures) > 1:
+                        which = "duplicate" if future is futures[1] else "original"
+                        logger.debug(f"Using the {which} request to {key}")
+                    return future.result()
+        raise futures[0].exception()
+
+    async def arun(
+        self,
+        key: str,
+        request: Callable[[], Awaitable[T]],
+        hedge_request: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """Async version of `run`. The request that loses the race is cancelled.
+
+        Raises:
+            Exception: The error of the first request if all requests failed.
+        """
+        delay = self.get_delay(key)
+        if delay is None:
+            return await self._atimed(key, request)
+
+        tasks = [asyncio.ensure_future(self._atimed(key, request))]
+        pending = set(tasks)
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                logger.debug(
+                    f"Request to {key} took longer than {delay:.1f}s,"
+                    " sending a duplicate"
+                )
+                tasks.append(
+                    asyncio.ensure_future(self._atimed(key, hedge_request or request))
+                )
+                pending.add(tasks[1])
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in tasks:
+                    if task in done and task.exception() is None:
+                        if len(tasks) > 1:
+                            which = "duplicate" if task is tasks[1] else "original"
+                            logger.debug(f"Using the {which} request to {key}")
+                        return task.result()
+            raise tasks[0].exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _atimed(self, key: str, request: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        result = await request()
+        self.tracker.record(key, time.monotonic() - start)
+        return result
+
+    def _timed(self, key: str, request: Callable[[], T]) -> Callable[[], T]:
+        def timed_request() -> T:
+            start = time.monotonic()
+            result = request()
+            self.tracker.record(key, time.monotonic() - start)
+            return result
+
+        return timed_request
+
+    def _start(self, key: str, request: Callable[[], T]) -> Future[T]:
+        future: Future[T] = Future()
+        future.set_running_or_notify_cancel()
+        context = contextvars.copy_context()
+        timed_request = self._timed(key, request)
+
+        def run():
+            try:
+                future.set_result(context.run(timed_request))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"hedged-request-{key}", daemon=True).start()
+        return future
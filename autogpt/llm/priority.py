@@ -0,0 +1,43 @@
+"""Priority classes of outbound LLM requests"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+from enum import IntEnum
+from typing import Iterator
+
+
+class RequestPriority(IntEnum):
+    """Which requests are served first when the API rate limits are reached.
+
+    Lower values go first. Requests that don't set a priority are INTERACTIVE.
+    """
+
+    INTERACTIVE = 0
+    """Requests that an agent's user or the agent's next step is waiting for"""
+    MONITORING = 1
+    """Checks of the agent's actions against its guidelines"""
+    SUMMARY = 2
+    """Updates of the running summary of an agent's history"""
+    BACKGROUND = 3
+    """Work nobody is waiting for, like embedding documents for ingestion"""
+
+
+_current_priority: contextvars.ContextVar[RequestPriority] = contextvars.ContextVar(
+    "request_priority", default=RequestPriority.INTERACTIVE
+)
+
+
+def get_request_priority() -> RequestPriority:
+    """Get the priority of the requests made in the current context"""
+    return _current_priority.get()
+
+
+@contextlib.contextmanager
+def request_priority(priority: RequestPriority) -> Iterator[None]:
+    """Give the API requests made within this block the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
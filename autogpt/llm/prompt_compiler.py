@@ -0,0 +1,85 @@
+"""Compiles the static parts of an agent's chat prompt, along with their token costs"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from autogpt.agent.agent import Agent
+
+from autogpt.llm.base import Message
+from autogpt.llm.providers.openai import OpenAIFunctionSpec, get_openai_command_specs
+from autogpt.llm.utils import count_function_tokens, count_message_tokens
+from autogpt.logs import logger
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """The parts of an agent's prompt that are the same in every cycle
+
+    Attributes:
+        system_message: The system prompt, as a message.
+        system_message_tokens: The number of tokens the system message adds to a
+            prompt, not counting the tokens that prime the reply.
+        functions: The OpenAI function specs of the agent's commands.
+        functions_tokens: The number of tokens the function specs add to a prompt
+            which starts with a system message.
+    """
+
+    system_message: Message
+    system_message_tokens: int
+    functions: list[OpenAIFunctionSpec]
+    functions_tokens: int
+
+
+class PromptCompiler:
+    """Compiles an agent's prompt once, and again only when its inputs change.
+
+    The compiled prompt depends on the system prompt, the model, whether OpenAI
+    functions are enabled and the commands in the agent's command registry. The
+    system prompt is built from the agent's AIConfig, so changes to the AIConfig
+    come in as a different system prompt.
+    """
+
+    def __init__(self):
+        self._key: Optional[tuple] = None
+        self._compiled: Optional[CompiledPrompt] = None
+
+    def compile(self, agent: Agent, system_prompt: str, model: str) -> CompiledPrompt:
+        key = (
+            system_prompt,
+            model,
+            agent.config.openai_functions,
+            agent.command_registry.version,
+        )
+        if self._compiled is None or key != self._key:
+            self._compiled = compile_prompt(agent, system_prompt, model)
+            self._key = key
+        return self._compiled
+
+
+def compile_prompt(agent: Agent, system_prompt: str, model: str) -> CompiledPrompt:
+    """Build the system message and function specs of an agent's prompt, and count
+    the tokens they add to the prompt."""
+    system_message = Message("system", system_prompt)
+    # count_message_tokens() includes the 3 tokens that prime the reply
+    system_message_tokens = count_message_tokens([system_message], model) - 3
+
+    functions = get_openai_command_specs(agent)
+    functions_tokens = 0
+    if functions:
+        # The function definitions are merged into the system message
+        functions_tokens = (
+            count_function_tokens([f.__dict__ for f in functions], model) - 4
+        )
+
+    logger.debug(
+        f"Compiled prompt: system prompt of {system_message_tokens} tokens,"
+        f" {len(functions)} functions of {functions_tokens} tokens"
+    )
+    return CompiledPrompt(
+        system_message=system_message,
+        system_message_tokens=system_message_tokens,
+        functions=functions,
+        functions_tokens=functions_tokens,
+    )
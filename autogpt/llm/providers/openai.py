@@ -1,20 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
 import functools
+import inspect
+import json
+import socket
 import time
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, List, Optional
-from unittest.mock import patch
 
 import openai
+import openai.api_requestor
 import openai.api_resources.abstract.engine_api_resource as engine_api_resource
+import requests
 from colorama import Fore, Style
 from openai.error import APIError, RateLimitError, ServiceUnavailableError, Timeout
 from openai.openai_object import OpenAIObject
 
 if TYPE_CHECKING:
     from autogpt.agent.agent import Agent
+    from autogpt.config import Config
 
+from autogpt.core.resource.model_providers.rate_limiter import (
+    RateLimiter,
+    estimate_request_tokens,
+    get_retry_after,
+)
 from autogpt.llm.base import (
     ChatModelInfo,
     EmbeddingModelInfo,
@@ -22,6 +34,8 @@ from autogpt.llm.base import (
     TextModelInfo,
     TText,
 )
+from autogpt.llm.hedging import HedgingPolicy
+from autogpt.llm.priority import get_request_priority
 from autogpt.logs import logger
 
 OPEN_AI_CHAT_MODELS = {
@@ -114,43 +128,185 @@ OPEN_AI_MODELS: dict[str, ChatModelInfo | EmbeddingModelInfo | TextModelInfo] =
 }
 
 
+def update_usage_with_response(response: OpenAIObject):
+    """Add the usage reported in an API response to the ApiManager's totals"""
+    from autogpt.llm.api_manager import ApiManager
+
+    try:
+        usage = response.usage
+        logger.debug(f"Reported usage from call to model {response.model}: {usage}")
+        ApiManager().update_cost(
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens if "completion_tokens" in usage else 0,
+            response.model,
+        )
+    except Exception as err:
+        logger.warn(f"Failed to update API costs: {err.__class__.__name__}: {err}")
+
+
+_metering_enabled = contextvars.ContextVar("metering_enabled", default=False)
+_convert_to_openai_object = openai.util.convert_to_openai_object
+
+
+def _metered_convert_to_openai_object(*args, **kwargs):
+    openai_obj = _convert_to_openai_object(*args, **kwargs)
+    if (
+        _metering_enabled.get()
+        and isinstance(openai_obj, OpenAIObject)
+        and "usage" in openai_obj
+    ):
+        update_usage_with_response(openai_obj)
+    return openai_obj
+
+
+# Responses are metered where the API client converts them, which is also where the
+# responses to requests running in other threads (e.g. hedged requests) end up.
+engine_api_resource.util.convert_to_openai_object = _metered_convert_to_openai_object
+
+
+def _get_request_model(kwargs: dict) -> Optional[str]:
+    """Get the model (or Azure deployment) that an API call is made to"""
+    return kwargs.get("model") or kwargs.get("deployment_id") or kwargs.get("engine")
+
+
 def meter_api(func):
     """Adds ApiManager metering to functions which make OpenAI API calls"""
+
     from autogpt.llm.api_manager import ApiManager
 
-    api_manager = ApiManager()
+    def record_latency(kwargs: dict, start: float) -> None:
+        if model := _get_request_model(kwargs):
+            ApiManager().record_latency(model, time.monotonic() - start)
 
-    openai_obj_processor = openai.util.convert_to_openai_object
+    if inspect.iscoroutinefunction(func):
 
-    def update_usage_with_response(response: OpenAIObject):
-        try:
-            usage = response.usage
-            logger.debug(f"Reported usage from call to model {response.model}: {usage}")
-            api_manager.update_cost(
-                response.usage.prompt_tokens,
-                response.usage.completion_tokens if "completion_tokens" in usage else 0,
-                response.model,
-            )
-        except Exception as err:
-            logger.warn(f"Failed to update API costs: {err.__class__.__name__}: {err}")
+        @functools.wraps(func)
+        async def metered_coroutine(*args, **kwargs):
+            token = _metering_enabled.set(True)
+            start = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            finally:
+                _metering_enabled.reset(token)
+
+            record_latency(kwargs, start)
+            return result
 
-    def metering_wrapper(*args, **kwargs):
-        openai_obj = openai_obj_processor(*args, **kwargs)
-        if isinstance(openai_obj, OpenAIObject) and "usage" in openai_obj:
-            update_usage_with_response(openai_obj)
-        return openai_obj
+        return metered_coroutine
 
+    @functools.wraps(func)
     def metered_func(*args, **kwargs):
-        with patch.object(
-            engine_api_resource.util,
-            "convert_to_openai_object",
-            side_effect=metering_wrapper,
-        ):
-            return func(*args, **kwargs)
+        token = _metering_enabled.set(True)
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _metering_enabled.reset(token)
+
+        record_latency(kwargs, start)
+        return result
 
     return metered_func
 
 
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def configure_rate_limiter(config: Config) -> Optional[RateLimiter]:
+    """Set up the rate limiter used by `retry_api` according to the config"""
+    global _rate_limiter
+
+    if config.openai_requests_per_minute or config.openai_tokens_per_minute:
+        _rate_limiter = RateLimiter(
+            requests_per_minute=config.openai_requests_per_minute,
+            tokens_per_minute=config.openai_tokens_per_minute,
+            state_file=config.openai_rate_limit_state_file,
+        )
+    else:
+        _rate_limiter = None
+    return _rate_limiter
+
+
+_hedging_policy: Optional[HedgingPolicy] = None
+
+
+def configure_hedging(config: Config) -> Optional[HedgingPolicy]:
+    """Set up hedging of chat completion requests according to the config"""
+    global _hedging_policy
+
+    if config.openai_hedge_percentile:
+        _hedging_policy = HedgingPolicy(
+            percentile=config.openai_hedge_percentile,
+            min_delay=config.openai_hedge_min_delay,
+        )
+    else:
+        _hedging_policy = None
+    return _hedging_policy
+
+
+_request_timeout: Optional[tuple[float, float]] = None
+
+
+class _KeepAliveHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter with TCP keep-alive, so proxies don't drop idle pooled connections"""
+
+    __attrs__ = requests.adapters.HTTPAdapter.__attrs__ + ["keep_alive_seconds"]
+
+    def __init__(self, *args, keep_alive_seconds: int = 0, **kwargs):
+        self.keep_alive_seconds = keep_alive_seconds
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if idle := self.keep_alive_seconds:
+            from urllib3.connection import HTTPConnection
+
+            socket_options = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                socket_options += [
+                    (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle),
+                    (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, idle),
+                ]
+            kwargs["socket_options"] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def configure_http_session(config: Config) -> requests.Session:
+    """Share one pooled keep-alive HTTP session between all OpenAI API calls.
+
+    By default, the OpenAI client opens a separate session for every thread, so calls
+    made from short-lived threads each need a new connection and TLS handshake.
+    """
+    global _request_timeout
+
+    adapter = _KeepAliveHTTPAdapter(
+        pool_connections=config.openai_http_pool_size,
+        pool_maxsize=config.openai_http_pool_size,
+        max_retries=openai.api_requestor.MAX_CONNECTION_RETRIES,
+        keep_alive_seconds=int(config.openai_http_keep_alive),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if proxies := openai.api_requestor._requests_proxies_arg(openai.proxy):
+        session.proxies = proxies
+
+    if hasattr(openai, "requestssession"):
+        openai.requestssession = session
+    else:
+        openai.api_requestor._make_session = lambda: session
+
+    _request_timeout = (config.openai_connect_timeout, config.openai_read_timeout)
+    return session
+
+
+def _with_request_timeout(kwargs: dict) -> dict:
+    if _request_timeout and "request_timeout" not in kwargs:
+        kwargs["request_timeout"] = _request_timeout
+    return kwargs
+
+
 def retry_api(
     num_retries: int = 10,
     backoff_base: float = 2.0,
@@ -158,6 +314,10 @@ def retry_api(
 ):
     """Retry an OpenAI API call.
 
+    If a rate limiter is configured, calls wait for their share of the rate limits
+    before being sent, and after a rate limit error the limiter determines the delay
+    of the retry. Otherwise the retries back off exponentially.
+
     Args:
         num_retries int: Number of retries. Defaults to 10.
         backoff_base float: Base for exponential backoff. Defaults to 2.
@@ -176,32 +336,85 @@ def retry_api(
         f"{Fore.RED}Error: API Bad gateway. Waiting {{backoff}} seconds...{Fore.RESET}"
     )
 
+    def _get_backoff(error: Exception, attempt: int, model: Optional[str]) -> float:
+        """Get the number of seconds to wait before retrying after `error`.
+
+        Raises:
+            Exception: `error`, if it can't be retried.
+        """
+        rate_limiter = _rate_limiter
+        if isinstance(error, (RateLimitError, ServiceUnavailableError)):
+            if attempt == num_retries + 1:
+                raise error
+
+            logger.debug(error_messages[type(error)])
+            if (
+                isinstance(error, RateLimitError)
+                and rate_limiter
+                and model
+                and rate_limiter.penalize(model, get_retry_after(error))
+            ):
+                # The rate limiter holds back the next attempt
+                return 0
+
+        elif isinstance(error, (APIError, Timeout)):
+            retryable = isinstance(error, Timeout) or error.http_status in [429, 502]
+            if not retryable or attempt == num_retries + 1:
+                raise error
+
+        else:
+            raise error
+
+        backoff = backoff_base ** (attempt + 2)
+        logger.debug(backoff_msg.format(backoff=backoff))
+        return backoff
+
     def _wrapper(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def _async_wrapped(*args, **kwargs):
+                user_warned = not warn_user
+                rate_limiter = _rate_limiter
+                model = _get_request_model(kwargs)
+                tokens = estimate_request_tokens(*args, **kwargs) if rate_limiter else 0
+
+                for attempt in range(1, num_retries + 2):
+                    if rate_limiter and model:
+                        await rate_limiter.aacquire(
+                            model, tokens, get_request_priority()
+                        )
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        backoff = _get_backoff(e, attempt, model)
+                        if not user_warned and isinstance(e, tuple(error_messages)):
+                            logger.double_check(api_key_error_msg)
+                            user_warned = True
+                    if backoff:
+                        await asyncio.sleep(backoff)
+
+            return _async_wrapped
+
         @functools.wraps(func)
         def _wrapped(*args, **kwargs):
             user_warned = not warn_user
-            num_attempts = num_retries + 1  # +1 for the first attempt
-            for attempt in range(1, num_attempts + 1):
+            rate_limiter = _rate_limiter
+            model = _get_request_model(kwargs)
+            tokens = estimate_request_tokens(*args, **kwargs) if rate_limiter else 0
+
+            for attempt in range(1, num_retries + 2):  # +1 for the first attempt
+                if rate_limiter and model:
+                    rate_limiter.acquire(model, tokens, get_request_priority())
                 try:
                     return func(*args, **kwargs)
-
-                except (RateLimitError, ServiceUnavailableError) as e:
-                    if attempt == num_attempts:
-                        raise
-
-                    error_msg = error_messages[type(e)]
-                    logger.debug(error_msg)
-                    if not user_warned:
+                except Exception as e:
+                    backoff = _get_backoff(e, attempt, model)
+                    if not user_warned and isinstance(e, tuple(error_messages)):
                         logger.double_check(api_key_error_msg)
                         user_warned = True
-
-                except (APIError, Timeout) as e:
-                    if (e.http_status not in [429, 502]) or (attempt == num_attempts):
-                        raise
-
-                backoff = backoff_base ** (attempt + 2)
-                logger.debug(backoff_msg.format(backoff=backoff))
-                time.sleep(backoff)
+                if backoff:
+                    time.sleep(backoff)
 
         return _wrapped
 
@@ -213,17 +426,59 @@ def retry_api(
 def create_chat_completion(
     messages: List[MessageDict],
     *_,
+    stop_when_complete: bool = False,
     **kwargs,
 ) -> OpenAIObject:
     """Create a chat completion using the OpenAI API
 
+    If `stream=True` is passed, the streamed deltas are assembled into a response
+    of the same shape as a non-streamed one.
+
+    If hedging is configured, a duplicate request is sent when the request takes
+    longer than usual, and the first response to arrive is used.
+
     Args:
         messages: A list of messages to feed to the chatbot.
+        stop_when_complete: When streaming, stop reading the response as soon as the
+            function call is complete or, if no functions are given, as soon as the
+            JSON object in the content is complete.
         kwargs: Other arguments to pass to the OpenAI API chat completion call.
     Returns:
         OpenAIObject: The ChatCompletion response from OpenAI
 
     """
+    request = functools.partial(
+        _send_chat_completion,
+        messages,
+        stop_when_complete,
+        **_with_request_timeout(kwargs),
+    )
+    hedging_policy = _hedging_policy
+    if not hedging_policy:
+        return request()
+
+    model = _get_request_model(kwargs)
+
+    def hedge_request() -> OpenAIObject:
+        if _rate_limiter:
+            _rate_limiter.acquire(
+                model,
+                estimate_request_tokens(messages, **kwargs),
+                get_request_priority(),
+            )
+        return request()
+
+    return hedging_policy.run(model, request, hedge_request)
+
+
+def _send_chat_completion(
+    messages: List[MessageDict],
+    stop_when_complete: bool,
+    **kwargs,
+) -> OpenAIObject:
+    if kwargs.get("stream"):
+        return _create_streamed_chat_completion(messages, stop_when_complete, **kwargs)
+
     completion: OpenAIObject = openai.ChatCompletion.create(
         messages=messages,
         **kwargs,
@@ -233,6 +488,283 @@ def create_chat_completion(
     return completion
 
 
+@meter_api
+@retry_api()
+async def acreate_chat_completion(
+    messages: List[MessageDict],
+    *_,
+    stop_when_complete: bool = False,
+    **kwargs,
+) -> OpenAIObject:
+    """Create a chat completion using the OpenAI API, without blocking the event loop
+
+    Works like `create_chat_completion`; a hedged request that loses the race is
+    cancelled.
+
+    Args:
+        messages: A list of messages to feed to the chatbot.
+        stop_when_complete: When streaming, stop reading the response as soon as the
+            function call or the JSON object in the content is complete.
+        kwargs: Other arguments to pass to the OpenAI API chat completion call.
+    Returns:
+        OpenAIObject: The ChatCompletion response from OpenAI
+    """
+    request = functools.partial(
+        _asend_chat_completion,
+        messages,
+        stop_when_complete,
+        **_with_request_timeout(kwargs),
+    )
+    hedging_policy = _hedging_policy
+    if not hedging_policy:
+        return await request()
+
+    model = _get_request_model(kwargs)
+
+    async def hedge_request() -> OpenAIObject:
+        if _rate_limiter:
+            await _rate_limiter.aacquire(
+                model,
+                estimate_request_tokens(messages, **kwargs),
+                get_request_priority(),
+            )
+        return await request()
+
+    return await hedging_policy.arun(model, request, hedge_request)
+
+
+async def _asend_chat_completion(
+    messages: List[MessageDict],
+    stop_when_complete: bool,
+    **kwargs,
+) -> OpenAIObject:
+    if kwargs.get("stream"):
+        return await _acreate_streamed_chat_completion(
+            messages, stop_when_complete, **kwargs
+        )
+
+    completion: OpenAIObject = await openai.ChatCompletion.acreate(
+        messages=messages,
+        **kwargs,
+    )
+    if not hasattr(completion, "error"):
+        logger.debug(f"Response: {completion}")
+    return completion
+
+
+def _create_streamed_chat_completion(
+    messages: List[MessageDict],
+    stop_when_complete: bool,
+    **kwargs,
+) -> OpenAIObject:
+    stream = openai.ChatCompletion.create(messages=messages, **kwargs)
+    completion = _StreamedChatCompletion(messages, stop_when_complete, **kwargs)
+    try:
+        for chunk in stream:
+            if completion.add_chunk(chunk):
+                break
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+    return completion.response()
+
+
+async def _acreate_streamed_chat_completion(
+    messages: List[MessageDict],
+    stop_when_complete: bool,
+    **kwargs,
+) -> OpenAIObject:
+    stream = await openai.ChatCompletion.acreate(messages=messages, **kwargs)
+    completion = _StreamedChatCompletion(messages, stop_when_complete, **kwargs)
+    try:
+        async for chunk in stream:
+            if completion.add_chunk(chunk):
+                break
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+    return completion.response()
+
+
+class _StreamedChatCompletion:
+    """Assembles the chunks of a streamed chat completion into a complete response"""
+
+    def __init__(
+        self, messages: List[MessageDict], stop_when_complete: bool, **kwargs
+    ):
+        self.messages = messages
+        self.functions = kwargs.get("functions")
+        self.stop_when_complete = stop_when_complete
+        self.message = _StreamedChatMessage(expect_function_call=bool(self.functions))
+        self.completion_id = None
+        self.model = kwargs.get("model")
+        self.finish_reason = None
+
+    def add_chunk(self, chunk: OpenAIObject) -> bool:
+        """Add a chunk of the stream, and return whether the rest can be skipped"""
+        self.completion_id = chunk.get("id", self.completion_id)
+        self.model = chunk.get("model", self.model)
+        if not chunk.choices:
+            return False
+        choice = chunk.choices[0]
+        self.message.add_delta(choice.get("delta", {}))
+        if choice.get("finish_reason"):
+            self.finish_reason = choice.finish_reason
+            return True
+        if self.stop_when_complete and self.message.is_complete:
+            logger.debug("Streamed reply is complete, not waiting for the stream end")
+            self.finish_reason = (
+                "function_call" if self.message.function_name else "stop"
+            )
+            return True
+        return False
+
+    def response(self) -> OpenAIObject:
+        completion = OpenAIObject.construct_from(
+            {
+                "id": self.completion_id,
+                "object": "chat.completion",
+                "model": self.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": self.message.raw(),
+                        "finish_reason": self.finish_reason,
+                    }
+                ],
+                "usage": _estimate_streamed_usage(
+                    self.messages, self.functions, self.message, self.model
+                ),
+            }
+        )
+        logger.debug(f"Response: {completion}")
+        # Streamed responses don't report their usage, so meter_api doesn't see it
+        update_usage_with_response(completion)
+        return completion
+
+
+class _JSONObjectScanner:
+    """Incrementally detects the end of a top-level JSON object in streamed text"""
+
+    def __init__(self):
+        self.started = False
+        self.complete = False
+        self.invalid = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.complete or self.invalid:
+                break
+            if not self.started:
+                if char.isspace():
+                    continue
+                if char != "{":
+                    self.invalid = True
+                    break
+                self.started = True
+                self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                self.complete = self._depth == 0
+        return self.complete
+
+
+class _StreamedChatMessage:
+    """Assembles the content and function call of a streamed chat completion"""
+
+    def __init__(self, expect_function_call: bool = False):
+        self.expect_function_call = expect_function_call
+        self.role = "assistant"
+        self.function_name = ""
+        self._content: list[str] = []
+        self._arguments: list[str] = []
+        self._content_scanner = _JSONObjectScanner()
+        self._arguments_scanner = _JSONObjectScanner()
+
+    @property
+    def content(self) -> str | None:
+        return "".join(self._content) if self._content else None
+
+    @property
+    def arguments(self) -> str:
+        return "".join(self._arguments)
+
+    def add_delta(self, delta: dict) -> None:
+        if delta.get("role"):
+            self.role = delta["role"]
+        if delta.get("content"):
+            self._content.append(delta["content"])
+            self._content_scanner.feed(delta["content"])
+        if function_call := delta.get("function_call"):
+            self.function_name += function_call.get("name") or ""
+            if arguments := function_call.get("arguments"):
+                self._arguments.append(arguments)
+                self._arguments_scanner.feed(arguments)
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether the function call, or else the JSON content, has been received"""
+        if self.function_name:
+            if not self._arguments_scanner.complete:
+                return False
+            try:
+                json.loads(self.arguments)
+                return True
+            except json.JSONDecodeError:
+                return False
+        return not self.expect_function_call and self._content_scanner.complete
+
+    def raw(self) -> dict:
+        message = {"role": self.role, "content": self.content}
+        if self.function_name:
+            message["function_call"] = {
+                "name": self.function_name,
+                "arguments": self.arguments,
+            }
+        return message
+
+
+def _estimate_streamed_usage(
+    messages: List[MessageDict],
+    functions: Optional[list[dict]],
+    message: _StreamedChatMessage,
+    model: str,
+) -> dict[str, int]:
+    from autogpt.llm.base import Message
+    from autogpt.llm.utils import count_message_tokens, count_string_tokens
+
+    try:
+        prompt_tokens = count_message_tokens(
+            [Message(m["role"], m["content"]) for m in messages], model, functions
+        )
+        completion_tokens = count_string_tokens(
+            (message.content or "") + message.function_name + message.arguments, model
+        )
+    except Exception as err:
+        logger.warn(f"Failed to count tokens of streamed completion: {err}")
+        prompt_tokens = completion_tokens = 0
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
 @meter_api
 @retry_api()
 def create_text_completion(
@@ -251,7 +783,7 @@ def create_text_completion(
     """
     return openai.Completion.create(
         prompt=prompt,
-        **kwargs,
+        **_with_request_timeout(kwargs),
     )
 
 
@@ -273,7 +805,29 @@ def create_embedding(
     """
     return openai.Embedding.create(
         input=input,
-        **kwargs,
+        **_with_request_timeout(kwargs),
+    )
+
+
+@meter_api
+@retry_api()
+async def acreate_embedding(
+    input: str | TText | List[str] | List[TText],
+    *_,
+    **kwargs,
+) -> OpenAIObject:
+    """Create an embedding using the OpenAI API, without blocking the event loop
+
+    Args:
+        input: The text to embed.
+        kwargs: Other arguments to pass to the OpenAI API embedding call.
+    Returns:
+        OpenAIObject: The Embedding response from OpenAI
+
+    """
+    return await openai.Embedding.acreate(
+        input=input,
+        **_with_request_timeout(kwargs),
     )
 
 
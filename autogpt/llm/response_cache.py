@@ -0,0 +1,159 @@
+"""Persistent, content-addressed cache for chat completion responses"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from autogpt.logs import logger
+
+
+class ResponseCache:
+    """Disk-backed cache of chat completion replies, evicted LRU by total size.
+
+    Entries are keyed by a hash of everything that determines the reply (model,
+    sampling parameters, messages and function specs), so identical requests made
+    by different agents or different runs share the same entry.
+
+    Args:
+        file_path: Path of the SQLite file that holds the cache.
+        max_size: Maximum total size of the cached values, in bytes.
+    """
+
+    def __init__(self, file_path: str | Path, max_size: int):
+        self.file_path = Path(file_path)
+        self.max_size = max_size
+
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.file_path, timeout=30, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL"
+                ")"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used"
+                " ON responses (last_used)"
+            )
+        logger.debug(f"Initialized {__class__.__name__} at {self.file_path}")
+
+    @staticmethod
+    def make_key(
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        messages: list[dict],
+        functions: Optional[list[dict]] = None,
+        function_call: Optional[str | dict] = None,
+        stop_when_complete: bool = False,
+    ) -> str:
+        """Get the content address of a chat completion request"""
+        request = {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "functions": functions or [],
+            "function_call": function_call,
+            "stop_when_complete": stop_when_complete,
+        }
+        serialized = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        """Look up a cached reply, marking it as recently used if present."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        """Store a reply, evicting the least recently used entries if needed."""
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        if size > self.max_size:
+            logger.debug(f"Not caching response of {size} bytes: exceeds cache size")
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (key, serialized, size, time.time()),
+            )
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached values, in bytes"""
+        with self._lock:
+            return self._total_size()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    def _total_size(self) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def _evict(self) -> None:
+        excess = self._total_size() - self.max_size
+        if excess <= 0:
+            return
+
+        freed = 0
+        evicted_keys = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_used ASC"
+        ):
+            evicted_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._connection.executemany(
+            "DELETE FROM responses WHERE key = ?", evicted_keys
+        )
+        logger.debug(
+            f"Evicted {len(evicted_keys)} responses ({freed} bytes) from cache"
+        )
+
+
+_caches: dict[Path, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(file_path: str | Path, max_size: int) -> ResponseCache:
+    """Get the shared ResponseCache for the given file, creating it if necessary."""
+    file_path = Path(file_path).resolve()
+    with _caches_lock:
+        if file_path not in _caches:
+            _caches[file_path] = ResponseCache(file_path, max_size)
+        cache = _caches[file_path]
+    cache.max_size = max_size
+    return cache
@@ -0,0 +1,95 @@
+"""Coalesces identical API requests that are in flight at the same time"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, TypeVar
+
+from autogpt.logs import logger
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Makes concurrent identical requests share a single call.
+
+    The first caller of a key makes the call; callers of the same key that arrive
+    before it returns wait for its result (or error) instead of making their own.
+    Once the call has returned, the next caller of the key makes a new call, so
+    this doesn't cache anything.
+
+    Synchronous and asynchronous calls are tracked separately, and asynchronous
+    calls are only shared between callers on the same event loop.
+
+    Args:
+        on_coalesced: Called with the key whenever a caller shares another's call.
+    """
+
+    def __init__(self, on_coalesced: Callable[[str], None] | None = None):
+        self.on_coalesced = on_coalesced
+        self._calls: dict[str, Future] = {}
+        self._async_calls: dict[tuple[int, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, **request: Any) -> str:
+        """Get the content address of a request"""
+        serialized = json.dumps(
+            request, sort_keys=True, ensure_ascii=False, default=str
+        )
+        return f"{kind}:{hashlib.sha256(serialized.encode('utf-8')).hexdigest()}"
+
+    def do(self, key: str, call: Callable[[], T]) -> T:
+        """Get the result of `call`, or of an identical call already in flight"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            self._coalesced(key)
+            return future.result()
+
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    async def ado(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Async version of `do`"""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        future = self._async_calls.get(loop_key)
+        if future is not None:
+            self._coalesced(key)
+            # Don't let the cancellation of one waiter cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._async_calls[loop_key] = asyncio.ensure_future(call())
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._async_calls.get(loop_key) is future:
+                del self._async_calls[loop_key]
+
+    def _coalesced(self, key: str) -> None:
+        logger.debug(f"Coalesced request {key} with an identical one in flight")
+        if self.on_coalesced:
+            self.on_coalesced(key)
+
+
+def _record_coalesced_call(key: str) -> None:
+    from autogpt.llm.api_manager import ApiManager
+
+    ApiManager().record_coalesced_call(key.split(":", 1)[0])
+
+
+single_flight = SingleFlight(on_coalesced=_record_coalesced_call)
+"""The SingleFlight shared by the LLM and embedding helpers"""
@@ -0,0 +1,15 @@
+from autogpt.llm.stub_server.app import create_app
+from autogpt.llm.stub_server.settings import (
+    FaultSettings,
+    LatencySettings,
+    ScriptedResponse,
+    StubServerSettings,
+)
+
+__all__ = [
+    "create_app",
+    "FaultSettings",
+    "LatencySettings",
+    "ScriptedResponse",
+    "StubServerSettings",
+]
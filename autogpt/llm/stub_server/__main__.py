@@ -0,0 +1,34 @@
+"""Run a local OpenAI API stub server: python -m autogpt.llm.stub_server"""
+from typing import Optional
+
+import click
+import uvicorn
+
+from autogpt.llm.stub_server import StubServerSettings, create_app
+
+
+@click.command()
+@click.option("--host", default="localhost", help="The host to listen on.")
+@click.option("--port", default=8089, type=int, help="The port to listen on.")
+@click.option(
+    "--settings-file",
+    "-s",
+    type=click.Path(exists=True, dir_okay=False),
+    help="YAML file with latency, fault injection and scripted response settings.",
+)
+def main(host: str, port: int, settings_file: Optional[str]) -> None:
+    """Serve the OpenAI endpoints used by Auto-GPT with simulated responses.
+
+    Point Auto-GPT at it with OPENAI_API_BASE_URL=http://<host>:<port>/v1
+    """
+    settings = (
+        StubServerSettings.load(settings_file)
+        if settings_file
+        else StubServerSettings()
+    )
+    click.echo(f"Running OpenAI API stub server on http://{host}:{port}/v1 ...")
+    uvicorn.run(create_app(settings), host=host, port=port, workers=1)
+
+
+if __name__ == "__main__":
+    main()
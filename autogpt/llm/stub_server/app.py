@@ -0,0 +1,372 @@
+"""A local stand-in for the OpenAI API, for load testing without network access"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from math import ceil
+from string import Template
+from typing import Any, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .settings import LatencySettings, ScriptedResponse, StubServerSettings
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) which does not need a tokenizer"""
+    return max(1, ceil(len(text) / 4)) if text else 0
+
+
+class RateLimiter:
+    """Token buckets emulating the requests/min and tokens/min limits of the API"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int],
+        tokens_per_minute: Optional[int],
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def consume(self, model: str, tokens: int) -> bool:
+        """Take capacity for one request of `tokens` tokens; False if over the limit"""
+        with self._lock:
+            now = time.monotonic()
+            requests, tokens_left, last_update = self._buckets.get(
+                model,
+                (
+                    self.requests_per_minute or 0,
+                    self.tokens_per_minute or 0,
+                    now,
+                ),
+            )
+            elapsed = now - last_update
+            if self.requests_per_minute:
+                requests = min(
+                    self.requests_per_minute,
+                    requests + elapsed * self.requests_per_minute / 60,
+                )
+            if self.tokens_per_minute:
+                tokens_left = min(
+                    self.tokens_per_minute,
+                    tokens_left + elapsed * self.tokens_per_minute / 60,
+                )
+
+            allowed = (not self.requests_per_minute or requests >= 1) and (
+                not self.tokens_per_minute or tokens_left >= tokens
+            )
+            if allowed:
+                requests -= 1
+                tokens_left -= tokens
+            self._buckets[model] = (requests, tokens_left, now)
+            return allowed
+
+
+class StubServer:
+    """Generates OpenAI-style responses according to StubServerSettings"""
+
+    def __init__(self, settings: StubServerSettings):
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.rate_limiter = RateLimiter(
+            settings.requests_per_minute, settings.tokens_per_minute
+        )
+        self.stats = {
+            "requests": 0,
+            "chat_completions": 0,
+            "embeddings": 0,
+            "rate_limited": 0,
+            "injected_errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+        self._patterns = [
+            re.compile(r.match) if r.match else None for r in settings.responses
+        ]
+
+    def check_faults(self, model: str, tokens: int) -> Optional[JSONResponse]:
+        """Get an error response to return instead of a result, if any"""
+        faults = self.settings.faults
+        if not self.rate_limiter.consume(model, tokens):
+            self.stats["rate_limited"] += 1
+            return error_response(
+                429, f"Rate limit reached for {model}.", "requests", retry_after=1
+            )
+        if self.rng.random() < faults.rate_limit_probability:
+            self.stats["injected_errors"] += 1
+            return error_response(
+                429, f"Rate limit reached for {model}.", "requests", retry_after=1
+            )
+        if self.rng.random() < faults.bad_gateway_probability:
+            self.stats["injected_errors"] += 1
+            return error_response(502, "Bad gateway.", "server_error")
+        return None
+
+    async def delay(self, latency: LatencySettings, completion_tokens: int = 0):
+        seconds = latency.sample(self.rng, completion_tokens)
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def pick_response(self, model: str, messages: list[dict]) -> ScriptedResponse:
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        for response, pattern in zip(self.settings.responses, self._patterns):
+            if response.model and response.model != model:
+                continue
+            if pattern is None or pattern.search(prompt):
+                return response
+        return ScriptedResponse(content=self.settings.default_reply)
+
+    def chat_message(
+        self, body: dict[str, Any], scripted: ScriptedResponse
+    ) -> dict[str, Any]:
+        model = body.get("model", "")
+        messages = body.get("messages", [])
+        substitutions = {
+            "model": model,
+            "request_number": self.stats["chat_completions"],
+            "last_message": messages[-1].get("content", "") if messages else "",
+        }
+
+        forced_function = body.get("function_call")
+        if isinstance(forced_function, dict) and "name" in forced_function:
+            function_spec = next(
+                (
+                    f
+                    for f in body.get("functions", [])
+                    if f.get("name") == forced_function["name"]
+                ),
+                {"name": forced_function["name"]},
+            )
+            arguments = (
+                Template(
+                    scripted.function_call.get("arguments", "{}")
+                ).safe_substitute(substitutions)
+                if scripted.function_call
+                else json.dumps(default_arguments(function_spec))
+            )
+            return {
+                "role": "assistant",
+                "content": None,
+                "function_call": {
+                    "name": function_spec["name"],
+                    "arguments": arguments,
+                },
+            }
+
+        message: dict[str, Any] = {"role": "assistant", "content": None}
+        if scripted.content is not None:
+            message["content"] = Template(scripted.content).safe_substitute(
+                substitutions
+            )
+        if scripted.function_call:
+            message["function_call"] = {
+                "name": scripted.function_call["name"],
+                "arguments": Template(
+                    scripted.function_call.get("arguments", "{}")
+                ).safe_substitute(substitutions),
+            }
+        return message
+
+    def embedding(self, text: str) -> list[float]:
+        """Deterministic unit vector, so identical texts get identical embeddings"""
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        vector = np.random.default_rng(seed).standard_normal(
+            self.settings.embedding_dimensions
+        )
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+
+def default_arguments(function_spec: dict[str, Any]) -> dict[str, Any]:
+    """Fill the required parameters of a function spec with neutral values"""
+    defaults = {"integer": 0, "number": 0, "boolean": False, "array": [], "object": {}}
+    parameters = function_spec.get("parameters", {})
+    properties = parameters.get("properties", {})
+    return {
+        name: defaults.get(properties.get(name, {}).get("type"), "")
+        for name in parameters.get("required", [])
+    }
+
+
+def error_response(
+    status_code: int, message: str, error_type: str, retry_after: int | None = None
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "error": {
+                "message": message,
+                "type": error_type,
+                "param": None,
+                "code": None,
+            }
+        },
+        headers={"Retry-After": str(retry_after)} if retry_after else None,
+    )
+
+
+async def stream_chat_completion(
+    stub: StubServer,
+    model: str,
+    message: dict[str, Any],
+    finish_reason: str,
+    completion_tokens: int,
+    piece_length: int = 16,
+):
+    """Yield a chat completion as server-sent events, one delta per text piece, with
+    the time for `completion_tokens` spread evenly over the deltas"""
+    latency = stub.settings.chat_latency
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def event(delta: dict[str, Any], finish_reason: str | None = None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    def pieces(text: str):
+        return [text[i : i + piece_length] for i in range(0, len(text), piece_length)]
+
+    await stub.delay(latency)
+    yield event({"role": "assistant", "content": ""})
+
+    deltas = [{"content": piece} for piece in pieces(message["content"] or "")]
+    if function_call := message.get("function_call"):
+        deltas.append(
+            {"function_call": {"name": function_call["name"], "arguments": ""}}
+        )
+        deltas += [
+            {"function_call": {"arguments": piece}}
+            for piece in pieces(function_call["arguments"])
+        ]
+    for delta in deltas:
+        if latency.seconds_per_token:
+            await asyncio.sleep(
+                latency.seconds_per_token * completion_tokens / len(deltas)
+            )
+        yield event(delta)
+
+    yield event({}, finish_reason)
+    yield "data: [DONE]\n\n"
+
+
+def create_app(settings: StubServerSettings) -> FastAPI:
+    """Create an app serving the OpenAI endpoints used by Auto-GPT"""
+    stub = StubServer(settings)
+    app = FastAPI(title="OpenAI API stub")
+    app.state.stub = stub
+
+    @app.get("/v1/models")
+    async def list_models():
+        stub.stats["requests"] += 1
+        return {
+            "object": "list",
+            "data": [
+                {"id": model, "object": "model", "owned_by": "openai"}
+                for model in settings.models
+            ],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def create_chat_completion(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        stub.stats["requests"] += 1
+        if model not in settings.models:
+            return error_response(
+                404, f"The model `{model}` does not exist", "invalid_request_error"
+            )
+
+        prompt_tokens = sum(
+            4 + estimate_tokens(json.dumps(m)) for m in body.get("messages", [])
+        ) + estimate_tokens(json.dumps(body.get("functions", [])))
+        if error := stub.check_faults(model, prompt_tokens):
+            return error
+
+        stub.stats["chat_completions"] += 1
+        scripted = stub.pick_response(model, body.get("messages", []))
+        message = stub.chat_message(body, scripted)
+        completion_tokens = scripted.completion_tokens
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(
+                message["content"] or json.dumps(message.get("function_call"))
+            )
+        stub.stats["prompt_tokens"] += prompt_tokens
+        stub.stats["completion_tokens"] += completion_tokens
+        finish_reason = "function_call" if "function_call" in message else "stop"
+
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chat_completion(
+                    stub, model, message, finish_reason, completion_tokens
+                ),
+                media_type="text/event-stream",
+            )
+
+        await stub.delay(settings.chat_latency, completion_tokens)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": finish_reason}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.post("/v1/embeddings")
+    async def create_embedding(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        stub.stats["requests"] += 1
+        if model not in settings.models:
+            return error_response(
+                404, f"The model `{model}` does not exist", "invalid_request_error"
+            )
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        texts = [i if isinstance(i, str) else json.dumps(i) for i in inputs]
+        prompt_tokens = sum(estimate_tokens(t) for t in texts)
+        if error := stub.check_faults(model, prompt_tokens):
+            return error
+
+        stub.stats["embeddings"] += 1
+        await stub.delay(settings.embedding_latency)
+
+        stub.stats["prompt_tokens"] += prompt_tokens
+        return {
+            "object": "list",
+            "model": model,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub.embedding(t)}
+                for i, t in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    @app.get("/stub/stats")
+    async def get_stats():
+        return stub.stats
+
+    return app
@@ -0,0 +1,106 @@
+"""Settings for the local OpenAI API stub server"""
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path
+from typing import Literal, Optional
+
+import yaml
+from pydantic import BaseModel, Field
+
+from autogpt.llm.providers.openai import OPEN_AI_MODELS
+
+DEFAULT_REPLY = json.dumps(
+    {
+        "thoughts": {
+            "text": "Stub reply $request_number",
+            "reasoning": "This reply was generated by the OpenAI API stub server.",
+            "plan": "- keep the agent loop busy",
+            "criticism": "",
+            "speak": "Stub reply $request_number",
+        },
+        "command": {"name": "list_files", "args": {"directory": "."}},
+    },
+    indent=4,
+)
+
+
+class LatencySettings(BaseModel):
+    """Distribution from which the response delay of a request is drawn.
+
+    All durations are in seconds. `stall_probability` adds an occasional long stall
+    on top of the sampled delay, to reproduce the tail latency of the real API.
+    """
+
+    distribution: Literal["fixed", "uniform", "normal", "lognormal"] = "fixed"
+    mean: float = 0.0
+    stddev: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+    seconds_per_token: float = 0.0
+    stall_probability: float = 0.0
+    stall_seconds: float = 0.0
+
+    def sample(self, rng: random.Random, completion_tokens: int = 0) -> float:
+        if self.distribution == "uniform":
+            delay = rng.uniform(self.low, self.high)
+        elif self.distribution == "normal":
+            delay = rng.normalvariate(self.mean, self.stddev)
+        elif self.distribution == "lognormal":
+            delay = rng.lognormvariate(self.mean, self.stddev)
+        else:
+            delay = self.mean
+
+        delay += completion_tokens * self.seconds_per_token
+        if self.stall_probability and rng.random() < self.stall_probability:
+            delay += self.stall_seconds
+        return max(delay, 0.0)
+
+
+class FaultSettings(BaseModel):
+    """Probabilities of injecting error responses into otherwise valid requests"""
+
+    rate_limit_probability: float = 0.0
+    bad_gateway_probability: float = 0.0
+
+
+class ScriptedResponse(BaseModel):
+    """A canned chat completion reply.
+
+    `content` and the `arguments` of `function_call` are templates in which
+    `$model`, `$request_number` and `$last_message` are substituted.
+
+    Attributes:
+        match: Regex searched for in the request's messages; matches any if unset.
+        model: Only use this response for requests to the given model.
+        content: Template for the content of the reply.
+        function_call: Template for the function call of the reply.
+        completion_tokens: Completion tokens to report and to simulate the latency
+            of; estimated from the reply if unset.
+    """
+
+    match: Optional[str] = None
+    model: Optional[str] = None
+    content: Optional[str] = None
+    function_call: Optional[dict[str, str]] = None
+    completion_tokens: Optional[int] = None
+
+
+class StubServerSettings(BaseModel):
+    models: list[str] = Field(default_factory=lambda: list(OPEN_AI_MODELS.keys()))
+    chat_latency: LatencySettings = Field(default_factory=LatencySettings)
+    embedding_latency: LatencySettings = Field(default_factory=LatencySettings)
+    faults: FaultSettings = Field(default_factory=FaultSettings)
+    tokens_per_minute: Optional[int] = None
+    requests_per_minute: Optional[int] = None
+    responses: list[ScriptedResponse] = Field(default_factory=list)
+    default_reply: str = DEFAULT_REPLY
+    embedding_dimensions: int = 1536
+    seed: Optional[int] = None
+
+    @classmethod
+    def load(cls, settings_file: str | Path) -> StubServerSettings:
+        with open(settings_file, encoding="utf-8") as file:
+            settings = yaml.load(file, Loader=yaml.FullLoader) or {}
+        return cls.parse_obj(settings)
@@ -1,19 +1,25 @@
 from __future__ import annotations
 
-from typing import List, Literal, Optional
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, List, Literal, Optional
 
 from colorama import Fore
+from openai.openai_object import OpenAIObject
 
 from autogpt.config import Config
 
 from ..api_manager import ApiManager
-from ..base import ChatModelResponse, ChatSequence, Message
+from ..base import ChatModelResponse, ChatSequence, Message, MessageDict
 from ..providers import openai as iopenai
 from ..providers.openai import (
     OPEN_AI_CHAT_MODELS,
     OpenAIFunctionCall,
     OpenAIFunctionSpec,
 )
+from ..response_cache import ResponseCache, get_response_cache
+from ..single_flight import single_flight
 from .token_counter import *
 
 
@@ -40,12 +46,81 @@ def call_ai_function(
     """
     if model is None:
         model = config.smart_llm
+    prompt = _ai_function_prompt(
+        function, _format_ai_function_args(args), description, model
+    )
+    return create_chat_completion(prompt=prompt, temperature=0, config=config).content
+
+
+def call_ai_function_many(
+    function: str,
+    list_of_args: list[list],
+    description: str,
+    config: Config,
+    model: Optional[str] = None,
+    concurrency: int = 8,
+) -> list[str]:
+    """Call an AI function for each of a list of argument lists, concurrently
+
+    The calls go through `create_chat_completion`, so they share its rate limit,
+    retries and response cache. Argument lists that are identical once formatted
+    are only sent once.
+
+    Args:
+        function (str): The function to call
+        list_of_args (list): The argument lists to call the function with
+        description (str): The description of the function
+        model (str, optional): The model to use. Defaults to None.
+        concurrency (int, optional): The maximum number of calls in flight.
+
+    Returns:
+        list[str]: The response of the function for each argument list, in order
+
+    Raises:
+        Exception: The error of the first failing call; calls that haven't started
+            yet are cancelled.
+    """
+    if model is None:
+        model = config.smart_llm
+    arg_strs = [_format_ai_function_args(args) for args in list_of_args]
+    unique_arg_strs = list(dict.fromkeys(arg_strs))
+    logger.debug(
+        f"Calling AI function for {len(unique_arg_strs)} unique argument lists"
+        f" ({len(arg_strs)} total), {concurrency} at a time"
+    )
+
+    def call(arg_str: str) -> str:
+        prompt = _ai_function_prompt(function, arg_str, description, model)
+        reply = create_chat_completion(prompt=prompt, temperature=0, config=config)
+        return reply.content
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(unique_arg_strs))),
+        thread_name_prefix="ai-function",
+    ) as executor:
+        futures = {
+            arg_str: executor.submit(contextvars.copy_context().run, call, arg_str)
+            for arg_str in unique_arg_strs
+        }
+        try:
+            results = {arg_str: f.result() for arg_str, f in futures.items()}
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return [results[arg_str] for arg_str in arg_strs]
+
+
+def _format_ai_function_args(args: list) -> str:
     # For each arg, if any are None, convert to "None":
     args = [str(arg) if arg is not None else "None" for arg in args]
     # parse args to comma separated string
-    arg_str: str = ", ".join(args)
+    return ", ".join(args)
+
 
-    prompt = ChatSequence.for_model(
+def _ai_function_prompt(
+    function: str, arg_str: str, description: str, model: str
+) -> ChatSequence:
+    return ChatSequence.for_model(
         model,
         [
             Message(
@@ -56,7 +131,6 @@ def call_ai_function(
             Message("user", arg_str),
         ],
     )
-    return create_chat_completion(prompt=prompt, temperature=0, config=config).content
 
 
 def create_text_completion(
@@ -71,17 +145,15 @@ def create_text_completion(
     if temperature is None:
         temperature = config.temperature
 
-    if config.use_azure:
-        kwargs = config.get_azure_kwargs(model)
-    else:
-        kwargs = {"model": model}
+    kwargs = config.get_openai_credentials(model)
+    if not config.use_azure:
+        kwargs["model"] = model
 
     response = iopenai.create_text_completion(
         prompt=prompt,
         **kwargs,
         temperature=temperature,
         max_tokens=max_output_tokens,
-        api_key=config.openai_api_key,
     )
     logger.debug(f"Response: {response}")
 
@@ -97,6 +169,8 @@ def create_chat_completion(
     model: Optional[str] = None,
     temperature: Optional[float] = None,
     max_tokens: Optional[int] = None,
+    stream: Optional[bool] = None,
+    stop_when_complete: bool = False,
 ) -> ChatModelResponse:
     """Create a chat completion using the OpenAI API
 
@@ -105,17 +179,134 @@ def create_chat_completion(
         model (str, optional): The model to use. Defaults to None.
         temperature (float, optional): The temperature to use. Defaults to 0.9.
         max_tokens (int, optional): The max tokens to use. Defaults to None.
+        stream (bool, optional): Whether to stream the response. Defaults to
+            config.openai_streaming.
+        stop_when_complete (bool, optional): When streaming, return as soon as the
+            function call or the JSON reply is complete. Defaults to False.
 
     Returns:
         str: The response from the chat completion
     """
+    request = _prepare_chat_completion(
+        prompt,
+        config,
+        functions,
+        force_function,
+        model,
+        temperature,
+        max_tokens,
+        stream,
+        stop_when_complete,
+    )
+    if request.plugin_reply is not None:
+        return request.plugin_reply
+
+    response = None
+    if request.cached_message is None:
+        messages = prompt.raw()
+        response = single_flight.do(
+            _single_flight_key(messages, stop_when_complete, request.kwargs),
+            lambda: iopenai.create_chat_completion(
+                messages=messages,
+                stop_when_complete=stop_when_complete,
+                **request.kwargs,
+            ),
+        )
+    return _finish_chat_completion(request, config, response)
+
 
+async def acreate_chat_completion(
+    prompt: ChatSequence,
+    config: Config,
+    functions: Optional[List[OpenAIFunctionSpec]] = None,
+    force_function: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    stream: Optional[bool] = None,
+    stop_when_complete: bool = False,
+) -> ChatModelResponse:
+    """Create a chat completion using the OpenAI API, without blocking the event loop
+
+    Takes the same arguments as `create_chat_completion`, and goes through the same
+    plugin hooks, response cache, retries and metering.
+
+    Returns:
+        ChatModelResponse: The response from the chat completion
+    """
+    request = _prepare_chat_completion(
+        prompt,
+        config,
+        functions,
+        force_function,
+        model,
+        temperature,
+        max_tokens,
+        stream,
+        stop_when_complete,
+    )
+    if request.plugin_reply is not None:
+        return request.plugin_reply
+
+    response = None
+    if request.cached_message is None:
+        messages = prompt.raw()
+        response = await single_flight.ado(
+            _single_flight_key(messages, stop_when_complete, request.kwargs),
+            lambda: iopenai.acreate_chat_completion(
+                messages=messages,
+                stop_when_complete=stop_when_complete,
+                **request.kwargs,
+            ),
+        )
+    return _finish_chat_completion(request, config, response)
+
+
+def _single_flight_key(
+    messages: list[MessageDict], stop_when_complete: bool, kwargs: dict
+) -> str:
+    """Get the key on which identical chat completion requests in flight are shared"""
+    return single_flight.make_key(
+        "chat_completion",
+        messages=messages,
+        stop_when_complete=stop_when_complete,
+        **kwargs,
+    )
+
+
+@dataclass
+class _ChatCompletionRequest:
+    """A chat completion request, prepared up to the point of calling the API"""
+
+    model: str
+    kwargs: dict
+    plugin_reply: Any = None
+    cache: Optional[ResponseCache] = None
+    cache_key: Optional[str] = None
+    cached_message: Optional[dict] = None
+
+
+def _prepare_chat_completion(
+    prompt: ChatSequence,
+    config: Config,
+    functions: Optional[List[OpenAIFunctionSpec]],
+    force_function: Optional[str],
+    model: Optional[str],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    stream: Optional[bool],
+    stop_when_complete: bool,
+) -> _ChatCompletionRequest:
+    """Resolve the parameters of a chat completion, and give plugins and the response
+    cache the chance to provide the reply."""
     if model is None:
         model = prompt.model.name
     if temperature is None:
         temperature = config.temperature
     if max_tokens is None:
         max_tokens = OPEN_AI_CHAT_MODELS[model].max_tokens - prompt.token_length
+    if stream is None:
+        stream = config.openai_streaming
 
     logger.debug(
         f"{Fore.GREEN}Creating chat completion with model {model}, temperature {temperature}, max_tokens {max_tokens}{Fore.RESET}"
@@ -136,11 +327,11 @@ def create_chat_completion(
                 **chat_completion_kwargs,
             )
             if message is not None:
-                return message
+                return _ChatCompletionRequest(
+                    model, chat_completion_kwargs, plugin_reply=message
+                )
 
-    chat_completion_kwargs["api_key"] = config.openai_api_key
-    if config.use_azure:
-        chat_completion_kwargs.update(config.get_azure_kwargs(model))
+    chat_completion_kwargs.update(config.get_openai_credentials(model))
 
     if functions:
         chat_completion_kwargs["functions"] = [
@@ -149,18 +340,56 @@ def create_chat_completion(
         logger.debug(f"Function dicts: {chat_completion_kwargs['functions']}")
     if force_function:
         chat_completion_kwargs["function_call"] = force_function
+    if stream:
+        chat_completion_kwargs["stream"] = True
+
+    request = _ChatCompletionRequest(model, chat_completion_kwargs)
+    if (
+        config.llm_response_cache
+        and temperature <= config.llm_response_cache_max_temperature
+    ):
+        request.cache = get_response_cache(
+            config.llm_response_cache_file,
+            config.llm_response_cache_max_size_mb * 1024 * 1024,
+        )
+        request.cache_key = ResponseCache.make_key(
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            messages=prompt.raw(),
+            functions=chat_completion_kwargs.get("functions"),
+            function_call=force_function,
+            # A stream that stops early may leave out what follows the reply
+            stop_when_complete=stream and stop_when_complete,
+        )
+        request.cached_message = request.cache.get(request.cache_key)
+        ApiManager().update_cache_stats(hit=request.cached_message is not None)
+    return request
+
+
+def _finish_chat_completion(
+    request: _ChatCompletionRequest,
+    config: Config,
+    response: Optional[OpenAIObject],
+) -> ChatModelResponse:
+    """Turn the API response (or the cached reply) into a ChatModelResponse, and
+    pass it through the plugins' on_response hooks."""
+    if response is None:
+        logger.debug(
+            f"Serving chat completion from response cache ({request.cache_key})"
+        )
+        first_message = OpenAIObject.construct_from(request.cached_message)
+    else:
+        logger.debug(f"Response: {response}")
 
-    response = iopenai.create_chat_completion(
-        messages=prompt.raw(),
-        **chat_completion_kwargs,
-    )
-    logger.debug(f"Response: {response}")
+        if hasattr(response, "error"):
+            logger.error(response.error)
+            raise RuntimeError(response.error)
 
-    if hasattr(response, "error"):
-        logger.error(response.error)
-        raise RuntimeError(response.error)
+        first_message = response.choices[0].message
+        if request.cache_key:
+            request.cache.put(request.cache_key, first_message.to_dict_recursive())
 
-    first_message = response.choices[0].message
     content: str | None = first_message.get("content")
     function_call: OpenAIFunctionCall | None = first_message.get("function_call")
 
@@ -170,7 +399,7 @@ def create_chat_completion(
         content, function_call = plugin.on_response(content, function_call)
 
     return ChatModelResponse(
-        model_info=OPEN_AI_CHAT_MODELS[model],
+        model_info=OPEN_AI_CHAT_MODELS[request.model],
         content=content,
         function_call=function_call,
     )
@@ -182,14 +411,14 @@ def check_model(
     config: Config,
 ) -> str:
     """Check if model is available for use. If not, return gpt-3.5-turbo."""
-    openai_credentials = {
-        "api_key": config.openai_api_key,
-    }
-    if config.use_azure:
-        openai_credentials.update(config.get_azure_kwargs(model_name))
+    openai_credentials = config.get_openai_credentials(model_name)
 
     api_manager = ApiManager()
-    models = api_manager.get_models(**openai_credentials)
+    models = api_manager.get_models(
+        cache_file=config.openai_models_cache_file,
+        cache_ttl=config.openai_models_cache_ttl,
+        **openai_credentials,
+    )
 
     if any(model_name in m["id"] for m in models):
         return model_name
@@ -1,16 +1,95 @@
 """Functions for counting the number of tokens in a message or string."""
 from __future__ import annotations
 
-from typing import List
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
 
 import tiktoken
 
 from autogpt.llm.base import Message
 from autogpt.logs import logger
 
+TIKTOKEN_CACHE_DIR = os.path.join(
+    os.path.dirname(__file__), "../../..", "data", "tiktoken_cache"
+)
+# tiktoken downloads its BPE files on first use and by default keeps them in a
+# temporary directory. Keep them with the other data, so later runs start offline.
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.abspath(TIKTOKEN_CACHE_DIR))
+
+TOKEN_COUNT_CACHE_SIZE = 16384
+"""Maximum number of token counts to remember"""
+
+BATCH_ENCODING_MIN_SIZE = 8
+"""Minimum number of uncounted strings for which to encode on multiple threads"""
+
+BATCH_ENCODING_THREADS = 4
+
+
+class _TokenCountCache:
+    """Thread-safe LRU cache of token counts, keyed by encoding and content hash"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._counts: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(encoding: tiktoken.Encoding, text: str) -> tuple[str, bytes]:
+        digest = hashlib.blake2b(
+            text.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        return encoding.name, digest
+
+    def get(self, key: tuple[str, bytes]) -> Optional[int]:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def put(self, key: tuple[str, bytes], count: int) -> None:
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+_token_counts = _TokenCountCache(TOKEN_COUNT_CACHE_SIZE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model_name: str) -> tiktoken.Encoding:
+    """
+    Returns the tokenizer for a model, resolving it only once per model.
+
+    Args:
+        model_name (str): The name of the model (e.g., "gpt-3.5-turbo")
+
+    Returns:
+        tiktoken.Encoding: The encoding of the model, or cl100k_base if the model
+            is not known to tiktoken.
+    """
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        logger.warn(f"Warning: model {model_name} not found. Using cl100k_base.")
+        return tiktoken.get_encoding("cl100k_base")
+
 
 def count_message_tokens(
-    messages: List[Message], model: str = "gpt-3.5-turbo-0301"
+    messages: List[Message],
+    model: str = "gpt-3.5-turbo-0301",
+    functions: Optional[List[dict]] = None,
 ) -> int:
     """
     Returns the number of tokens used by a list of messages.
@@ -20,6 +99,7 @@ def count_message_tokens(
             containing the role and content of the message.
         model (str): The name of the model to use for tokenization.
             Defaults to "gpt-3.5-turbo-0301".
+        functions (list, optional): The function specs sent along with the messages.
 
     Returns:
         int: The number of tokens used by the list of messages.
@@ -40,23 +120,42 @@ def count_message_tokens(
             " See https://github.com/openai/openai-python/blob/main/chatml.md for"
             " information on how messages are converted to tokens."
         )
-    try:
-        encoding = tiktoken.encoding_for_model(encoding_model)
-    except KeyError:
-        logger.warn("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
 
     num_tokens = 0
+    values = []
     for message in messages:
         num_tokens += tokens_per_message
         for key, value in message.raw().items():
-            num_tokens += len(encoding.encode(value))
+            values.append(value)
             if key == "name":
                 num_tokens += tokens_per_name
+    num_tokens += sum(count_string_tokens_batch(values, encoding_model))
     num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+    if functions:
+        num_tokens += count_function_tokens(functions, encoding_model)
+        if any(message.role == "system" for message in messages):
+            num_tokens -= 4  # the function definitions share the system message
     return num_tokens
 
 
+def count_function_tokens(functions: List[dict], model_name: str) -> int:
+    """
+    Returns the number of tokens that function specs add to a chat prompt.
+
+    The API injects the function specs into the system message as TypeScript type
+    definitions, so they are counted in that format instead of as JSON.
+
+    Args:
+        functions (list): The function specs, as sent to the API.
+        model_name (str): The name of the encoding to use. (e.g., "gpt-3.5-turbo")
+
+    Returns:
+        int: The number of tokens used by the function specs.
+    """
+    definitions = _format_function_definitions(functions)
+    return count_string_tokens(definitions, model_name) + 9
+
+
 def count_string_tokens(string: str, model_name: str) -> int:
     """
     Returns the number of tokens in a text string.
@@ -68,5 +167,87 @@ def count_string_tokens(string: str, model_name: str) -> int:
     Returns:
         int: The number of tokens in the text string.
     """
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(string))
+    encoding = get_tokenizer(model_name)
+    key = _token_counts.make_key(encoding, string)
+    count = _token_counts.get(key)
+    if count is None:
+        count = len(encoding.encode(string))
+        _token_counts.put(key, count)
+    return count
+
+
+def count_string_tokens_batch(strings: List[str], model_name: str) -> List[int]:
+    """
+    Returns the number of tokens in each of a list of text strings.
+
+    Strings that have not been counted before are encoded together, on multiple
+    threads if there are enough of them.
+
+    Args:
+        strings (list): The text strings.
+        model_name (str): The name of the encoding to use. (e.g., "gpt-3.5-turbo")
+
+    Returns:
+        list: The number of tokens in each text string.
+    """
+    encoding = get_tokenizer(model_name)
+    keys = [_token_counts.make_key(encoding, string) for string in strings]
+    counts = [_token_counts.get(key) for key in keys]
+
+    uncounted = {k: s for k, s, c in zip(keys, strings, counts) if c is None}
+    if not uncounted:
+        return counts
+
+    texts = list(uncounted.values())
+    if len(texts) >= BATCH_ENCODING_MIN_SIZE:
+        tokens = encoding.encode_batch(texts, num_threads=BATCH_ENCODING_THREADS)
+    else:
+        tokens = [encoding.encode(text) for text in texts]
+
+    new_counts = {}
+    for key, text_tokens in zip(uncounted, tokens):
+        new_counts[key] = len(text_tokens)
+        _token_counts.put(key, len(text_tokens))
+    return [new_counts[k] if c is None else c for k, c in zip(keys, counts)]
+
+
+def _format_function_definitions(functions: List[dict]) -> str:
+    lines = ["namespace functions {", ""]
+    for function in functions:
+        if function.get("description"):
+            lines.append(f"// {function['description']}")
+        parameters = function.get("parameters") or {}
+        if parameters.get("properties"):
+            lines.append(f"type {function['name']} = (_: {{")
+            lines.append(_format_object_properties(parameters, 0))
+            lines.append("}) => any;")
+        else:
+            lines.append(f"type {function['name']} = () => any;")
+        lines.append("")
+    lines.append("} // namespace functions")
+    return "\n".join(lines)
+
+
+def _format_object_properties(schema: dict, indent: int) -> str:
+    required = schema.get("required") or []
+    lines = []
+    for name, param in schema.get("properties", {}).items():
+        if param.get("description") and indent < 2:
+            lines.append(f"// {param['description']}")
+        optional = "" if name in required else "?"
+        lines.append(f"{name}{optional}: {_format_type(param, indent)},")
+    return "\n".join(" " * indent + line for line in lines)
+
+
+def _format_type(param: dict, indent: int) -> str:
+    type = param.get("type")
+    if type in ("string", "number", "integer") and "enum" in param:
+        return " | ".join(json.dumps(value) for value in param["enum"])
+    if type == "integer":
+        return "number"
+    if type == "array":
+        items = param.get("items")
+        return f"{_format_type(items, indent)}[]" if items else "any[]"
+    if type == "object":
+        return "{\n" + _format_object_properties(param, indent + 2) + "\n}"
+    return str(type or "any")
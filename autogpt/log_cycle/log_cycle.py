@@ -13,6 +13,7 @@ SUMMARY_FILE_NAME = "summary.txt"
 SUPERVISOR_FEEDBACK_FILE_NAME = "supervisor_feedback.txt"
 PROMPT_SUPERVISOR_FEEDBACK_FILE_NAME = "prompt_supervisor_feedback.json"
 USER_INPUT_FILE_NAME = "user_input.txt"
+CONTEXT_ROUTE_FILE_NAME = "context_route.json"
 
 
 class LogCycleHandler:
@@ -9,6 +9,11 @@ from colorama import Fore, Style
 from autogpt.agent import Agent
 from autogpt.config.config import ConfigBuilder, check_openai_api_key
 from autogpt.configurator import create_config
+from autogpt.llm.providers.openai import (
+    configure_hedging,
+    configure_http_session,
+    configure_rate_limiter,
+)
 from autogpt.logs import logger
 from autogpt.memory.vector import get_memory
 from autogpt.models.command_registry import CommandRegistry
@@ -82,6 +87,9 @@ def run_auto_gpt(
         allow_downloads,
         skip_news,
     )
+    configure_http_session(config)
+    configure_rate_limiter(config)
+    configure_hedging(config)
 
     if config.continuous_mode:
         for line in get_legal_warning().split("\n"):
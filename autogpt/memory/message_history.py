@@ -1,21 +1,34 @@
 from __future__ import annotations
 
+import bisect
+import contextvars
 import copy
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator, Optional, Sequence
 
 if TYPE_CHECKING:
     from autogpt.agent import Agent
 
 from autogpt.config import Config
 from autogpt.json_utils.utilities import extract_json_from_response
+from autogpt.llm.auxiliary import auxiliary_request
 from autogpt.llm.base import ChatSequence, Message, MessageRole, MessageType
+from autogpt.llm.priority import RequestPriority, request_priority
 from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS
-from autogpt.llm.utils import count_string_tokens, create_chat_completion
+from autogpt.llm.utils import (
+    count_message_tokens,
+    count_string_tokens,
+    count_string_tokens_batch,
+    create_chat_completion,
+)
 from autogpt.log_cycle.log_cycle import PROMPT_SUMMARY_FILE_NAME, SUMMARY_FILE_NAME
 from autogpt.logs import logger
 
+Cycle = tuple[Optional[Message], Message, Message]
+
 
 @dataclass
 class MessageHistory:
@@ -26,6 +39,41 @@ class MessageHistory:
 
     last_trimmed_index: int = 0
 
+    # Index of the valid (user input, AI response, action result) cycles, as message
+    # indexes, and the parsed AI responses, by message index. Kept up to date on append.
+    _cycles: list[tuple[Optional[int], int, int]] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+    _parsed_responses: dict[int, dict] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _indexed_count: int = field(default=0, init=False, repr=False, compare=False)
+    _indexed_messages: Optional[list[Message]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # Token counts of the messages by model, without the tokens that prime the reply,
+    # and of the indexed cycles by model, with the prefix sums of the latter
+    _message_tokens: dict[str, list[int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _cycle_tokens: dict[str, list[int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _prefix_sums: dict[str, list[int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _lock: threading.RLock = field(
+        default_factory=threading.RLock, init=False, repr=False, compare=False
+    )
+    # Updates of the running summary in progress, oldest first, with the number of
+    # cycles each adds to the summary
+    _summary_updates: list[tuple[Future, int]] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+    _summary_executor: Optional[ThreadPoolExecutor] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
     def __getitem__(self, i: int):
         return self.messages[i]
 
@@ -44,7 +92,70 @@ class MessageHistory:
         return self.append(Message(role, content, type))
 
     def append(self, message: Message):
-        return self.messages.append(message)
+        with self._lock:
+            self.messages.append(message)
+            self._update_cycle_index()
+
+    @property
+    def cycles(self) -> Sequence[Cycle]:
+        """The valid (user input, AI response, action result) cycles, oldest first.
+        The user input is None if there is none right before the AI response."""
+        with self._lock:
+            self._update_cycle_index()
+            return _CycleView(self.messages, self._cycles[:])
+
+    def parsed_response(self, index: int) -> dict:
+        """Get the parsed JSON of the AI response at `index` in the history"""
+        with self._lock:
+            self._update_cycle_index()
+            if index not in self._parsed_responses:
+                self._parsed_responses[index] = extract_json_from_response(
+                    self.messages[index].content
+                )
+            return self._parsed_responses[index]
+
+    def _reset_index_if_replaced(self) -> None:
+        """Drop the index and token counts if the messages have been replaced rather
+        than appended to"""
+        if (
+            self._indexed_messages is not self.messages
+            or self._indexed_count > len(self.messages)
+        ):
+            self._cycles.clear()
+            self._parsed_responses.clear()
+            self._message_tokens.clear()
+            self._cycle_tokens.clear()
+            self._prefix_sums.clear()
+            self._indexed_count = 0
+            self._indexed_messages = self.messages
+
+    def _update_cycle_index(self) -> None:
+        """Index the cycles completed by the messages added since the last update"""
+        self._reset_index_if_replaced()
+        messages = self.messages
+        # A cycle is complete once the message after the AI response is added
+        for i in range(max(self._indexed_count - 1, 0), len(messages) - 1):
+            ai_message = messages[i]
+            if ai_message.type != "ai_response":
+                continue
+            user_index = i - 1 if i > 0 and messages[i - 1].role == "user" else None
+            result_message = messages[i + 1]
+            if i not in self._parsed_responses:
+                self._parsed_responses[i] = extract_json_from_response(
+                    ai_message.content
+                )
+            try:
+                assert (
+                    self._parsed_responses[i] != {}
+                ), "AI response is not a valid JSON object"
+                assert result_message.type == "action_result"
+
+                self._cycles.append((user_index, i, i + 1))
+            except AssertionError as err:
+                logger.debug(
+                    f"Invalid item in message history: {err}; Messages: {messages[i-1:i+2]}"
+                )
+        self._indexed_count = len(messages)
 
     def trim_messages(
         self, current_message_chain: list[Message], config: Config
@@ -53,36 +164,90 @@ class MessageHistory:
         Returns a list of trimmed messages: messages which are in the message history
         but not in current_message_chain.
 
+        The trimmed messages are added to the running summary in the background. The
+        returned summary only waits for that if it would otherwise lag behind by more
+        than `config.running_summary_max_lag` cycles.
+
         Args:
             current_message_chain (list[Message]): The messages currently in the context.
             config (Config): The config to use.
 
         Returns:
-            Message: A message with the new running summary after adding the trimmed messages.
+            Message: A message with the latest running summary.
             list[Message]: A list of messages that are in full_message_history with an index higher than last_trimmed_index and absent from current_message_chain.
         """
         # Select messages in full_message_history with an index higher than last_trimmed_index
-        new_messages = [
-            msg for i, msg in enumerate(self) if i > self.last_trimmed_index
-        ]
-
-        # Remove messages that are already present in current_message_chain
-        new_messages_not_in_chain = [
-            msg for msg in new_messages if msg not in current_message_chain
+        new_message_indexes = range(self.last_trimmed_index + 1, len(self.messages))
+
+        # Remove messages that are already present in current_message_chain. Messages
+        # are matched by value, like Message equality, but through a set lookup rather
+        # than a scan of the chain per message.
+        chain_keys = {_message_key(m) for m in current_message_chain}
+        trimmed_indexes = [
+            i
+            for i in new_message_indexes
+            if _message_key(self.messages[i]) not in chain_keys
         ]
+        new_messages_not_in_chain = [self.messages[i] for i in trimmed_indexes]
 
         if not new_messages_not_in_chain:
+            self.wait_for_summary(config.running_summary_max_lag)
             return self.summary_message(), []
 
-        new_summary_message = self.update_running_summary(
-            new_events=new_messages_not_in_chain, config=config
+        # Reuse the AI responses parsed by the cycle index
+        self._submit_summary_update(
+            new_events=new_messages_not_in_chain,
+            config=config,
+            parsed_responses=[
+                self.parsed_response(i)
+                if self.messages[i].role == "assistant"
+                else None
+                for i in trimmed_indexes
+            ],
         )
 
-        # Find the index of the last message processed
-        last_message = new_messages_not_in_chain[-1]
-        self.last_trimmed_index = self.messages.index(last_message)
+        self.last_trimmed_index = trimmed_indexes[-1]
+
+        self.wait_for_summary(config.running_summary_max_lag)
+        return self.summary_message(), new_messages_not_in_chain
 
-        return new_summary_message, new_messages_not_in_chain
+    def wait_for_summary(self, max_lag: int = 0) -> None:
+        """Wait until the running summary lags behind the trimmed messages by at most
+        `max_lag` cycles, and raise the error of any update that failed meanwhile."""
+        while self._summary_updates:
+            future, _ = self._summary_updates[0]
+            lag = sum(cycle_count for _, cycle_count in self._summary_updates)
+            if not future.done():
+                if lag <= max_lag:
+                    return
+                logger.debug(
+                    f"Waiting for the running summary, which lags {lag} cycles behind"
+                )
+            self._summary_updates.pop(0)
+            future.result()
+
+    def _submit_summary_update(
+        self,
+        new_events: list[Message],
+        config: Config,
+        parsed_responses: list[Optional[dict]],
+    ) -> None:
+        """Start update_running_summary in the background. Updates run one at a time,
+        in the order in which they are submitted."""
+        if self._summary_executor is None:
+            self._summary_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="running_summary"
+            )
+        cycle_count = sum(event.type == "ai_response" for event in new_events)
+        context = contextvars.copy_context()
+        future = self._summary_executor.submit(
+            context.run,
+            self.update_running_summary,
+            new_events,
+            config,
+            parsed_responses,
+        )
+        self._summary_updates.append((future, cycle_count))
 
     def per_cycle(self, config: Config, messages: list[Message] | None = None):
         """
@@ -91,26 +256,75 @@ class MessageHistory:
             Message: a message from the AI containing a proposed action
             Message: the message containing the result of the AI's proposed action
         """
-        messages = messages or self.messages
-        for i in range(0, len(messages) - 1):
-            ai_message = messages[i]
-            if ai_message.type != "ai_response":
-                continue
-            user_message = (
-                messages[i - 1] if i > 0 and messages[i - 1].role == "user" else None
+        if not messages or messages is self.messages:
+            yield from self.cycles
+            return
+
+        for user_index, ai_index, result_index in _iter_cycle_indexes(messages):
+            yield (
+                messages[user_index] if user_index is not None else None,
+                messages[ai_index],
+                messages[result_index],
             )
-            result_message = messages[i + 1]
-            try:
-                assert (
-                    extract_json_from_response(ai_message.content) != {}
-                ), "AI response is not a valid JSON object"
-                assert result_message.type == "action_result"
 
-                yield user_message, ai_message, result_message
-            except AssertionError as err:
-                logger.debug(
-                    f"Invalid item in message history: {err}; Messages: {messages[i-1:i+2]}"
-                )
+    def context_window(
+        self, config: Config, model: str, token_budget: int
+    ) -> tuple[list[Message], int]:
+        """Get the messages of the most recent cycles that together fit in a prompt.
+
+        Whole cycles are taken, newest first, until the next one wouldn't fit. The
+        token counts of the messages are kept, so only messages that haven't been
+        counted for `model` yet are tokenized, and the window is found by binary
+        search on the prefix sums of the token counts of the cycles, which are
+        extended as cycles are added.
+
+        Args:
+            config: The config to use.
+            model: The model for which to count the tokens.
+            token_budget: The number of tokens the messages may add to the prompt.
+
+        Returns:
+            list[Message]: The messages of the cycles in the window, oldest first.
+            int: The number of tokens the messages add to the prompt.
+        """
+        with self._lock:
+            self._count_message_tokens(model)
+            prefix_sums = self._prefix_sums[model]
+            total_tokens = prefix_sums[-1]
+            start = min(
+                bisect.bisect_left(prefix_sums, total_tokens - token_budget),
+                len(self._cycles),
+            )
+
+            messages = [
+                self.messages[i]
+                for cycle in self._cycles[start:]
+                for i in cycle
+                if i is not None
+            ]
+            return messages, total_tokens - prefix_sums[start]
+
+    def prepare_context(self, model: str) -> None:
+        """Count the tokens of the messages that haven't been counted for `model` yet,
+        e.g. while the command of the current cycle is executing"""
+        with self._lock:
+            self._count_message_tokens(model)
+
+    def _count_message_tokens(self, model: str) -> None:
+        """Count the tokens of the messages and cycles added since the last count for
+        `model`"""
+        self._update_cycle_index()
+        message_tokens = self._message_tokens.setdefault(model, [])
+        for message in self.messages[len(message_tokens) :]:
+            message_tokens.append(count_message_tokens([message], model) - 3)
+
+        cycle_tokens = self._cycle_tokens.setdefault(model, [])
+        prefix_sums = self._prefix_sums.setdefault(model, [0])
+        for cycle in self._cycles[len(cycle_tokens) :]:
+            # count_message_tokens() counts the 3 tokens that prime the reply once
+            tokens = sum(message_tokens[i] for i in cycle if i is not None) + 3
+            cycle_tokens.append(tokens)
+            prefix_sums.append(prefix_sums[-1] + tokens)
 
     def summary_message(self) -> Message:
         return Message(
@@ -119,7 +333,10 @@ class MessageHistory:
         )
 
     def update_running_summary(
-        self, new_events: list[Message], config: Config
+        self,
+        new_events: list[Message],
+        config: Config,
+        parsed_responses: Optional[list[Optional[dict]]] = None,
     ) -> Message:
         """
         This function takes a list of dictionaries representing new events and combines them with the current summary,
@@ -128,6 +345,7 @@ class MessageHistory:
 
         Args:
             new_events (List[Dict]): A list of dictionaries containing the latest events to be added to the summary.
+            parsed_responses (List[Dict], optional): The already parsed JSON content of the events from the assistant, or None for the other events.
 
         Returns:
             str: A message containing the updated summary of actions, formatted in the 1st person past tense.
@@ -142,6 +360,11 @@ class MessageHistory:
 
         # Create a copy of the new_events list to prevent modifying the original list
         new_events = copy.deepcopy(new_events)
+        parsed_by_event = {
+            id(event): parsed
+            for event, parsed in zip(new_events, parsed_responses or [])
+            if parsed is not None
+        }
 
         # Replace "assistant" with "you". This produces much better first person past tense results.
         for event in new_events:
@@ -150,7 +373,10 @@ class MessageHistory:
 
                 # Remove "thoughts" dictionary from "content"
                 try:
-                    content_dict = extract_json_from_response(event.content)
+                    if id(event) in parsed_by_event:
+                        content_dict = copy.copy(parsed_by_event[id(event)])
+                    else:
+                        content_dict = extract_json_from_response(event.content)
                     if "thoughts" in content_dict:
                         del content_dict["thoughts"]
                     event.content = json.dumps(content_dict)
@@ -177,8 +403,10 @@ class MessageHistory:
         batch_tlength = 0
 
         # TODO Can put a cap on length of total new events and drop some previous events to save API cost, but need to think thru more how to do it without losing the context
-        for event in new_events:
-            event_tlength = count_string_tokens(str(event), config.fast_llm)
+        event_tlengths = count_string_tokens_batch(
+            [str(event) for event in new_events], config.fast_llm
+        )
+        for event, event_tlength in zip(new_events, event_tlengths):
 
             if (
                 batch_tlength + event_tlength
@@ -201,6 +429,8 @@ class MessageHistory:
 
         return self.summary_message()
 
+    @auxiliary_request()
+    @request_priority(RequestPriority.SUMMARY)
     def summarize_batch(self, new_events_batch, config):
         prompt = f'''Your task is to create a concise running summary of actions and information results in the provided text, focusing on key and potentially important information to remember.
 
@@ -235,3 +465,64 @@ Latest Development:
             self.summary,
             SUMMARY_FILE_NAME,
         )
+
+
+def _message_key(message: Message) -> tuple:
+    """Get a hashable key of a message that is equal for equal messages"""
+    content = message.content
+    try:
+        hash(content)
+    except TypeError:
+        content = repr(content)
+    return (message.role, content, message.type)
+
+
+def _iter_cycle_indexes(
+    messages: list[Message],
+) -> Iterator[tuple[Optional[int], int, int]]:
+    """Yield the indexes of the (user input, AI response, action result) messages of
+    each valid cycle in `messages`. The index of the user input is None if there is
+    no user input right before the AI response."""
+    for i in range(0, len(messages) - 1):
+        ai_message = messages[i]
+        if ai_message.type != "ai_response":
+            continue
+        user_index = i - 1 if i > 0 and messages[i - 1].role == "user" else None
+        result_message = messages[i + 1]
+        try:
+            assert (
+                extract_json_from_response(ai_message.content) != {}
+            ), "AI response is not a valid JSON object"
+            assert result_message.type == "action_result"
+
+            yield user_index, i, i + 1
+        except AssertionError as err:
+            logger.debug(
+                f"Invalid item in message history: {err}; Messages: {messages[i-1:i+2]}"
+            )
+
+
+class _CycleView(Sequence[Cycle]):
+    """The cycles of a list of messages, by their message indexes"""
+
+    def __init__(
+        self, messages: list[Message], indexes: list[tuple[Optional[int], int, int]]
+    ):
+        self._messages = messages
+        self._indexes = indexes
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return _CycleView(self._messages, self._indexes[i])
+        user_index, ai_index, result_index = self._indexes[i]
+        return (
+            self._messages[user_index] if user_index is not None else None,
+            self._messages[ai_index],
+            self._messages[result_index],
+        )
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
@@ -0,0 +1,179 @@
+"""Coalesces concurrent embedding requests into batched API calls"""
+from __future__ import annotations
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterable, Optional, Sequence
+
+import numpy as np
+
+from autogpt.logs import logger
+
+EmbedBatch = Callable[[list[str]], Sequence]
+"""Function which embeds a list of texts in a single API call"""
+
+ChunkText = Callable[[str], Iterable[tuple[str, int]]]
+"""Function which splits a text into (chunk, token count) pairs that fit the model"""
+
+
+class EmbeddingBatcher:
+    """Queues texts to be embedded and sends them to the API in batches.
+
+    The first text to arrive starts a batch, which is sent once `max_batch_size` texts
+    have been queued or `max_wait` seconds have passed, whichever comes first. Each
+    caller then gets the embedding of its own text back.
+
+    Texts longer than the per-input token limit of the model are split into chunks
+    with `chunk_text`, which are batched like other texts, and get the average of the
+    embeddings of their chunks, weighted by the token count of each chunk.
+
+    A batch only serves callers with the same context, and is sent in that context,
+    so that e.g. the agent to which the API usage is attributed and the request
+    priority are kept. Queued texts of callers with different contexts are sent in
+    separate calls.
+
+    Args:
+        embed_batch: Function which embeds a list of texts in one API call.
+        max_batch_size: Maximum number of texts per API call.
+        max_wait: Seconds to wait for more texts before sending a batch.
+        max_input_tokens: Maximum number of tokens per input text.
+        count_tokens: Function to count the tokens in a text.
+        chunk_text: Function to split a text that has too many tokens into chunks.
+            Without it, such texts are sent on their own, as they are.
+    """
+
+    def __init__(
+        self,
+        embed_batch: EmbedBatch,
+        max_batch_size: int = 256,
+        max_wait: float = 0.005,
+        max_input_tokens: int = 8191,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        chunk_text: Optional[ChunkText] = None,
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_input_tokens = max_input_tokens
+        self.count_tokens = count_tokens
+        self.chunk_text = chunk_text
+        self._queue: queue.SimpleQueue[
+            tuple[str, Future, contextvars.Context]
+        ] = queue.SimpleQueue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str):
+        """Get the embedding for a single text"""
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: list[str]) -> list:
+        """Get the embeddings for a list of texts, which may be split over batches"""
+        context = contextvars.copy_context()
+        pending = []
+        for text in texts:
+            if not self._is_oversized(text):
+                pending.append(self._submit(text, context))
+            elif self.chunk_text:
+                chunks = list(self.chunk_text(text))
+                pending.append(
+                    (
+                        [self._submit(chunk, context) for chunk, _ in chunks],
+                        [tokens for _, tokens in chunks],
+                    )
+                )
+            else:
+                future = Future()
+                future.set_result(self.embed_batch([text])[0])
+                pending.append(future)
+
+        embeddings = []
+        for item in pending:
+            if isinstance(item, Future):
+                embeddings.append(item.result())
+            else:
+                futures, weights = item
+                embeddings.append(
+                    _combine_embeddings([f.result() for f in futures], weights)
+                )
+        return embeddings
+
+    def _is_oversized(self, text: str) -> bool:
+        # Every token is at least one byte, so only long texts need to be counted
+        if len(text.encode("utf-8")) <= self.max_input_tokens:
+            return False
+        return bool(self.count_tokens) and (
+            self.count_tokens(text) > self.max_input_tokens
+        )
+
+    def _submit(self, text: str, context: contextvars.Context) -> Future:
+        future = Future()
+        self._queue.put((text, future, context))
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._dispatcher.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # Send the batches from other threads, so the next one can be collected
+            for context, group in _group_by_context(batch):
+                threading.Thread(
+                    target=context.copy().run,
+                    args=(self._dispatch, group),
+                    name="embedding-batch",
+                    daemon=True,
+                ).start()
+
+    def _dispatch(self, batch: list[tuple[str, Future]]) -> None:
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        logger.debug(
+            f"Embedding {len(unique_texts)} texts for {len(batch)} requests in one call"
+        )
+        try:
+            embeddings = dict(zip(unique_texts, self.embed_batch(unique_texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            future.set_result(embeddings[text])
+
+
+def _group_by_context(
+    batch: list[tuple[str, Future, contextvars.Context]]
+) -> list[tuple[contextvars.Context, list[tuple[str, Future]]]]:
+    """Split a batch into the texts of callers with equal contexts"""
+    groups: list[tuple[contextvars.Context, list[tuple[str, Future]]]] = []
+    for text, future, context in batch:
+        for group_context, group in groups:
+            if group_context is context or group_context == context:
+                group.append((text, future))
+                break
+        else:
+            groups.append((context, [(text, future)]))
+    return groups
+
+
+def _combine_embeddings(embeddings: list, weights: list[int]) -> list[float]:
+    """Average the embeddings of the chunks of a text, scaled to unit length like the
+    embeddings returned by the API"""
+    average = np.average(np.array(embeddings, dtype=float), axis=0, weights=weights)
+    norm = np.linalg.norm(average)
+    return (average / norm if norm else average).tolist()
@@ -67,8 +67,6 @@ class MemoryItem:
         ]
         logger.debug("Chunk summaries: " + str(chunk_summaries))
 
-        e_chunks = get_embedding(chunks, config)
-
         summary = (
             chunk_summaries[0]
             if len(chunks) == 1
@@ -81,9 +79,10 @@ class MemoryItem:
         )
         logger.debug("Total summary: " + summary)
 
+        # Embed the chunks and the summary in a single API call
         # TODO: investigate search performance of weighted average vs summary
         # e_average = np.average(e_chunks, axis=0, weights=[len(c) for c in chunks])
-        e_summary = get_embedding(summary, config)
+        *e_chunks, e_summary = get_embedding(chunks + [summary], config)
 
         metadata["source_type"] = source_type
 
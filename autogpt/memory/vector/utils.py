@@ -1,11 +1,20 @@
+import asyncio
+import json
+import threading
 from typing import Any, overload
 
 import numpy as np
 
 from autogpt.config import Config
+from autogpt.core.resource.model_providers.embedding_cache import get_embedding_cache
 from autogpt.llm.base import TText
 from autogpt.llm.providers import openai as iopenai
+from autogpt.llm.single_flight import single_flight
+from autogpt.llm.utils import count_string_tokens
 from autogpt.logs import logger
+from autogpt.processing.text import chunk_content
+
+from .embedding_batcher import EmbeddingBatcher
 
 Embedding = list[np.float32] | np.ndarray[Any, np.dtype[np.float32]]
 """Embedding vector"""
@@ -33,6 +42,53 @@ def get_embedding(
     Returns:
         List[float]: The embedding.
     """
+    input, multiple, kwargs = _prepare_embedding_request(input, config)
+
+    if isinstance(input, str) or (multiple and isinstance(input[0], str)):
+        texts = input if multiple else [input]
+        embeddings = _get_text_embeddings(texts, config, kwargs)
+        return embeddings if multiple else embeddings[0]
+
+    if not multiple:
+        return _create_embeddings([input], kwargs)[0]
+    return _create_embeddings(input, kwargs)
+
+
+async def aget_embedding(
+    input: str | TText | list[str] | list[TText], config: Config
+) -> Embedding | list[Embedding]:
+    """Get an embedding from the ada model, without blocking the event loop.
+
+    Texts are looked up in the embedding cache like in `get_embedding`, but the
+    missing ones are sent straight to the API instead of through the batcher: a
+    caller on an event loop can gather its embedding requests itself.
+
+    Args:
+        input: Input text to get embeddings for, encoded as a string or array of tokens.
+            Multiple inputs may be given as a list of strings or token arrays.
+
+    Returns:
+        List[float]: The embedding.
+    """
+    input, multiple, kwargs = _prepare_embedding_request(input, config)
+    inputs = input if multiple else [input]
+
+    if isinstance(inputs[0], str):
+        embeddings = await _aget_text_embeddings(inputs, config, kwargs)
+    else:
+        embeddings = await _acreate_embeddings(inputs, kwargs)
+    return embeddings if multiple else embeddings[0]
+
+
+def _prepare_embedding_request(
+    input: str | TText | list[str] | list[TText], config: Config
+) -> tuple[str | TText | list[str] | list[TText], bool, dict[str, Any]]:
+    """Normalize the input of an embedding request and get the API call arguments
+
+    Returns:
+        The normalized input, whether it holds multiple inputs, and the kwargs for
+        the API call.
+    """
     multiple = isinstance(input, list) and all(not isinstance(i, int) for i in input)
 
     if isinstance(input, str):
@@ -41,27 +97,114 @@ def get_embedding(
         input = [text.replace("\n", " ") for text in input]
 
     model = config.embedding_model
-    if config.use_azure:
-        kwargs = config.get_azure_kwargs(model)
-    else:
-        kwargs = {"model": model}
+    kwargs = config.get_openai_credentials(model)
+    if not config.use_azure:
+        kwargs["model"] = model
 
     logger.debug(
         f"Getting embedding{f's for {len(input)} inputs' if multiple else ''}"
         f" with model '{model}'"
         + (f" via Azure deployment '{kwargs['engine']}'" if config.use_azure else "")
     )
-    if config.use_azure:
-        breakpoint()
-
-    embeddings = iopenai.create_embedding(
-        input,
-        **kwargs,
-        api_key=config.openai_api_key,
+    return input, multiple, kwargs
+
+
+def _get_text_embeddings(
+    texts: list[str], config: Config, kwargs: dict[str, Any]
+) -> list[Embedding]:
+    """Get the embeddings of texts from the embedding cache or the API"""
+    cache = None
+    embeddings: list[Embedding | None] = [None] * len(texts)
+    if config.embedding_cache:
+        cache = get_embedding_cache(
+            config.embedding_cache_file, config.embedding_cache_max_size_mb * 2**20
+        )
+        embeddings = cache.get_many(config.embedding_model, texts)
+
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+    if missing:
+        if config.embedding_batch_wait_ms > 0:
+            new_embeddings = _get_batcher(config, kwargs).embed_many(missing)
+        else:
+            new_embeddings = _create_embeddings(missing, kwargs)
+        if cache is not None:
+            cache.put_many(config.embedding_model, missing, new_embeddings)
+
+        created = dict(zip(missing, new_embeddings))
+        embeddings = [created[t] if e is None else e for t, e in zip(texts, embeddings)]
+    return embeddings
+
+
+def _create_embeddings(
+    input: list[str] | list[TText], kwargs: dict[str, Any]
+) -> list[Embedding]:
+    key = single_flight.make_key("embedding", input=input, **kwargs)
+    embeddings = single_flight.do(
+        key, lambda: iopenai.create_embedding(input, **kwargs)
     ).data
 
-    if not multiple:
-        return embeddings[0]["embedding"]
+    embeddings = sorted(embeddings, key=lambda x: x["index"])
+    return [d["embedding"] for d in embeddings]
+
+
+async def _aget_text_embeddings(
+    texts: list[str], config: Config, kwargs: dict[str, Any]
+) -> list[Embedding]:
+    """Async version of `_get_text_embeddings`, which doesn't use the batcher"""
+    cache = None
+    embeddings: list[Embedding | None] = [None] * len(texts)
+    if config.embedding_cache:
+        cache = get_embedding_cache(
+            config.embedding_cache_file, config.embedding_cache_max_size_mb * 2**20
+        )
+        embeddings = await asyncio.to_thread(
+            cache.get_many, config.embedding_model, texts
+        )
+
+    missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+    if missing:
+        new_embeddings = await _acreate_embeddings(missing, kwargs)
+        if cache is not None:
+            await asyncio.to_thread(
+                cache.put_many, config.embedding_model, missing, new_embeddings
+            )
+
+        created = dict(zip(missing, new_embeddings))
+        embeddings = [created[t] if e is None else e for t, e in zip(texts, embeddings)]
+    return embeddings
+
+
+async def _acreate_embeddings(
+    input: list[str] | list[TText], kwargs: dict[str, Any]
+) -> list[Embedding]:
+    key = single_flight.make_key("embedding", input=input, **kwargs)
+    embeddings = (
+        await single_flight.ado(key, lambda: iopenai.acreate_embedding(input, **kwargs))
+    ).data
 
     embeddings = sorted(embeddings, key=lambda x: x["index"])
     return [d["embedding"] for d in embeddings]
+
+
+_batchers: dict[str, EmbeddingBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def _get_batcher(config: Config, kwargs: dict[str, Any]) -> EmbeddingBatcher:
+    """Get the shared EmbeddingBatcher for a model and set of credentials"""
+    key = json.dumps(kwargs, sort_keys=True)
+    with _batchers_lock:
+        if key not in _batchers:
+            model = config.embedding_model
+            max_tokens = iopenai.OPEN_AI_EMBEDDING_MODELS[model].max_tokens
+            _batchers[key] = EmbeddingBatcher(
+                embed_batch=lambda texts: _create_embeddings(texts, kwargs),
+                max_batch_size=config.embedding_batch_max_size,
+                max_wait=config.embedding_batch_wait_ms / 1000,
+                max_input_tokens=max_tokens,
+                count_tokens=lambda text: count_string_tokens(text, model),
+                chunk_text=lambda text: chunk_content(
+                    text, model, max_tokens, with_overlap=False
+                ),
+            )
+        return _batchers[key]
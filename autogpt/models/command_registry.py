@@ -17,6 +17,8 @@ class CommandRegistry:
 
     commands: dict[str, Command] = {}
     commands_aliases: dict[str, Command] = {}
+    version: int = 0
+    """Incremented whenever a command is registered or unregistered"""
 
     def __contains__(self, command_name: str):
         return command_name in self.commands or command_name in self.commands_aliases
@@ -41,12 +43,14 @@ class CommandRegistry:
             )
         for alias in cmd.aliases:
             self.commands_aliases[alias] = cmd
+        CommandRegistry.version += 1
 
     def unregister(self, command: Command) -> None:
         if command.name in self.commands:
             del self.commands[command.name]
             for alias in command.aliases:
                 del self.commands_aliases[alias]
+            CommandRegistry.version += 1
         else:
             raise KeyError(f"Command '{command.name}' not found in registry.")
 
@@ -0,0 +1,193 @@
+"""Persistent cache of summaries, looked up by similarity of the summarized text"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from autogpt.logs import logger
+
+
+class SummaryCache:
+    """Disk-backed cache of summaries, keyed by the embedding of the summarized text.
+
+    A lookup returns the summary of the most similar cached text, if that is at least
+    as similar as the given cosine similarity threshold. This way a page that only
+    differs from an earlier visit in e.g. timestamps or ads doesn't have to be
+    summarized again. Entries are scoped by the summarization model and instruction,
+    and the least recently used entries are evicted above `max_entries`.
+
+    The normalized embeddings of a scope are kept in memory as a matrix, which is
+    loaded from the file on the first lookup and kept up to date on `put`, so that a
+    lookup doesn't have to read every embedding from the file.
+
+    Args:
+        file_path: Path of the SQLite file that holds the cache.
+        max_entries: Maximum number of cached summaries.
+    """
+
+    def __init__(self, file_path: str | Path, max_entries: int):
+        self.file_path = Path(file_path)
+        self.max_entries = max_entries
+
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Row ids and embedding matrices of the loaded scopes, by scope and dimension
+        self._matrices: dict[tuple[str, int], tuple[np.ndarray, np.ndarray]] = {}
+        self._connection = sqlite3.connect(
+            self.file_path, timeout=30, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " id INTEGER PRIMARY KEY,"
+                " scope TEXT NOT NULL,"
+                " embedding BLOB NOT NULL,"
+                " summary TEXT NOT NULL,"
+                " last_used REAL NOT NULL"
+                ")"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_scope ON summaries (scope)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_last_used"
+                " ON summaries (last_used)"
+            )
+        logger.debug(f"Initialized {__class__.__name__} at {self.file_path}")
+
+    @staticmethod
+    def make_scope(model: str, instruction: Optional[str]) -> str:
+        """Get the scope of the summaries made by `model` with `instruction`"""
+        return hashlib.sha256(f"{model}\0{instruction or ''}".encode()).hexdigest()
+
+    def get(
+        self, scope: str, embedding: Sequence[float], min_similarity: float
+    ) -> Optional[str]:
+        """Get the summary of the most similar cached text, if similar enough.
+
+        Args:
+            scope: The scope of the summary, see `make_scope`.
+            embedding: The embedding of the text to summarize.
+            min_similarity: The minimum cosine similarity of a cached text's embedding.
+        """
+        query = _normalize(embedding)
+        with self._lock, self._connection:
+            ids, vectors = self._get_matrix(scope, query.size)
+            if not len(ids):
+                return None
+
+            similarities = vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < min_similarity:
+                logger.debug(
+                    f"Summary cache miss: closest similarity {similarities[best]:.4f}"
+                )
+                return None
+
+            id = int(ids[best])
+            self._connection.execute(
+                "UPDATE summaries SET last_used = ? WHERE id = ?", (time.time(), id)
+            )
+            row = self._connection.execute(
+                "SELECT summary FROM summaries WHERE id = ?", (id,)
+            ).fetchone()
+            if row is None:
+                # Evicted by another process sharing the file; reload the scope
+                del self._matrices[(scope, query.size)]
+                return None
+        logger.debug(f"Summary cache hit: similarity {similarities[best]:.4f}")
+        return row[0]
+
+    def put(self, scope: str, embedding: Sequence[float], summary: str) -> None:
+        """Store a summary, evicting the least recently used ones if needed."""
+        vector = _normalize(embedding)
+        with self._lock, self._connection:
+            id = self._connection.execute(
+                "INSERT INTO summaries (scope, embedding, summary, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (scope, vector.tobytes(), summary, time.time()),
+            ).lastrowid
+            evicted_ids = [
+                evicted_id
+                for (evicted_id,) in self._connection.execute(
+                    "SELECT id FROM summaries ORDER BY last_used DESC"
+                    " LIMIT -1 OFFSET ?",
+                    (self.max_entries,),
+                )
+            ]
+            self._connection.executemany(
+                "DELETE FROM summaries WHERE id = ?", [(i,) for i in evicted_ids]
+            )
+
+            key = (scope, vector.size)
+            if key in self._matrices:
+                ids, vectors = self._matrices[key]
+                self._matrices[key] = (
+                    np.append(ids, id),
+                    np.vstack([vectors, vector]),
+                )
+            if evicted_ids:
+                for key, (ids, vectors) in self._matrices.items():
+                    keep = ~np.isin(ids, evicted_ids)
+                    self._matrices[key] = (ids[keep], vectors[keep])
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM summaries")
+            self._matrices.clear()
+
+    def _get_matrix(
+        self, scope: str, dimensions: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the row ids and the embedding matrix of a scope, loading them from the
+        file if they aren't in memory yet"""
+        key = (scope, dimensions)
+        if key not in self._matrices:
+            nbytes = dimensions * np.dtype(np.float32).itemsize
+            rows = [
+                row
+                for row in self._connection.execute(
+                    "SELECT id, embedding FROM summaries WHERE scope = ?", (scope,)
+                )
+                if len(row[1]) == nbytes
+            ]
+            ids = np.array([id for id, _ in rows], dtype=np.int64)
+            vectors = np.frombuffer(
+                b"".join(vector for _, vector in rows), dtype=np.float32
+            ).reshape(len(rows), dimensions)
+            self._matrices[key] = (ids, vectors)
+        return self._matrices[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM summaries"
+            ).fetchone()[0]
+
+
+def _normalize(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_caches: dict[Path, SummaryCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_summary_cache(file_path: str | Path, max_entries: int) -> SummaryCache:
+    """Get the shared SummaryCache for the given file, creating it if necessary."""
+    file_path = Path(file_path).resolve()
+    with _caches_lock:
+        if file_path not in _caches:
+            _caches[file_path] = SummaryCache(file_path, max_entries)
+        cache = _caches[file_path]
+    cache.max_entries = max_entries
+    return cache
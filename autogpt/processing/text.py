@@ -1,17 +1,31 @@
 """Text processing functions"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
 from math import ceil
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import spacy
-import tiktoken
 
 from autogpt.config import Config
 from autogpt.llm.base import ChatSequence
 from autogpt.llm.providers.openai import OPEN_AI_MODELS
-from autogpt.llm.utils import count_string_tokens, create_chat_completion
+from autogpt.llm.utils import (
+    acreate_chat_completion,
+    count_string_tokens,
+    count_string_tokens_batch,
+    create_chat_completion,
+    get_tokenizer,
+)
 from autogpt.logs import logger
 from autogpt.utils import batch
 
+from .summary_cache import SummaryCache, get_summary_cache
+
+if TYPE_CHECKING:
+    from autogpt.memory.vector.utils import Embedding
+
 
 def _max_chunk_length(model: str, max: Optional[int] = None) -> int:
     model_max_input_tokens = OPEN_AI_MODELS[model].max_tokens - 1
@@ -44,7 +58,7 @@ def chunk_content(
 
     max_chunk_length = max_chunk_length or _max_chunk_length(for_model)
 
-    tokenizer = tiktoken.encoding_for_model(for_model)
+    tokenizer = get_tokenizer(for_model)
 
     tokenized_text = tokenizer.encode(content)
     total_length = len(tokenized_text)
@@ -74,50 +88,26 @@ def summarize_text(
     Returns:
         str: The summary of the text
         list[(summary, chunk)]: Text chunks and their summary, if the text was chunked.
-            None otherwise.
+            None otherwise, or if the summary was taken from the summary cache.
     """
-    if not text:
-        raise ValueError("No text to summarize")
-
-    if instruction and question:
-        raise ValueError("Parameters 'question' and 'instructions' cannot both be set")
-
+    instruction = _get_summary_instruction(text, instruction, question)
     model = config.fast_llm
 
-    if question:
-        instruction = (
-            f'include any information that can be used to answer the question "{question}". '
-            "Do not directly answer the question itself"
-        )
-
-    summarization_prompt = ChatSequence.for_model(model)
-
-    token_length = count_string_tokens(text, model)
-    logger.info(f"Text length: {token_length} tokens")
+    cached = _lookup_cached_summary(text, model, instruction, config)
+    if cached and cached.summary is not None:
+        return cached.summary, None
 
-    # reserve 50 tokens for summary prompt, 500 for the response
-    max_chunk_length = _max_chunk_length(model) - 550
-    logger.info(f"Max chunk length: {max_chunk_length} tokens")
+    max_chunk_length = _max_summary_chunk_length(text, model)
 
     if not must_chunk_content(text, model, max_chunk_length):
-        # summarization_prompt.add("user", text)
-        summarization_prompt.add(
-            "user",
-            "Write a concise summary of the following text"
-            f"{f'; {instruction}' if instruction is not None else ''}:"
-            "\n\n\n"
-            f'LITERAL TEXT: """{text}"""'
-            "\n\n\n"
-            "CONCISE SUMMARY: The text is best summarized as"
-            # "Only respond with a concise summary or description of the user message."
-        )
-
-        logger.debug(f"Summarizing with {model}:\n{summarization_prompt.dump()}\n")
+        summarization_prompt = _get_summary_prompt(text, model, instruction)
         summary = create_chat_completion(
             prompt=summarization_prompt, config=config, temperature=0, max_tokens=500
         ).content
 
         logger.debug(f"\n{'-'*16} SUMMARY {'-'*17}\n{summary}\n{'-'*42}\n")
+        if cached:
+            cached.store(summary.strip())
         return summary.strip(), None
 
     summaries: list[str] = []
@@ -138,11 +128,184 @@ def summarize_text(
 
     summary, _ = summarize_text("\n\n".join(summaries), config)
 
+    if cached:
+        cached.store(summary.strip())
+    return summary.strip(), [
+        (summaries[i], chunks[i][0]) for i in range(0, len(chunks))
+    ]
+
+
+async def asummarize_text(
+    text: str,
+    config: Config,
+    instruction: Optional[str] = None,
+    question: Optional[str] = None,
+) -> tuple[str, None | list[tuple[str, str]]]:
+    """Summarize text using the OpenAI API, without blocking the event loop
+
+    Takes the same arguments and gives the same result as `summarize_text`, but the
+    chunks of a long text are summarized concurrently.
+    """
+    instruction = _get_summary_instruction(text, instruction, question)
+    model = config.fast_llm
+
+    cached = await _alookup_cached_summary(text, model, instruction, config)
+    if cached and cached.summary is not None:
+        return cached.summary, None
+
+    max_chunk_length = _max_summary_chunk_length(text, model)
+
+    if not must_chunk_content(text, model, max_chunk_length):
+        summarization_prompt = _get_summary_prompt(text, model, instruction)
+        summary = (
+            await acreate_chat_completion(
+                prompt=summarization_prompt,
+                config=config,
+                temperature=0,
+                max_tokens=500,
+            )
+        ).content
+
+        logger.debug(f"\n{'-'*16} SUMMARY {'-'*17}\n{summary}\n{'-'*42}\n")
+        if cached:
+            await asyncio.to_thread(cached.store, summary.strip())
+        return summary.strip(), None
+
+    # Sentence segmentation is CPU-bound, so it is done off the event loop
+    chunks = await asyncio.to_thread(
+        lambda: list(
+            split_text(
+                text, for_model=model, config=config, max_chunk_length=max_chunk_length
+            )
+        )
+    )
+
+    logger.info(f"Summarizing {len(chunks)} chunks concurrently")
+    results = await asyncio.gather(
+        *(asummarize_text(chunk, config, instruction) for chunk, _ in chunks)
+    )
+    summaries = [summary for summary, _ in results]
+
+    logger.info(f"Summarized {len(chunks)} chunks")
+
+    summary, _ = await asummarize_text("\n\n".join(summaries), config)
+
+    if cached:
+        await asyncio.to_thread(cached.store, summary.strip())
     return summary.strip(), [
         (summaries[i], chunks[i][0]) for i in range(0, len(chunks))
     ]
 
 
+@dataclass
+class _CachedSummary:
+    """The result of a summary cache lookup, through which to store a new summary"""
+
+    cache: SummaryCache
+    scope: str
+    embedding: Embedding
+    summary: Optional[str]
+
+    def store(self, summary: str) -> None:
+        self.cache.put(self.scope, self.embedding, summary)
+
+
+def _lookup_cached_summary(
+    text: str, model: str, instruction: Optional[str], config: Config
+) -> Optional[_CachedSummary]:
+    """Look up the summary of a nearly identical text in the summary cache.
+
+    Returns:
+        None if the summary cache is disabled or the text is too long to embed; in
+            the latter case its chunks are looked up instead.
+    """
+    from autogpt.memory.vector.utils import get_embedding
+
+    if not _can_cache_summary(text, config):
+        return None
+    return _get_cached_summary(get_embedding(text, config), model, instruction, config)
+
+
+async def _alookup_cached_summary(
+    text: str, model: str, instruction: Optional[str], config: Config
+) -> Optional[_CachedSummary]:
+    """Async version of `_lookup_cached_summary`"""
+    from autogpt.memory.vector.utils import aget_embedding
+
+    if not _can_cache_summary(text, config):
+        return None
+    embedding = await aget_embedding(text, config)
+    return await asyncio.to_thread(
+        _get_cached_summary, embedding, model, instruction, config
+    )
+
+
+def _can_cache_summary(text: str, config: Config) -> bool:
+    return config.summary_cache and (
+        count_string_tokens(text, config.embedding_model)
+        <= OPEN_AI_MODELS[config.embedding_model].max_tokens
+    )
+
+
+def _get_cached_summary(
+    embedding: Embedding, model: str, instruction: Optional[str], config: Config
+) -> _CachedSummary:
+    cache = get_summary_cache(
+        config.summary_cache_file, config.summary_cache_max_entries
+    )
+    scope = SummaryCache.make_scope(model, instruction)
+    summary = cache.get(scope, embedding, config.summary_cache_min_similarity)
+    return _CachedSummary(cache, scope, embedding, summary)
+
+
+def _get_summary_instruction(
+    text: str, instruction: Optional[str], question: Optional[str]
+) -> Optional[str]:
+    """Validate the arguments of a summary, and get the instruction to use"""
+    if not text:
+        raise ValueError("No text to summarize")
+
+    if instruction and question:
+        raise ValueError("Parameters 'question' and 'instructions' cannot both be set")
+
+    if question:
+        instruction = (
+            f'include any information that can be used to answer the question "{question}". '
+            "Do not directly answer the question itself"
+        )
+    return instruction
+
+
+def _max_summary_chunk_length(text: str, model: str) -> int:
+    token_length = count_string_tokens(text, model)
+    logger.info(f"Text length: {token_length} tokens")
+
+    # reserve 50 tokens for summary prompt, 500 for the response
+    max_chunk_length = _max_chunk_length(model) - 550
+    logger.info(f"Max chunk length: {max_chunk_length} tokens")
+    return max_chunk_length
+
+
+def _get_summary_prompt(
+    text: str, model: str, instruction: Optional[str]
+) -> ChatSequence:
+    summarization_prompt = ChatSequence.for_model(model)
+    # summarization_prompt.add("user", text)
+    summarization_prompt.add(
+        "user",
+        "Write a concise summary of the following text"
+        f"{f'; {instruction}' if instruction is not None else ''}:"
+        "\n\n\n"
+        f'LITERAL TEXT: """{text}"""'
+        "\n\n\n"
+        "CONCISE SUMMARY: The text is best summarized as"
+        # "Only respond with a concise summary or description of the user message."
+    )
+
+    logger.debug(f"Summarizing with {model}:\n{summarization_prompt.dump()}\n")
+    return summarization_prompt
+
+
 def split_text(
     text: str,
     for_model: str,
@@ -183,6 +346,7 @@ def split_text(
     nlp.add_pipe("sentencizer")
     doc = nlp(text)
     sentences = [sentence.text.strip() for sentence in doc.sents]
+    sentence_lengths = count_string_tokens_batch(sentences, for_model)
 
     current_chunk: list[str] = []
     current_chunk_length = 0
@@ -192,7 +356,7 @@ def split_text(
     i = 0
     while i < len(sentences):
         sentence = sentences[i]
-        sentence_length = count_string_tokens(sentence, for_model)
+        sentence_length = sentence_lengths[i]
         expected_chunk_length = current_chunk_length + 1 + sentence_length
 
         if (
@@ -231,10 +395,9 @@ def split_text(
             current_chunk_length += sentence_length
 
         else:  # sentence longer than maximum length -> chop up and try again
-            sentences[i : i + 1] = [
-                chunk
-                for chunk, _ in chunk_content(sentence, for_model, target_chunk_length)
-            ]
+            chunks = list(chunk_content(sentence, for_model, target_chunk_length))
+            sentences[i : i + 1] = [chunk for chunk, _ in chunks]
+            sentence_lengths[i : i + 1] = [length for _, length in chunks]
             continue
 
         i += 1
@@ -3,6 +3,7 @@ import logging
 
 from autogpt.commands.file_operations import ingest_file, list_files
 from autogpt.config import ConfigBuilder
+from autogpt.llm.priority import RequestPriority, request_priority
 from autogpt.memory.vector import VectorMemory, get_memory
 
 config = ConfigBuilder.build_config_from_env()
@@ -75,23 +76,25 @@ def main() -> None:
         memory.clear()
     logger.debug("Using memory of type: " + memory.__class__.__name__)
 
-    if args.file:
-        try:
-            ingest_file(args.file, memory, args.max_length, args.overlap)
-            logger.info(f"File '{args.file}' ingested successfully.")
-        except Exception as e:
-            logger.error(f"Error while ingesting file '{args.file}': {str(e)}")
-    elif args.dir:
-        try:
-            ingest_directory(args.dir, memory, args)
-            logger.info(f"Directory '{args.dir}' ingested successfully.")
-        except Exception as e:
-            logger.error(f"Error while ingesting directory '{args.dir}': {str(e)}")
-    else:
-        logger.warn(
-            "Please provide either a file path (--file) or a directory name (--dir)"
-            " inside the auto_gpt_workspace directory as input."
-        )
+    # Ingestion is not urgent, so it yields to any interactive agents
+    with request_priority(RequestPriority.BACKGROUND):
+        if args.file:
+            try:
+                ingest_file(args.file, memory, args.max_length, args.overlap)
+                logger.info(f"File '{args.file}' ingested successfully.")
+            except Exception as e:
+                logger.error(f"Error while ingesting file '{args.file}': {str(e)}")
+        elif args.dir:
+            try:
+                ingest_directory(args.dir, memory, args)
+                logger.info(f"Directory '{args.dir}' ingested successfully.")
+            except Exception as e:
+                logger.error(f"Error while ingesting directory '{args.dir}': {str(e)}")
+        else:
+            logger.warn(
+                "Please provide either a file path (--file) or a directory name (--dir)"
+                " inside the auto_gpt_workspace directory as input."
+            )
 
 
 if __name__ == "__main__":
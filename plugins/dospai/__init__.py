@@ -135,7 +135,7 @@ class ClDOSPAI(AutoGPTPluginTemplate):
         handle the pre_command method.
         Returns:
             bool: True if the plugin can handle the pre_command method."""
-        return False
+        return True
 
     def pre_command(
         self, command_name: str, arguments: Dict[str, Any]
@@ -147,7 +147,9 @@ class ClDOSPAI(AutoGPTPluginTemplate):
         Returns:
             Tuple[str, Dict[str, Any]]: The command name and the arguments.
         """
-        pass
+        # The guideline check of this cycle runs alongside the planning completion;
+        # the command must not run before its verdict is in
+        return self._data.gate_command(command_name, arguments)
 
     def can_handle_post_command(self) -> bool:
         """This method is called to check that the plugin can
@@ -18,6 +18,7 @@ from autogpt.llm import ChatModelResponse
 from autogpt.ai_guidelines import AIGuidelines
 from autogpt.llm.utils import create_chat_completion
 from autogpt.llm.base import ChatSequence, Message
+from autogpt.llm.auxiliary import is_auxiliary_request
 from autogpt.llm.providers.openai import OpenAIFunctionSpec, OpenAIFunctionCall, OPEN_AI_CHAT_MODELS
 from autogpt.json_utils.utilities import extract_json_from_response # , validate_json
 from .dospai_mem import ClDOSPAIMem, ClDOSPAIVals
@@ -85,6 +86,8 @@ class ClDOSPAIData(AbstractSingleton):
         now = datetime.datetime.now()
         self._slots_memory = {'start_time': now.strftime("%H_%M_%S")} # dict containing memory slots filled by memory model answers and function returns
         self._last_command_response = ''
+        self._pending_verdict = None # Future of the guideline check running alongside the main completion
+        self._deferred_user_prompt = None # advice or message received while a command was held back
         self._d_fix = {}
         self._curr_fix = []
         self._curr_fix_idx = 0
@@ -420,7 +423,7 @@ I must make sure I use the json format specified above for my response.
 
         # before anything else, make sure that this is called by an on_respose from a 
         #   mainstream LLM call (not a guidelines or summary call)
-        if not self._b_action_response:
+        if not self._b_action_response or is_auxiliary_request():
             return gpt_response_json, function
 
         self._b_action_response = False
@@ -549,14 +552,14 @@ I must make sure I use the json format specified above for my response.
         self.msg_user(msg)
 
     def process_msgs(self, messages : list[dict[str, str]]):
-        bviolation, violation_alert = self._guidelines_mgr.exec_monitor(self._config, messages)
-        if bviolation:
-            self.apply_scores(0, 10, -10, b_force_score=True)
-            # In the future we will investigate more carefully
-            self.msg_user(f'Guideline violation alert! Shutting down! Report: {violation_alert}')
-            # raise ValueError('Guideline violation!') TBD!!! Don't forget to bring this back
-            self._bviolation = True
-            self._paused = True
+        # The previous cycle's verdict is still pending if its command was not executed
+        self.collect_guidelines_verdict()
+        # Check the guidelines while the main completion runs; only the execution
+        # of the resulting command waits for the verdict (see gate_command)
+        self._pending_verdict = self._guidelines_mgr.submit_monitor(self._config, messages)
+        if self._deferred_user_prompt is not None:
+            user_prompt, self._deferred_user_prompt = self._deferred_user_prompt, None
+            return user_prompt
 
         '''
         if len(messages) > 2 and 'Error:' in messages[-3]['content']:
@@ -568,32 +571,9 @@ I must make sure I use the json format specified above for my response.
         while True:
             user_message = self._telegram_utils.check_for_user_input()
             if len(user_message) > 0:
-                msg_type, content = self.parse_user_msg(user_message)
-                if msg_type == self.UserCmd.eGetHistory:
-                    self.get_history(content)
-                elif msg_type == self.UserCmd.eScore:
-                    self.apply_scores(0, 10, content)
-                elif msg_type == self.UserCmd.eScore_1:
-                    self.apply_scores(0, 1, content)
-                elif msg_type == self.UserCmd.eIntervene:
-                    self._bintervene = True
-                elif msg_type == self.UserCmd.eFlow:
-                    self._bintervene = False
-                    self._bfixed = False
-                elif msg_type == self.UserCmd.eFix:
-                    self._bintervene = True
-                    self._bfixed = True
-                elif msg_type == self.UserCmd.ePause:
-                    self._paused = True
-                elif msg_type == self.UserCmd.eContinueAfterPause:
-                    self._paused = False
-                elif msg_type == self.UserCmd.eAdvice:
-                    self.store_advice(content, 'user')
-                    return f'Your user has requested that you use the following advice in deciding on your future responses: {content}'
-                elif msg_type == self.UserCmd.eFreeForm:
-                    return f'Your user has sent you the following message: {content}\n'\
-                        'Use the command "telegram_message_user" from the COMMANDS list if you wish to reply.\n'\
-                        'Ensure your response uses the JSON format specified above.'
+                user_prompt = self.handle_user_msg(user_message)
+                if user_prompt is not None:
+                    return user_prompt
             if not self._paused:
                 break
             print('Sleeping because in pause...')
@@ -612,6 +592,74 @@ I must make sure I use the json format specified above for my response.
         self._b_action_response = True
         return ret_text
 
+    def handle_user_msg(self, user_message : str):
+        '''
+        Acts on a message from the user. Returns the text to add to the prompt for
+        advice and free form messages, None otherwise
+        '''
+        msg_type, content = self.parse_user_msg(user_message)
+        if msg_type == self.UserCmd.eGetHistory:
+            self.get_history(content)
+        elif msg_type == self.UserCmd.eScore:
+            self.apply_scores(0, 10, content)
+        elif msg_type == self.UserCmd.eScore_1:
+            self.apply_scores(0, 1, content)
+        elif msg_type == self.UserCmd.eIntervene:
+            self._bintervene = True
+        elif msg_type == self.UserCmd.eFlow:
+            self._bintervene = False
+            self._bfixed = False
+        elif msg_type == self.UserCmd.eFix:
+            self._bintervene = True
+            self._bfixed = True
+        elif msg_type == self.UserCmd.ePause:
+            self._paused = True
+        elif msg_type == self.UserCmd.eContinueAfterPause:
+            self._paused = False
+        elif msg_type == self.UserCmd.eAdvice:
+            self.store_advice(content, 'user')
+            return f'Your user has requested that you use the following advice in deciding on your future responses: {content}'
+        elif msg_type == self.UserCmd.eFreeForm:
+            return f'Your user has sent you the following message: {content}\n'\
+                'Use the command "telegram_message_user" from the COMMANDS list if you wish to reply.\n'\
+                'Ensure your response uses the JSON format specified above.'
+        return None
+
+    def collect_guidelines_verdict(self):
+        '''
+        Waits for the pending guideline check, if any, and acts on a violation
+        '''
+        if self._pending_verdict is None:
+            return
+        pending_verdict, self._pending_verdict = self._pending_verdict, None
+        bviolation, violation_alert = pending_verdict.result()
+        if bviolation:
+            self.apply_scores(0, 10, -10, b_force_score=True)
+            # In the future we will investigate more carefully
+            self.msg_user(f'Guideline violation alert! Shutting down! Report: {violation_alert}')
+            # raise ValueError('Guideline violation!') TBD!!! Don't forget to bring this back
+            self._bviolation = True
+            self._paused = True
+
+    def gate_command(self, command_name, arguments):
+        '''
+        Holds back the execution of a command until the guideline check of its cycle
+        is done. After a violation the agent is paused, and the command only runs
+        once the user unpauses it. Advice sent during the pause is used next cycle.
+        '''
+        self.collect_guidelines_verdict()
+        while self._paused:
+            user_message = self._telegram_utils.check_for_user_input()
+            if len(user_message) > 0:
+                user_prompt = self.handle_user_msg(user_message)
+                if user_prompt is not None:
+                    self._deferred_user_prompt = user_prompt
+            if not self._paused:
+                break
+            print('Sleeping because in pause...')
+            time.sleep(2)
+        return command_name, arguments
+
     def msg_user(self, message):
         return self._telegram_utils.send_message(message)
 
@@ -741,6 +789,8 @@ I must make sure I use the json format specified above for my response.
        
 
     def replace_chat_completion(self):
+        if is_auxiliary_request():
+            return None # let guideline checks and summaries, which may run concurrently with the main completion, through to the model
         empty_content = '{"thoughts": {"text": "", "reasoning": "", "plan": "", "criticism": "", "speak": ""}}'
         if self._b_action_response:
             if self.fix_in_cmd_history():
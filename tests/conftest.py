@@ -46,7 +46,10 @@ def temp_plugins_config_file():
 
 @pytest.fixture()
 def config(
-    temp_plugins_config_file: str, mocker: MockerFixture, workspace: Workspace
+    temp_plugins_config_file: str,
+    mocker: MockerFixture,
+    workspace: Workspace,
+    tmp_path: Path,
 ) -> Config:
     config = ConfigBuilder.build_config_from_env()
     if not os.environ.get("OPENAI_API_KEY"):
@@ -69,6 +72,7 @@ def config(
         config,
         workspace_path=workspace.root,
         file_logger_path=workspace.get_path("file_logger.txt"),
+        openai_models_cache_file=str(tmp_path / "openai_models.json"),
     )
     yield config
 
@@ -43,5 +43,22 @@ def test_agent_initialization(agent: Agent):
     assert agent.ai_guidelines == agent.ai_guidelines
 
 
+def test_next_prompt_is_prepared_for_the_last_requested_model(agent: Agent, mocker):
+    compile = mocker.patch.object(agent.prompt_compiler, "compile")
+    prepare_context = mocker.patch.object(agent.history, "prepare_context")
+
+    agent._start_preparation("gpt-4")
+    # e.g. after the command result got the next cycle routed to a larger model
+    agent._start_preparation("gpt-4-32k")
+    agent._wait_for_preparation()
+
+    assert [c.args[2] for c in compile.call_args_list] == ["gpt-4", "gpt-4-32k"]
+    assert [c.args[0] for c in prepare_context.call_args_list] == [
+        "gpt-4",
+        "gpt-4-32k",
+    ]
+    assert agent._preparation is None
+
+
 # More test methods can be added for specific agent interactions
 # For example, mocking chat_with_ai and testing the agent's interaction loop
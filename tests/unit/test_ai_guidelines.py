@@ -0,0 +1,309 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from autogpt import ai_guidelines
+from autogpt.ai_guidelines import AIGuidelines
+from autogpt.config import Config
+from autogpt.llm.auxiliary import is_auxiliary_request
+from autogpt.llm.base import ChatModelResponse
+from autogpt.llm.priority import RequestPriority, get_request_priority
+from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS
+
+CONTEXT_MESSAGES = [
+    {"role": "system", "content": "You are Entrepreneur-GPT"},
+    {"role": "assistant", "content": "I will delete all files in the home directory"},
+    {"role": "user", "content": "Determine exactly one command to use"},
+]
+
+
+@pytest.fixture
+def guidelines(tmp_path, mocker: MockerFixture) -> AIGuidelines:
+    guidelines_file = tmp_path / "ai_guidelines.yaml"
+    guidelines_file.write_text("guidelines:\n- Do not destroy the user's data\n")
+    mocker.patch(
+        "autogpt.ai_guidelines.count_message_tokens",
+        lambda messages, model: sum(4 + len(m.content) // 4 for m in messages),
+    )
+    guidelines = AIGuidelines(str(guidelines_file), bsilent=True)
+    guidelines.bsilent = False
+    return guidelines
+
+
+def mock_verdict(severity: int) -> ChatModelResponse:
+    return ChatModelResponse(
+        model_info=OPEN_AI_CHAT_MODELS["gpt-3.5-turbo"],
+        content=None,
+        function_call={
+            "name": "guideline_evaluation",
+            "arguments": json.dumps(
+                {
+                    "severity": severity,
+                    "guideline_num": 1,
+                    "justification": "Deleting files destroys the user's data",
+                }
+            ),
+        },
+    )
+
+
+def test_submit_monitor_runs_in_background(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    release = threading.Event()
+    priorities = []
+    auxiliary = []
+
+    def create_chat_completion(**kwargs):
+        priorities.append(get_request_priority())
+        auxiliary.append(is_auxiliary_request())
+        release.wait(timeout=5)
+        return mock_verdict(8)
+
+    mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", create_chat_completion
+    )
+
+    verdict = guidelines.submit_monitor(config, CONTEXT_MESSAGES, "gpt-3.5-turbo")
+
+    assert not verdict.done()
+    release.set()
+    bviolation, alert_msg = verdict.result(timeout=5)
+    assert bviolation
+    assert "severity 8 of guideline num 1" in alert_msg
+    assert priorities == [RequestPriority.MONITORING]
+    assert auxiliary == [True]
+    assert not is_auxiliary_request()
+
+
+def test_submit_monitor_passes_minor_violations(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(1)
+    )
+
+    verdict = guidelines.submit_monitor(config, CONTEXT_MESSAGES, "gpt-3.5-turbo")
+
+    assert verdict.result(timeout=5) == (False, "continue")
+
+
+def test_submit_monitor_when_silenced(guidelines: AIGuidelines, config: Config):
+    guidelines.bsilent = True
+
+    verdict = guidelines.submit_monitor(config, CONTEXT_MESSAGES)
+
+    assert verdict.done()
+    assert verdict.result() == (False, "continue")
+
+
+def context_with(*messages: str) -> list[dict[str, str]]:
+    return (
+        CONTEXT_MESSAGES[:1]
+        + [{"role": "system", "content": "The current time and date is now"}]
+        + [{"role": "assistant", "content": m} for m in messages]
+        + CONTEXT_MESSAGES[-1:]
+    )
+
+
+def sent_contents(create_chat_completion: MagicMock) -> list[str]:
+    prompt = create_chat_completion.call_args.kwargs["prompt"]
+    return [m.content for m in prompt.messages[1:]]
+
+
+def test_exec_monitor_only_checks_new_messages(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(0)
+    )
+
+    guidelines.exec_monitor(config, context_with("first"), "gpt-3.5-turbo")
+    assert sent_contents(create_chat_completion) == [
+        ai_guidelines.NEW_MESSAGES_HEADER,
+        "first",
+    ]
+
+    guidelines.exec_monitor(config, context_with("first", "second"), "gpt-3.5-turbo")
+    assert sent_contents(create_chat_completion) == [
+        ai_guidelines.JUDGED_MESSAGES_HEADER,
+        "first",
+        ai_guidelines.NEW_MESSAGES_HEADER,
+        "second",
+    ]
+
+    verdict = guidelines.exec_monitor(
+        config, context_with("first", "second"), "gpt-3.5-turbo"
+    )
+    assert verdict == (False, "continue")
+    assert create_chat_completion.call_count == 2
+
+
+def test_exec_monitor_caches_verdicts(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(8)
+    )
+    messages = context_with("I will delete all files")
+
+    first_verdict = guidelines.exec_monitor(config, messages, "gpt-3.5-turbo")
+    guidelines._judged_hashes.clear()
+    second_verdict = guidelines.exec_monitor(config, messages, "gpt-3.5-turbo")
+
+    assert first_verdict == second_verdict
+    assert first_verdict[0]
+    assert create_chat_completion.call_count == 1
+
+
+def test_exec_monitor_condenses_judged_messages(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(0)
+    )
+    summarize_text = mocker.patch(
+        "autogpt.ai_guidelines.summarize_text", return_value=("earlier events", None)
+    )
+    mocker.patch.object(ai_guidelines, "MONITOR_JUDGED_CONTEXT_TOKENS", 100)
+    long_messages = [f"{i} " + "x" * 200 for i in range(10)]
+
+    sent_tokens = []
+    for i in range(1, len(long_messages) + 1):
+        guidelines.exec_monitor(
+            config, context_with(*long_messages[:i]), "gpt-3.5-turbo"
+        )
+        sent_tokens.append(
+            sum(len(c) for c in sent_contents(create_chat_completion)) // 4
+        )
+
+    assert summarize_text.call_count > 0
+    assert any("earlier events" in c for c in sent_contents(create_chat_completion))
+    assert max(sent_tokens) < 4 * 60
+
+
+def test_exec_monitor_truncates_to_token_limit(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(0)
+    )
+    token_limit = OPEN_AI_CHAT_MODELS["gpt-3.5-turbo"].max_tokens
+
+    guidelines.exec_monitor(
+        config, context_with("y" * 4 * 2 * token_limit), "gpt-3.5-turbo"
+    )
+
+    sent = sent_contents(create_chat_completion)
+    assert sent[-1].endswith(ai_guidelines.TRUNCATION_MARK)
+    max_tokens = create_chat_completion.call_args.kwargs["max_tokens"]
+    assert max_tokens >= ai_guidelines.MONITOR_RESPONSE_TOKENS
+
+
+def fake_embedding(texts, config):
+    def embed(text: str) -> list[float]:
+        text = text.lower()
+        return [
+            float("destroy" in text or "delete" in text),
+            float("spend" in text or "shop" in text),
+            float("news" in text or "read" in text),
+        ]
+
+    return [embed(t) for t in texts]
+
+
+@pytest.fixture
+def prefiltered_guidelines(
+    guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+) -> AIGuidelines:
+    guidelines.ai_guidelines = [
+        "Do not destroy the user's data",
+        "Do not spend the user's money",
+        "Do not leave the user's country",
+    ]
+    guidelines.guideline_patterns = {3: [r"\bflights?\b"]}
+    guidelines.gprompt = guidelines.construct_full_prompt()
+    mocker.patch.multiple(
+        config,
+        guidelines_prefilter=True,
+        guidelines_safe_similarity=0.5,
+        guidelines_top_k=1,
+    )
+    mocker.patch("autogpt.ai_guidelines.get_embedding", side_effect=fake_embedding)
+    return guidelines
+
+
+def sent_guidelines(create_chat_completion: MagicMock) -> str:
+    prompt = create_chat_completion.call_args.kwargs["prompt"]
+    return prompt.messages[0].content.split("goals:\n\n\n")[1]
+
+
+def test_prefilter_skips_clearly_safe_cycles(
+    prefiltered_guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(0)
+    )
+
+    verdict = prefiltered_guidelines.exec_monitor(
+        config, context_with("I will read the news"), "gpt-3.5-turbo"
+    )
+
+    assert verdict == (False, "continue")
+    create_chat_completion.assert_not_called()
+    # The guidelines are embedded only once
+    prefiltered_guidelines.exec_monitor(
+        config, context_with("I will read more news"), "gpt-3.5-turbo"
+    )
+    embedded = [c.args[0] for c in ai_guidelines.get_embedding.call_args_list]
+    assert embedded.count(prefiltered_guidelines.ai_guidelines) == 1
+
+
+def test_prefilter_sends_only_relevant_guidelines(
+    prefiltered_guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(7)
+    )
+
+    bviolation, _ = prefiltered_guidelines.exec_monitor(
+        config, context_with("I will spend it all"), "gpt-3.5-turbo"
+    )
+
+    assert bviolation
+    assert sent_guidelines(create_chat_completion).startswith(
+        "2. Do not spend the user's money\nPlease respond"
+    )
+
+
+def test_prefilter_checks_guidelines_matching_patterns(
+    prefiltered_guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(0)
+    )
+
+    prefiltered_guidelines.exec_monitor(
+        config, context_with("I will book flights to read the news"), "gpt-3.5-turbo"
+    )
+
+    sent = sent_guidelines(create_chat_completion)
+    assert "3. Do not leave the user's country\n" in sent
+    assert sent.count("Do not") == 1 + config.guidelines_top_k
+
+
+def test_prefilter_checks_risky_commands(
+    prefiltered_guidelines: AIGuidelines, config: Config, mocker: MockerFixture
+):
+    create_chat_completion = mocker.patch(
+        "autogpt.ai_guidelines.create_chat_completion", return_value=mock_verdict(0)
+    )
+
+    prefiltered_guidelines.exec_monitor(
+        config, context_with("I will read the news with sudo"), "gpt-3.5-turbo"
+    )
+
+    create_chat_completion.assert_called_once()
@@ -1,3 +1,5 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
 
 import pytest
@@ -84,3 +86,106 @@ class TestApiManager:
 
             assert result[0]["id"] == "gpt-3.5-turbo"
             assert api_manager.models[0]["id"] == "gpt-3.5-turbo"
+
+    @staticmethod
+    def test_get_models_uses_cache_file(tmp_path):
+        """Test if the list of models is read from the cache file."""
+        cache_file = tmp_path / "openai_models.json"
+        with patch("openai.Model.list") as mock_list_models:
+            mock_list_models.return_value = {"data": [{"id": "gpt-4"}]}
+            api_manager.get_models(cache_file, 60, api_key="sk-1")
+            api_manager.reset()
+            result = api_manager.get_models(cache_file, 60, api_key="sk-1")
+
+            assert result[0]["id"] == "gpt-4"
+            assert mock_list_models.call_count == 1
+            assert "sk-1" not in cache_file.read_text()
+
+            api_manager.reset()
+            api_manager.get_models(cache_file, 60, api_key="sk-2")
+            assert mock_list_models.call_count == 2
+
+    @staticmethod
+    def test_get_models_refreshes_stale_cache_in_background(tmp_path, mocker):
+        """Test if a stale list of models is used and refreshed in the background."""
+        cache_file = tmp_path / "openai_models.json"
+        with patch("openai.Model.list") as mock_list_models:
+            mock_list_models.return_value = {"data": [{"id": "gpt-3.5-turbo"}]}
+            api_manager.get_models(cache_file, 60)
+
+            api_manager.reset()
+            mock_list_models.return_value = {"data": [{"id": "gpt-4"}]}
+            mocker.patch("time.time", return_value=time.time() + 120)
+            threads = []
+            mocker.patch(
+                "threading.Thread.start",
+                autospec=True,
+                side_effect=lambda thread: threads.append(thread),
+            )
+            result = api_manager.get_models(cache_file, 60)
+
+            assert result[0]["id"] == "gpt-3.5-turbo"
+            assert len(threads) == 1
+            threads[0].run()
+            assert api_manager.get_models(cache_file, 60)[0]["id"] == "gpt-4"
+
+            api_manager.reset()
+            assert api_manager.get_models(cache_file, 60)[0]["id"] == "gpt-4"
+            assert mock_list_models.call_count == 2
+
+    @staticmethod
+    def test_update_cache_stats():
+        """Test if response cache hits and misses are counted correctly."""
+        api_manager.update_cache_stats(hit=True)
+        api_manager.update_cache_stats(hit=False)
+        api_manager.update_cache_stats(hit=False)
+
+        assert api_manager.get_cache_hits() == 1
+        assert api_manager.get_cache_misses() == 2
+
+    @staticmethod
+    def test_usage_by_model_and_agent():
+        """Test if usage is tracked per model and per agent."""
+        api_manager.update_cost(100, 0, "text-embedding-ada-002")
+        with api_manager.attribute_to_agent("agent-1"):
+            api_manager.update_cost(10, 20, "gpt-3.5-turbo")
+            api_manager.update_cost(30, 40, "gpt-3.5-turbo")
+
+        by_model = api_manager.get_usage_by_model()
+        assert by_model["gpt-3.5-turbo"].requests == 2
+        assert by_model["gpt-3.5-turbo"].prompt_tokens == 40
+        assert by_model["gpt-3.5-turbo"].completion_tokens == 60
+        assert by_model["text-embedding-ada-002"].prompt_tokens == 100
+
+        by_agent = api_manager.get_usage_by_agent()
+        assert list(by_agent) == ["agent-1"]
+        assert by_agent["agent-1"].cost == by_model["gpt-3.5-turbo"].cost
+
+    @staticmethod
+    def test_latency_histogram():
+        """Test if API call latencies are counted in the right buckets."""
+        for seconds in [0.2, 0.7, 0.8, 3, 100]:
+            api_manager.record_latency("gpt-4", seconds)
+
+        histogram = api_manager.get_latency_histogram("gpt-4")
+        assert histogram.count == 5
+        assert histogram.counts[:4] == [1, 2, 0, 1]
+        assert histogram.percentile(50) == 1
+        assert histogram.percentile(100) == 120
+        assert api_manager.get_latency_histogram("gpt-3.5-turbo").count == 0
+
+    @staticmethod
+    def test_concurrent_updates():
+        """Test if updates from many threads are all counted."""
+
+        def update(i: int):
+            with api_manager.attribute_to_agent(f"agent-{i % 2}"):
+                api_manager.update_cost(1, 2, "gpt-3.5-turbo")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(update, range(1000)))
+
+        assert api_manager.get_total_prompt_tokens() == 1000
+        assert api_manager.get_total_completion_tokens() == 2000
+        assert api_manager.get_usage_by_model()["gpt-3.5-turbo"].requests == 1000
+        assert api_manager.get_usage_by_agent()["agent-0"].requests == 500
@@ -0,0 +1,243 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from openai.error import RateLimitError
+from openai.openai_object import OpenAIObject
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.llm.api_manager import ApiManager
+from autogpt.llm.base import ChatSequence, Message
+from autogpt.llm.hedging import HedgingPolicy
+from autogpt.llm.providers import openai as iopenai
+from autogpt.llm.utils import acreate_chat_completion
+from autogpt.memory.vector import utils as vector_utils
+from autogpt.processing import text as text_processing
+
+
+def mock_chat_response(content: str) -> OpenAIObject:
+    return OpenAIObject.construct_from(
+        {
+            "model": "gpt-3.5-turbo",
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+        }
+    )
+
+
+def chunk(delta: dict, finish_reason: str | None = None) -> OpenAIObject:
+    return OpenAIObject.construct_from(
+        {
+            "id": "chatcmpl-1",
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+    )
+
+
+@pytest.fixture
+def no_backoff(mocker: MockerFixture):
+    mocker.patch("autogpt.llm.providers.openai.asyncio.sleep", AsyncMock())
+
+
+def test_acreate_chat_completion_retries(mocker: MockerFixture, no_backoff):
+    acreate = mocker.patch(
+        "openai.ChatCompletion.acreate",
+        AsyncMock(side_effect=[RateLimitError("Error"), mock_chat_response("Hi")]),
+    )
+
+    response = asyncio.run(
+        iopenai.acreate_chat_completion(
+            [{"role": "user", "content": "Hello"}], model="gpt-3.5-turbo"
+        )
+    )
+
+    assert response.choices[0].message.content == "Hi"
+    assert acreate.await_count == 2
+
+
+def test_acreate_chat_completion_records_latency(
+    api_manager: ApiManager, mocker: MockerFixture
+):
+    mocker.patch(
+        "openai.ChatCompletion.acreate", AsyncMock(return_value=mock_chat_response(""))
+    )
+    record_latency = mocker.spy(api_manager, "record_latency")
+
+    asyncio.run(
+        iopenai.acreate_chat_completion(
+            [{"role": "user", "content": "Hello"}], model="gpt-3.5-turbo"
+        )
+    )
+
+    assert record_latency.call_args.args[0] == "gpt-3.5-turbo"
+
+
+def test_acreate_chat_completion_streams(mocker: MockerFixture):
+    async def stream():
+        yield chunk({"role": "assistant", "content": ""})
+        for part in ("Hello ", "there!"):
+            yield chunk({"content": part})
+        yield chunk({}, "stop")
+
+    mocker.patch("openai.ChatCompletion.acreate", AsyncMock(return_value=stream()))
+
+    response = asyncio.run(
+        iopenai.acreate_chat_completion(
+            [{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo", stream=True
+        )
+    )
+
+    assert response.choices[0].message.content == "Hello there!"
+    assert response.choices[0].finish_reason == "stop"
+
+
+def test_arun_uses_duplicate_and_cancels_original():
+    policy = HedgingPolicy(percentile=90, min_delay=0.05)
+    for _ in range(policy.tracker.min_samples):
+        policy.tracker.record("gpt-3.5-turbo", 0.01)
+    cancelled = []
+
+    async def slow_request():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "original"
+
+    async def fast_request():
+        return "duplicate"
+
+    result = asyncio.run(policy.arun("gpt-3.5-turbo", slow_request, fast_request))
+
+    assert result == "duplicate"
+    assert cancelled == [True]
+
+
+def test_llm_utils_acreate_chat_completion_uses_response_cache(
+    config: Config, api_manager: ApiManager, tmp_path, mocker: MockerFixture
+):
+    mocker.patch.multiple(
+        config,
+        llm_response_cache=True,
+        llm_response_cache_file=str(tmp_path / "llm_cache.sqlite3"),
+        llm_response_cache_max_temperature=0,
+        plugins=[],
+    )
+    acreate = mocker.patch(
+        "autogpt.llm.utils.iopenai.acreate_chat_completion",
+        AsyncMock(return_value=mock_chat_response("Hi there!")),
+    )
+    prompt = ChatSequence.for_model("gpt-3.5-turbo", [Message("user", "Hello")])
+
+    async def complete_twice():
+        first = await acreate_chat_completion(prompt, config, max_tokens=100)
+        second = await acreate_chat_completion(prompt, config, max_tokens=100)
+        return first, second
+
+    first, second = asyncio.run(complete_twice())
+
+    assert first.content == second.content == "Hi there!"
+    assert acreate.await_count == 1
+    assert api_manager.get_cache_hits() == api_manager.get_cache_misses() == 1
+
+
+def test_aget_embedding_uses_cache(config: Config, tmp_path, mocker: MockerFixture):
+    mocker.patch.multiple(
+        config,
+        embedding_cache=True,
+        embedding_cache_file=str(tmp_path / "embeddings.sqlite3"),
+    )
+    acreate_embedding = mocker.patch(
+        "autogpt.llm.providers.openai.acreate_embedding",
+        AsyncMock(
+            side_effect=lambda input, **_: OpenAIObject.construct_from(
+                {
+                    "data": [
+                        {"index": i, "embedding": [float(len(text))] * 4}
+                        for i, text in enumerate(input)
+                    ]
+                }
+            )
+        ),
+    )
+
+    async def embed():
+        await vector_utils.aget_embedding(["a", "bb"], config)
+        return await vector_utils.aget_embedding(["bb", "ccc", "ccc"], config)
+
+    embeddings = asyncio.run(embed())
+
+    assert [list(e) for e in embeddings] == [[2.0] * 4, [3.0] * 4, [3.0] * 4]
+    assert [c.args[0] for c in acreate_embedding.call_args_list] == [
+        ["a", "bb"],
+        ["ccc"],
+    ]
+
+
+def test_aget_embedding_with_azure(config: Config, mocker: MockerFixture):
+    mocker.patch.multiple(
+        config,
+        use_azure=True,
+        openai_api_type="azure",
+        openai_api_base="https://example.openai.azure.com",
+        openai_api_version="2023-03-15-preview",
+        azure_model_to_deployment_id_map={"embedding_model_deployment_id": "ada"},
+        embedding_cache=False,
+    )
+    breakpoint = mocker.patch("builtins.breakpoint")
+    acreate_embedding = mocker.patch(
+        "autogpt.llm.providers.openai.acreate_embedding",
+        AsyncMock(
+            return_value=OpenAIObject.construct_from(
+                {"data": [{"index": 0, "embedding": [1.0, 0.0]}]}
+            )
+        ),
+    )
+
+    embedding = asyncio.run(vector_utils.aget_embedding("Hello", config))
+
+    assert list(embedding) == [1.0, 0.0]
+    kwargs = acreate_embedding.call_args.kwargs
+    assert kwargs["engine"] == "ada"
+    assert kwargs["api_base"] == "https://example.openai.azure.com"
+    assert "model" not in kwargs
+    breakpoint.assert_not_called()
+
+
+def test_asummarize_text_summarizes_chunks_concurrently(
+    config: Config, mocker: MockerFixture
+):
+    chunks = [("first chunk", 2), ("second chunk", 2), ("third chunk", 2)]
+    mocker.patch.object(
+        text_processing, "must_chunk_content", lambda text, *_: text == "long text"
+    )
+    mocker.patch.object(text_processing, "split_text", return_value=iter(chunks))
+    mocker.patch.object(text_processing, "count_string_tokens", return_value=10)
+    mocker.patch("autogpt.llm.utils.count_message_tokens", return_value=10)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def summarize(prompt: ChatSequence, **_):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        text = prompt.messages[0].content.split('"""')[1]
+        return MagicMock(content=f"summary of {text.splitlines()[0]}")
+
+    mocker.patch.object(text_processing, "acreate_chat_completion", summarize)
+
+    summary, chunk_summaries = asyncio.run(
+        text_processing.asummarize_text("long text", config)
+    )
+
+    assert max_in_flight == len(chunks)
+    assert chunk_summaries == [
+        ("summary of first chunk", "first chunk"),
+        ("summary of second chunk", "second chunk"),
+        ("summary of third chunk", "third chunk"),
+    ]
+    assert summary == "summary of summary of first chunk"
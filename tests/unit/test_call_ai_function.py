@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.llm.base import ChatModelResponse, ChatSequence
+from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS
+from autogpt.llm.utils import call_ai_function, call_ai_function_many
+
+FUNCTION = "def double(x: int) -> int:"
+DESCRIPTION = "Doubles a number"
+
+
+@pytest.fixture
+def mock_create_chat_completion(mocker: MockerFixture):
+    def create_chat_completion(prompt: ChatSequence, **_) -> ChatModelResponse:
+        time.sleep(0.01)
+        return ChatModelResponse(
+            model_info=prompt.model,
+            content=str(2 * int(prompt.messages[-1].content)),
+        )
+
+    return mocker.patch(
+        "autogpt.llm.utils.create_chat_completion", side_effect=create_chat_completion
+    )
+
+
+def test_call_ai_function(config: Config, mock_create_chat_completion):
+    assert call_ai_function(FUNCTION, [21], DESCRIPTION, config) == "42"
+
+    prompt = mock_create_chat_completion.call_args.kwargs["prompt"]
+    assert prompt.model == OPEN_AI_CHAT_MODELS[config.smart_llm]
+    assert FUNCTION in prompt.messages[0].content
+    assert prompt.messages[1].content == "21"
+
+
+def test_call_ai_function_many_preserves_order_and_dedupes(
+    config: Config, mock_create_chat_completion
+):
+    results = call_ai_function_many(
+        FUNCTION, [[3], [1], [2], [1], [3]], DESCRIPTION, config
+    )
+
+    assert results == ["6", "2", "4", "2", "6"]
+    assert mock_create_chat_completion.call_count == 3
+
+
+def test_call_ai_function_many_limits_concurrency(
+    config: Config, mocker: MockerFixture
+):
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def create_chat_completion(prompt: ChatSequence, **_) -> ChatModelResponse:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        return ChatModelResponse(model_info=prompt.model, content="ok")
+
+    mocker.patch(
+        "autogpt.llm.utils.create_chat_completion", side_effect=create_chat_completion
+    )
+
+    call_ai_function_many(
+        FUNCTION, [[i] for i in range(12)], DESCRIPTION, config, concurrency=3
+    )
+
+    assert max_in_flight == 3
+
+
+def test_call_ai_function_many_raises_first_error(
+    config: Config, mocker: MockerFixture
+):
+    mocker.patch(
+        "autogpt.llm.utils.create_chat_completion",
+        side_effect=RuntimeError("API error"),
+    )
+
+    with pytest.raises(RuntimeError, match="API error"):
+        call_ai_function_many(FUNCTION, [[1], [2]], DESCRIPTION, config)
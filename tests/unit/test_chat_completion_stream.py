@@ -0,0 +1,138 @@
+import json
+
+import pytest
+from openai.openai_object import OpenAIObject
+from pytest_mock import MockerFixture
+
+from autogpt.llm.api_manager import ApiManager
+from autogpt.llm.providers import openai as iopenai
+
+
+@pytest.fixture(autouse=True)
+def mock_token_counters(mocker: MockerFixture):
+    mocker.patch("autogpt.llm.utils.count_message_tokens", return_value=10)
+    mocker.patch(
+        "autogpt.llm.utils.count_string_tokens", side_effect=lambda s, _: len(s)
+    )
+
+
+def chunk(delta: dict, finish_reason: str | None = None) -> OpenAIObject:
+    return OpenAIObject.construct_from(
+        {
+            "id": "chatcmpl-1",
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+    )
+
+
+class ChunkStream:
+    """Iterator over chunks which records how many of them were consumed"""
+
+    def __init__(self, chunks: list[OpenAIObject]):
+        self.chunks = chunks
+        self.consumed = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+
+def content_chunks(content: str) -> list[OpenAIObject]:
+    return [chunk({"role": "assistant", "content": ""})] + [
+        chunk({"content": content[i : i + 5]}) for i in range(0, len(content), 5)
+    ]
+
+
+def test_stream_assembles_content(mocker: MockerFixture):
+    stream = ChunkStream(content_chunks("Hello there, world!") + [chunk({}, "stop")])
+    mocker.patch("openai.ChatCompletion.create", return_value=stream)
+
+    response = iopenai.create_chat_completion(
+        [{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo", stream=True
+    )
+
+    assert response.choices[0].message.content == "Hello there, world!"
+    assert response.choices[0].finish_reason == "stop"
+    assert stream.consumed == len(stream.chunks)
+
+
+def test_stream_stops_when_json_reply_is_complete(mocker: MockerFixture):
+    reply = json.dumps({"thoughts": {"text": "a } in a string"}, "command": {}})
+    stream = ChunkStream(
+        content_chunks(reply)
+        + [chunk({"content": " trailing text"}), chunk({}, "stop")]
+    )
+    mocker.patch("openai.ChatCompletion.create", return_value=stream)
+
+    response = iopenai.create_chat_completion(
+        [{"role": "user", "content": "Hi"}],
+        model="gpt-3.5-turbo",
+        stream=True,
+        stop_when_complete=True,
+    )
+
+    assert response.choices[0].message.content == reply
+    assert stream.consumed == len(stream.chunks) - 2
+
+
+def test_stream_stops_when_function_call_is_complete(mocker: MockerFixture):
+    arguments = json.dumps({"query": '{nested} "quotes"'})
+    stream = ChunkStream(
+        content_chunks('{"thoughts": {}}')
+        + [chunk({"function_call": {"name": "web_search", "arguments": ""}})]
+        + [
+            chunk({"function_call": {"arguments": arguments[i : i + 4]}})
+            for i in range(0, len(arguments), 4)
+        ]
+        + [chunk({}, "function_call")]
+    )
+    mocker.patch("openai.ChatCompletion.create", return_value=stream)
+
+    response = iopenai.create_chat_completion(
+        [{"role": "user", "content": "Hi"}],
+        model="gpt-3.5-turbo",
+        functions=[{"name": "web_search"}],
+        stream=True,
+        stop_when_complete=True,
+    )
+
+    message = response.choices[0].message
+    assert message.content == '{"thoughts": {}}'
+    assert message.function_call.name == "web_search"
+    assert json.loads(message.function_call.arguments) == json.loads(arguments)
+    assert response.choices[0].finish_reason == "function_call"
+    assert stream.consumed == len(stream.chunks) - 1
+
+
+def test_stream_waits_for_function_call_if_functions_given(mocker: MockerFixture):
+    stream = ChunkStream(
+        content_chunks('{"thoughts": {}}')
+        + [chunk({"content": " more"}), chunk({}, "stop")]
+    )
+    mocker.patch("openai.ChatCompletion.create", return_value=stream)
+
+    iopenai.create_chat_completion(
+        [{"role": "user", "content": "Hi"}],
+        model="gpt-3.5-turbo",
+        functions=[{"name": "web_search"}],
+        stream=True,
+        stop_when_complete=True,
+    )
+
+    assert stream.consumed == len(stream.chunks)
+
+
+def test_stream_usage_is_metered(mocker: MockerFixture, api_manager: ApiManager):
+    stream = ChunkStream(content_chunks("Hello") + [chunk({}, "stop")])
+    mocker.patch("openai.ChatCompletion.create", return_value=stream)
+
+    response = iopenai.create_chat_completion(
+        [{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo", stream=True
+    )
+
+    assert response.usage.prompt_tokens == 10
+    assert response.usage.completion_tokens == len("Hello")
+    assert api_manager.get_total_prompt_tokens() == 10
+    assert api_manager.get_total_completion_tokens() == len("Hello")
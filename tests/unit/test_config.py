@@ -235,3 +235,32 @@ def test_create_config_gpt3only(config: Config) -> None:
         )
         assert config.fast_llm == GPT_3_MODEL
         assert config.smart_llm == GPT_3_MODEL
+
+
+def test_get_openai_credentials(config: Config):
+    base_url = "http://localhost:8089/v1"
+    with mock.patch.multiple(
+        config,
+        openai_api_key="sk-dummy",
+        openai_api_base=base_url,
+        openai_organization=None,
+        use_azure=False,
+    ):
+        assert config.get_openai_credentials(config.fast_llm) == {
+            "api_key": "sk-dummy",
+            "api_base": base_url,
+        }
+
+
+def test_rate_limits_from_env():
+    with mock.patch.dict(
+        os.environ,
+        {
+            "OPENAI_REQUESTS_PER_MINUTE": "3500,gpt-4=200",
+            "OPENAI_TOKENS_PER_MINUTE": "90000",
+        },
+    ):
+        config = ConfigBuilder.build_config_from_env()
+
+    assert config.openai_requests_per_minute == {"*": 3500, "gpt-4": 200}
+    assert config.openai_tokens_per_minute == {"*": 90000}
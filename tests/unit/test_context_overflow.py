@@ -0,0 +1,104 @@
+import pytest
+from pytest_mock import MockerFixture
+
+from autogpt.agent import context_overflow
+from autogpt.agent.context_overflow import (
+    get_larger_context_models,
+    route_command_result,
+)
+from autogpt.config import Config
+
+
+@pytest.fixture
+def count_tokens(mocker: MockerFixture):
+    """Count one token per character"""
+    mocker.patch.object(
+        context_overflow, "count_string_tokens", side_effect=lambda s, _: len(s)
+    )
+
+
+@pytest.fixture
+def gpt_4_config(config: Config, mocker: MockerFixture) -> Config:
+    mocker.patch.object(config, "smart_llm", "gpt-4")
+    return config
+
+
+def test_get_larger_context_models():
+    assert [m.name for m in get_larger_context_models("gpt-4")] == ["gpt-4-32k"]
+    assert [m.name for m in get_larger_context_models("gpt-3.5-turbo-0613")] == [
+        "gpt-3.5-turbo-16k-0613"
+    ]
+    assert get_larger_context_models("gpt-4-32k") == []
+
+
+@pytest.mark.parametrize("strategy", ["fail", "compress", "upgrade"])
+def test_result_that_fits_is_passed_on(
+    gpt_4_config: Config, count_tokens, mocker: MockerFixture, strategy: str
+):
+    mocker.patch.object(gpt_4_config, "context_overflow_strategy", strategy)
+
+    route = route_command_result("read_file", "x" * 1000, 100, gpt_4_config)
+
+    assert route.path == "fits"
+    assert route.model == "gpt-4"
+    assert route.result == f"Command read_file returned: {'x' * 1000}"
+
+
+def test_fail_drops_result(gpt_4_config: Config, count_tokens, mocker: MockerFixture):
+    mocker.patch.object(gpt_4_config, "context_overflow_strategy", "fail")
+    summarize_text = mocker.patch.object(context_overflow, "summarize_text")
+
+    route = route_command_result("read_file", "x" * 10_000, 100, gpt_4_config)
+
+    assert route.path == "fail"
+    assert route.result.startswith("Failure: command read_file returned too much")
+    summarize_text.assert_not_called()
+
+
+def test_compress_summarizes_result(
+    gpt_4_config: Config, count_tokens, mocker: MockerFixture
+):
+    mocker.patch.object(gpt_4_config, "context_overflow_strategy", "compress")
+    mocker.patch.object(
+        context_overflow, "summarize_text", return_value=("A file of x's", None)
+    )
+
+    route = route_command_result("read_file", "x" * 10_000, 100, gpt_4_config)
+
+    assert route.path == "compress"
+    assert route.model == "gpt-4"
+    assert route.result_tokens == 10_000
+    assert "A file of x's" in route.result
+
+
+def test_upgrade_routes_to_larger_context_model(
+    gpt_4_config: Config, count_tokens, mocker: MockerFixture
+):
+    mocker.patch.object(gpt_4_config, "context_overflow_strategy", "upgrade")
+
+    route = route_command_result("read_file", "x" * 10_000, 100, gpt_4_config)
+
+    assert route.path == "upgrade"
+    assert route.model == "gpt-4-32k"
+    assert route.token_limit == 32768
+    assert route.result == f"Command read_file returned: {'x' * 10_000}"
+    assert route.to_log() == {
+        "path": "upgrade",
+        "model": "gpt-4-32k",
+        "result_tokens": 10_000,
+        "token_limit": 32768,
+    }
+
+
+def test_upgrade_falls_back_to_compress(
+    gpt_4_config: Config, count_tokens, mocker: MockerFixture
+):
+    mocker.patch.object(gpt_4_config, "context_overflow_strategy", "upgrade")
+    mocker.patch.object(
+        context_overflow, "summarize_text", return_value=("A file of x's", None)
+    )
+
+    route = route_command_result("read_file", "x" * 40_000, 100, gpt_4_config)
+
+    assert route.path == "compress"
+    assert route.model == "gpt-4"
@@ -0,0 +1,176 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+from openai.openai_object import OpenAIObject
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.llm.priority import RequestPriority, get_request_priority, request_priority
+from autogpt.memory.vector import utils as vector_utils
+from autogpt.memory.vector.embedding_batcher import EmbeddingBatcher
+from autogpt.memory.vector.memory_item import MemoryItem
+
+
+def fake_embed_batch(texts: list[str]) -> list[list[float]]:
+    return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_requests_are_coalesced():
+    embed_batch = MagicMock(side_effect=fake_embed_batch)
+    batcher = EmbeddingBatcher(embed_batch, max_wait=0.05)
+    texts = [f"text {'x' * i}" for i in range(10)]
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        embeddings = list(executor.map(batcher.embed, texts))
+
+    assert embeddings == fake_embed_batch(texts)
+    assert embed_batch.call_count == 1
+
+
+def test_batches_are_limited_in_size():
+    embed_batch = MagicMock(side_effect=fake_embed_batch)
+    batcher = EmbeddingBatcher(embed_batch, max_batch_size=4, max_wait=0.05)
+    texts = [str(i) * (i + 1) for i in range(10)]
+
+    assert batcher.embed_many(texts) == fake_embed_batch(texts)
+    assert [len(c.args[0]) for c in embed_batch.call_args_list] == [4, 4, 2]
+
+
+def test_duplicate_texts_are_embedded_once():
+    embed_batch = MagicMock(side_effect=fake_embed_batch)
+    batcher = EmbeddingBatcher(embed_batch)
+
+    assert batcher.embed_many(["a", "bb", "a"]) == [[1.0], [2.0], [1.0]]
+    embed_batch.assert_called_once_with(["a", "bb"])
+
+
+def test_batches_are_sent_in_the_callers_context():
+    caller = contextvars.ContextVar("caller")
+    calls = []
+
+    def embed_batch(texts: list[str]) -> list[list[float]]:
+        calls.append((caller.get(), get_request_priority(), texts))
+        return fake_embed_batch(texts)
+
+    batcher = EmbeddingBatcher(embed_batch, max_wait=0.05)
+    barrier = threading.Barrier(3)
+
+    def embed(name: str, priority: RequestPriority, text: str):
+        caller.set(name)
+        with request_priority(priority):
+            barrier.wait()
+            return batcher.embed(text)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(
+            executor.map(
+                embed,
+                ["agent 1", "agent 2", "agent 1"],
+                [
+                    RequestPriority.BACKGROUND,
+                    RequestPriority.MONITORING,
+                    RequestPriority.BACKGROUND,
+                ],
+                ["a", "bb", "ccc"],
+            )
+        )
+
+    calls = sorted((name, priority, sorted(texts)) for name, priority, texts in calls)
+    assert calls == [
+        ("agent 1", RequestPriority.BACKGROUND, ["a", "ccc"]),
+        ("agent 2", RequestPriority.MONITORING, ["bb"]),
+    ]
+
+
+def test_oversized_texts_are_chunked():
+    embed_batch = MagicMock(side_effect=lambda texts: [[1.0, 0.0]] * len(texts))
+    batcher = EmbeddingBatcher(
+        embed_batch,
+        max_input_tokens=10,
+        count_tokens=lambda text: len(text) // 2,
+        chunk_text=lambda text: [
+            (text[i : i + 20], 10) for i in range(0, len(text), 20)
+        ],
+    )
+
+    embeddings = batcher.embed_many(["x" * 50, "short"])
+
+    assert embeddings == [[1.0, 0.0], [1.0, 0.0]]
+    assert [sorted(c.args[0]) for c in embed_batch.call_args_list] == [
+        ["short", "x" * 10, "x" * 20]
+    ]
+
+
+def test_oversized_texts_are_embedded_alone_without_chunk_text():
+    embed_batch = MagicMock(side_effect=fake_embed_batch)
+    batcher = EmbeddingBatcher(
+        embed_batch, max_input_tokens=10, count_tokens=lambda text: len(text) // 2
+    )
+
+    batcher.embed_many(["x" * 30, "short", "x" * 20])
+
+    batches = sorted(c.args[0] for c in embed_batch.call_args_list)
+    assert batches == [["short", "x" * 20], ["x" * 30]]
+
+
+def test_errors_are_raised_to_all_callers():
+    batcher = EmbeddingBatcher(MagicMock(side_effect=RuntimeError("API error")))
+
+    with pytest.raises(RuntimeError):
+        batcher.embed_many(["a", "b"])
+
+
+@pytest.fixture
+def mock_create_embedding(mocker: MockerFixture, config: Config):
+    mocker.patch.object(vector_utils, "_batchers", {})
+    mocker.patch.object(config, "embedding_batch_wait_ms", 50)
+
+    def create_embedding(input, **kwargs):
+        return OpenAIObject.construct_from(
+            {
+                "data": [
+                    {"index": i, "embedding": [float(len(text))]}
+                    for i, text in reversed(list(enumerate(input)))
+                ]
+            }
+        )
+
+    return mocker.patch(
+        "autogpt.llm.providers.openai.create_embedding", side_effect=create_embedding
+    )
+
+
+def test_get_embedding_is_batched(config: Config, mock_create_embedding: MagicMock):
+    barrier = threading.Barrier(3)
+
+    def get_embedding(text: str):
+        barrier.wait()
+        return vector_utils.get_embedding(text, config)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        embeddings = list(executor.map(get_embedding, ["a", "bb", "ccc"]))
+
+    assert embeddings == [[1.0], [2.0], [3.0]]
+    assert mock_create_embedding.call_count == 1
+
+
+def test_memory_item_from_text_embeds_once(
+    config: Config, mock_create_embedding: MagicMock, mocker: MockerFixture
+):
+    mocker.patch(
+        "autogpt.memory.vector.memory_item.split_text",
+        return_value=[("chunk one", 2), ("chunk two!", 2)],
+    )
+    mocker.patch(
+        "autogpt.memory.vector.memory_item.summarize_text",
+        side_effect=lambda text, *_, **__: (f"summary of {text}", None),
+    )
+
+    item = MemoryItem.from_text("chunk one chunk two!", "text_file", config)
+
+    assert item.e_chunks == [[9.0], [10.0]]
+    assert item.e_summary == [float(len(item.summary))]
+    assert mock_create_embedding.call_count == 1
@@ -0,0 +1,147 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+from openai.openai_object import OpenAIObject
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.core.resource.model_providers.embedding_cache import EmbeddingCache
+from autogpt.memory.vector import utils as vector_utils
+
+MODEL = "text-embedding-ada-002"
+
+
+@pytest.fixture
+def cache(tmp_path) -> EmbeddingCache:
+    return EmbeddingCache(tmp_path / "embeddings.sqlite3", max_size=1024)
+
+
+def vector(value: float, dimensions: int = 8) -> list[float]:
+    return [value] * dimensions
+
+
+def test_get_many_returns_hits_and_misses(cache: EmbeddingCache):
+    cache.put_many(MODEL, ["foo", "bar"], [vector(1), vector(2)])
+
+    embeddings = cache.get_many(MODEL, ["bar", "baz", "foo", "bar"])
+
+    assert embeddings[1] is None
+    np.testing.assert_array_equal(embeddings[0], vector(2))
+    np.testing.assert_array_equal(embeddings[2], vector(1))
+    np.testing.assert_array_equal(embeddings[3], vector(2))
+    assert embeddings[0].dtype == np.float32
+
+
+def test_entries_are_keyed_by_model(cache: EmbeddingCache):
+    cache.put(MODEL, "foo", vector(1))
+
+    assert cache.get("other-model", "foo") is None
+
+
+def test_cache_persists(tmp_path):
+    EmbeddingCache(tmp_path / "embeddings.sqlite3", 1024).put(MODEL, "foo", vector(3))
+
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3", 1024)
+
+    np.testing.assert_array_equal(cache.get(MODEL, "foo"), vector(3))
+
+
+def test_least_recently_used_entries_are_evicted(cache: EmbeddingCache):
+    # 8 float32 dimensions = 32 bytes per entry, so 32 entries fit in the cache
+    texts = [f"text {i}" for i in range(32)]
+    cache.put_many(MODEL, texts, [vector(i) for i in range(32)])
+    cache.get(MODEL, "text 0")
+
+    cache.put_many(MODEL, ["new 1", "new 2"], [vector(100), vector(101)])
+
+    assert len(cache) == 32
+    assert cache.size == 1024
+    assert cache.get(MODEL, "text 0") is not None
+    assert cache.get_many(MODEL, ["text 1", "text 2"]) == [None, None]
+    np.testing.assert_array_equal(cache.get(MODEL, "text 3"), vector(3))
+    np.testing.assert_array_equal(cache.get(MODEL, "new 2"), vector(101))
+
+
+def test_evicted_slots_are_reused(cache: EmbeddingCache):
+    cache.put_many(
+        MODEL, [f"text {i}" for i in range(40)], [vector(i) for i in range(40)]
+    )
+
+    assert cache.vectors_path.stat().st_size <= 1024 + 32
+
+
+def test_put_without_pwrite(cache: EmbeddingCache, monkeypatch):
+    # e.g. on Windows
+    monkeypatch.delattr("os.pwrite")
+    cache.put_many(MODEL, ["foo", "bar"], [vector(1), vector(2)])
+    cache.put(MODEL, "foo", vector(3))
+
+    embeddings = cache.get_many(MODEL, ["foo", "bar"])
+
+    np.testing.assert_array_equal(embeddings[0], vector(3))
+    np.testing.assert_array_equal(embeddings[1], vector(2))
+
+
+def test_clear(cache: EmbeddingCache):
+    cache.put(MODEL, "foo", vector(1))
+
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.get(MODEL, "foo") is None
+    cache.put(MODEL, "foo", vector(2))
+    np.testing.assert_array_equal(cache.get(MODEL, "foo"), vector(2))
+
+
+def _put_in_other_process(file_path, text, value):
+    EmbeddingCache(file_path, 1024).put(MODEL, text, vector(value))
+
+
+def test_cache_is_shared_between_processes(cache: EmbeddingCache):
+    cache.put(MODEL, "foo", vector(1))
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=_put_in_other_process, args=(cache.file_path, "bar", 2)
+    )
+    process.start()
+    process.join(timeout=30)
+
+    np.testing.assert_array_equal(cache.get(MODEL, "bar"), vector(2))
+    np.testing.assert_array_equal(cache.get(MODEL, "foo"), vector(1))
+
+
+def test_get_embedding_uses_cache(
+    config: Config, tmp_path, mocker: MockerFixture
+) -> None:
+    mocker.patch.multiple(
+        config,
+        embedding_cache=True,
+        embedding_cache_file=str(tmp_path / "embeddings.sqlite3"),
+        embedding_batch_wait_ms=0,
+    )
+    create_embedding = mocker.patch(
+        "autogpt.llm.providers.openai.create_embedding",
+        side_effect=lambda input, **_: OpenAIObject.construct_from(
+            {
+                "data": [
+                    {"index": i, "embedding": vector(len(text))}
+                    for i, text in enumerate(input)
+                ]
+            }
+        ),
+    )
+
+    vector_utils.get_embedding(["a", "bb"], config)
+    embeddings = vector_utils.get_embedding(["bb", "ccc", "a", "ccc"], config)
+
+    assert [list(e) for e in embeddings] == [
+        vector(2),
+        vector(3),
+        vector(1),
+        vector(3),
+    ]
+    assert [c.args[0] for c in create_embedding.call_args_list] == [
+        ["a", "bb"],
+        ["ccc"],
+    ]
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import openai
+import pytest
+from pytest_mock import MockerFixture
+
+from autogpt.llm.api_manager import ApiManager
+from autogpt.llm.hedging import HedgingPolicy, LatencyTracker
+from autogpt.llm.providers import openai as iopenai
+
+
+@pytest.fixture
+def policy() -> HedgingPolicy:
+    policy = HedgingPolicy(percentile=90, min_delay=0.05)
+    for _ in range(policy.tracker.min_samples):
+        policy.tracker.record("gpt-3.5-turbo", 0.01)
+    return policy
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        tracker.record("gpt-4", i + 1)
+
+    assert tracker.percentile("gpt-4", 50) is None
+
+    tracker.record("gpt-4", 10)
+
+    assert tracker.percentile("gpt-4", 50) == 5
+    assert tracker.percentile("gpt-4", 90) == 9
+    assert tracker.percentile("gpt-4", 100) == 10
+    assert tracker.percentile("gpt-3.5-turbo", 50) is None
+
+
+def test_no_hedging_without_latency_data():
+    policy = HedgingPolicy()
+    calls = []
+
+    assert policy.run("gpt-4", lambda: calls.append(1) or "result") == "result"
+    assert calls == [1]
+    assert policy.tracker.percentile("gpt-4", 0) is None  # too few samples
+
+
+def test_fast_request_is_not_hedged(policy: HedgingPolicy):
+    hedge = []
+
+    result = policy.run("gpt-3.5-turbo", lambda: "original", lambda: hedge.append(1))
+
+    assert result == "original"
+    assert hedge == []
+
+
+def test_slow_request_is_hedged(policy: HedgingPolicy):
+    stall = threading.Event()
+
+    def request():
+        stall.wait(5)
+        return "original"
+
+    result = policy.run("gpt-3.5-turbo", request, lambda: "duplicate")
+    stall.set()
+
+    assert result == "duplicate"
+
+
+def test_failed_duplicate_falls_back_to_original(policy: HedgingPolicy):
+    def request():
+        time.sleep(0.2)
+        return "original"
+
+    def hedge_request():
+        raise RuntimeError("Error")
+
+    assert policy.run("gpt-3.5-turbo", request, hedge_request) == "original"
+
+
+def test_error_is_raised_if_all_requests_fail(policy: HedgingPolicy):
+    def request():
+        raise ValueError("Error")
+
+    with pytest.raises(ValueError):
+        policy.run("gpt-3.5-turbo", request)
+
+
+def test_both_hedged_responses_are_metered(
+    policy: HedgingPolicy, api_manager: ApiManager, mocker: MockerFixture
+):
+    mocker.patch.object(iopenai, "_hedging_policy", policy)
+    original_done = threading.Event()
+    calls = []
+
+    def create(messages, **kwargs):
+        calls.append(messages)
+        is_original = len(calls) == 1
+        if is_original:
+            time.sleep(0.3)
+        response = openai.util.convert_to_openai_object(
+            {
+                "model": "gpt-3.5-turbo",
+                "choices": [{"message": {"role": "assistant", "content": "Hi"}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+            }
+        )
+        if is_original:
+            original_done.set()
+        return response
+
+    mocker.patch("openai.ChatCompletion.create", side_effect=create)
+
+    response = iopenai.create_chat_completion(
+        [{"role": "user", "content": "Hi"}], model="gpt-3.5-turbo"
+    )
+
+    assert response.choices[0].message.content == "Hi"
+    assert len(calls) == 2
+    assert api_manager.get_total_prompt_tokens() == 10
+
+    # The discarded original request is metered once it finishes
+    assert original_done.wait(5)
+    assert api_manager.get_total_prompt_tokens() == 20
+    assert api_manager.get_total_completion_tokens() == 10
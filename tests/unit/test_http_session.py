@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+import openai
+import pytest
+from openai.error import Timeout
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.core.resource.model_providers import OpenAIProvider
+from autogpt.llm.providers import openai as iopenai
+
+
+@pytest.fixture
+def session_config(config: Config, mocker: MockerFixture) -> Config:
+    # Undo the changes made by configure_http_session after each test
+    mocker.patch.object(openai.api_requestor, "_make_session")
+    mocker.patch.object(iopenai, "_request_timeout", None)
+    mocker.patch.multiple(
+        config,
+        openai_http_pool_size=4,
+        openai_connect_timeout=5,
+        openai_read_timeout=30,
+    )
+    return config
+
+
+def test_configure_http_session(session_config: Config):
+    session = iopenai.configure_http_session(session_config)
+
+    assert openai.api_requestor._make_session() is session
+    adapter = session.get_adapter("https://api.openai.com/v1")
+    assert adapter._pool_maxsize == 4
+    assert adapter.keep_alive_seconds == 60
+
+
+def test_request_timeout_is_passed(session_config: Config, mocker: MockerFixture):
+    iopenai.configure_http_session(session_config)
+    mock_create = mocker.patch("openai.Embedding.create")
+
+    iopenai.create_embedding(["Hello"], model="text-embedding-ada-002")
+    iopenai.create_embedding(
+        ["Hello"], model="text-embedding-ada-002", request_timeout=1
+    )
+
+    assert mock_create.call_args_list[0].kwargs["request_timeout"] == (5, 30)
+    assert mock_create.call_args_list[1].kwargs["request_timeout"] == 1
+
+
+def test_timeout_is_retried(mocker: MockerFixture):
+    mocker.patch("autogpt.llm.providers.openai.time.sleep")
+    calls = []
+
+    @iopenai.retry_api()
+    def f():
+        calls.append(1)
+        if len(calls) == 1:
+            raise Timeout("Request timed out")
+        return len(calls)
+
+    assert f() == 2
+
+
+def test_core_provider_shares_aiohttp_session():
+    provider = OpenAIProvider(OpenAIProvider.default_settings, logging.getLogger())
+
+    async def get_sessions():
+        sessions = []
+        for _ in range(2):
+            async with provider._shared_session():
+                sessions.append(openai.aiosession.get())
+        assert openai.aiosession.get() is None
+        await provider.close()
+        return sessions
+
+    first, second = asyncio.run(get_sessions())
+    assert first is second is not None
@@ -1,16 +1,20 @@
+import itertools
 import math
+import threading
 import time
 from unittest.mock import MagicMock
 
 import pytest
+from openai.openai_object import OpenAIObject
 
 from autogpt.agent import Agent
 from autogpt.config import AIConfig
 from autogpt.config.config import Config
+from autogpt.json_utils.utilities import extract_json_from_response
 from autogpt.llm.base import ChatModelResponse, ChatSequence, Message
 from autogpt.llm.providers.openai import OPEN_AI_CHAT_MODELS
 from autogpt.llm.utils import count_string_tokens
-from autogpt.memory.message_history import MessageHistory
+from autogpt.memory.message_history import MessageHistory, _message_key
 
 
 @pytest.fixture
@@ -35,6 +39,8 @@ def agent(config: Config):
         triggering_prompt=triggering_prompt,
         workspace_directory=workspace_directory,
     )
+    # Don't write the summary prompts to the logs directory
+    agent.log_cycle_handler = MagicMock()
     return agent
 
 
@@ -146,3 +152,244 @@ def test_message_history_batch_summary(mocker, agent, config):
         + mock_summary_response.content,
         type=None,
     )
+
+
+def fake_count_message_tokens(messages, model, functions=None):
+    return sum(4 + len(m.content) // 4 for m in messages) + 3
+
+
+def add_cycles(history: MessageHistory, count: int, start: int = 0):
+    for i in range(start, start + count):
+        history.add("user", "Determine which next command to use")
+        history.add(
+            "assistant",
+            '{"command": {"name": "read_file", "args": {"filename": "%d.txt"}}}' % i,
+            "ai_response",
+        )
+        history.add(
+            "system",
+            f"Command read_file returned: {'x' * (i % 7 * 40)}",
+            "action_result",
+        )
+
+
+def test_context_window_takes_newest_cycles_that_fit(agent, config, mocker):
+    mocker.patch(
+        "autogpt.memory.message_history.count_message_tokens",
+        side_effect=fake_count_message_tokens,
+    )
+    history = MessageHistory(agent)
+    add_cycles(history, 30)
+
+    for token_budget in [-1, 0, 50, 333, 1000, 100000]:
+        # Reference: add cycles newest first until the next one doesn't fit
+        expected, expected_tokens = [], 0
+        for cycle in reversed(list(history.per_cycle(config))):
+            messages = [m for m in cycle if m is not None]
+            tokens = fake_count_message_tokens(messages, config.smart_llm)
+            if expected_tokens + tokens > token_budget:
+                break
+            expected = messages + expected
+            expected_tokens += tokens
+
+        messages, tokens = history.context_window(
+            config, config.smart_llm, token_budget
+        )
+
+        assert messages == expected
+        assert tokens == expected_tokens
+
+
+def test_context_window_only_counts_new_messages(agent, config, mocker):
+    count_message_tokens = mocker.patch(
+        "autogpt.memory.message_history.count_message_tokens",
+        side_effect=fake_count_message_tokens,
+    )
+    history = MessageHistory(agent)
+    add_cycles(history, 10)
+    history.context_window(config, config.smart_llm, 1000)
+    assert count_message_tokens.call_count == 30
+
+    add_cycles(history, 1, start=10)
+    history.prepare_context(config.smart_llm)
+    history.context_window(config, config.smart_llm, 1000)
+
+    assert count_message_tokens.call_count == 33
+
+    # The counts are dropped if the messages are replaced rather than appended to
+    history.messages = history.messages[-9:]
+    messages, _ = history.context_window(config, config.smart_llm, 1000)
+
+    assert count_message_tokens.call_count == 42
+    assert messages == history.messages
+
+
+def test_cycle_index_parses_each_response_once(agent, config, mocker):
+    extract_json = mocker.patch(
+        "autogpt.memory.message_history.extract_json_from_response",
+        side_effect=extract_json_from_response,
+    )
+    history = MessageHistory(agent)
+    add_cycles(history, 5)
+    history.add("assistant", "not JSON", "ai_response")
+    history.add("system", "Command failed", "action_result")
+    add_cycles(history, 5, start=5)
+
+    for _ in range(3):
+        cycles = list(history.per_cycle(config))
+
+    assert len(cycles) == 10
+    assert cycles[0] == tuple(history.messages[0:3])
+    assert cycles[-1] == tuple(history.messages[-3:])
+    assert extract_json.call_count == 11
+    assert history.parsed_response(1) == {
+        "command": {"name": "read_file", "args": {"filename": "0.txt"}}
+    }
+    assert extract_json.call_count == 11
+
+
+def test_cycle_index_follows_replaced_history(agent, config):
+    history = MessageHistory(agent)
+    add_cycles(history, 3)
+    assert len(history.cycles) == 3
+
+    history.messages = history.messages[:3]
+    assert history.cycles == [tuple(history.messages)]
+
+    other_history = MessageHistory(agent)
+    add_cycles(other_history, 4, start=3)
+    history.messages = other_history.messages
+    assert history.cycles == other_history.cycles
+
+
+def test_trim_messages_cost_is_independent_of_history_length(agent, config, mocker):
+    mocker.patch.object(
+        MessageHistory,
+        "update_running_summary",
+        return_value=Message("system", "summary"),
+    )
+    message_key = mocker.patch(
+        "autogpt.memory.message_history._message_key", side_effect=_message_key
+    )
+    message_eq = mocker.spy(Message, "__eq__")
+
+    def steady_state_trim_cost(message_count: int) -> int:
+        history = MessageHistory(agent)
+        cycle_count = message_count // 3
+        add_cycles(history, cycle_count)
+        history.trim_messages(history.messages[-9:], config)
+        assert history.last_trimmed_index == len(history) - 10
+
+        # Trim the cycle that falls out of the window after the next one is added
+        add_cycles(history, 1, start=cycle_count)
+        message_key.reset_mock()
+        _, trimmed = history.trim_messages(history.messages[-9:], config)
+        assert message_eq.call_count == 0
+
+        # The user inputs are the same as the ones still in the window
+        assert trimmed == history.messages[-11:-9]
+        assert history.last_trimmed_index == len(history) - 10
+        return message_key.call_count
+
+    assert steady_state_trim_cost(1_000) == steady_state_trim_cost(10_000)
+
+
+def test_running_summary_is_updated_in_the_background(agent, config, mocker):
+    mocker.patch.object(config, "running_summary_max_lag", 1)
+    mocker.patch("autogpt.memory.message_history.count_string_tokens", return_value=1)
+    mocker.patch(
+        "autogpt.memory.message_history.count_string_tokens_batch",
+        side_effect=lambda texts, model: [1] * len(texts),
+    )
+    permits = threading.Semaphore(0)
+    summaries = iter(f"summary {i}" for i in itertools.count(1))
+
+    def summarize(prompt, config):
+        assert permits.acquire(timeout=5)
+        return MagicMock(content=next(summaries))
+
+    mocker.patch(
+        "autogpt.memory.message_history.create_chat_completion",
+        side_effect=summarize,
+    )
+    history = MessageHistory(agent)
+    add_cycles(history, 4)
+
+    # One cycle behind: the update doesn't hold up the cycle
+    summary_message, trimmed = history.trim_messages(history.messages[-9:], config)
+    assert len(trimmed) == 2
+    assert summary_message.content.endswith("I was created")
+
+    permits.release()
+    history.wait_for_summary()
+    assert history.summary == "summary 1"
+
+    # Two cycles behind: the cycle waits for the oldest update
+    add_cycles(history, 1, start=4)
+    summary_message, _ = history.trim_messages(history.messages[-9:], config)
+    assert summary_message.content.endswith("summary 1")
+    add_cycles(history, 1, start=5)
+    threading.Timer(0.05, permits.release).start()
+    summary_message, _ = history.trim_messages(history.messages[-9:], config)
+    assert summary_message.content.endswith("summary 2")
+
+    permits.release()
+    history.wait_for_summary()
+    assert history.summary == "summary 3"
+
+
+class DOSPAIHooks:
+    """The chat completion hooks of the DOSPAI plugin"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def can_handle_chat_completion(self, **kwargs) -> bool:
+        return True
+
+    def handle_chat_completion(self, **kwargs):
+        return self._data.replace_chat_completion()
+
+    def can_handle_on_response(self) -> bool:
+        return True
+
+    def on_response(self, content, function_call):
+        return self._data.process_actions(content, function_call)
+
+
+def test_background_summary_leaves_main_completion_to_plugins(
+    agent, config, mocker
+):
+    dospai_data = pytest.importorskip("plugins.dospai.dospai_data")
+    data = object.__new__(dospai_data.ClDOSPAIData)
+    data._config = config
+    data._b_gpt_function = False
+    data._bfixed = False
+    # Set by on_planning for the main completion of the cycle
+    data._b_action_response = True
+
+    mocker.patch.object(config, "plugins", [DOSPAIHooks(data)])
+    mocker.patch.object(config, "openai_streaming", False)
+    mocker.patch("autogpt.memory.message_history.count_string_tokens", return_value=1)
+    mocker.patch(
+        "autogpt.memory.message_history.count_string_tokens_batch",
+        side_effect=lambda texts, model: [1] * len(texts),
+    )
+    mocker.patch(
+        "autogpt.llm.utils.count_message_tokens",
+        side_effect=fake_count_message_tokens,
+    )
+    mocker.patch(
+        "autogpt.llm.utils.iopenai.create_chat_completion",
+        return_value=OpenAIObject.construct_from(
+            {"choices": [{"message": {"role": "assistant", "content": "summary"}}]}
+        ),
+    )
+    history = MessageHistory(agent)
+    add_cycles(history, 4)
+
+    history.trim_messages(history.messages[-9:], config)
+    history.wait_for_summary()
+
+    assert history.summary == "summary"
+    assert data._b_action_response
@@ -0,0 +1,113 @@
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from autogpt.agent import Agent
+from autogpt.llm.prompt_compiler import PromptCompiler, compile_prompt
+from autogpt.llm.utils import token_counter
+from autogpt.models.command import Command
+from autogpt.models.command_parameter import CommandParameter
+
+
+@pytest.fixture(autouse=True)
+def fake_tokenizer(mocker: MockerFixture) -> MagicMock:
+    """Tokenizer which splits on whitespace, so tests don't need the BPE files"""
+    tokenizer = MagicMock()
+    tokenizer.name = "fake"
+    tokenizer.encode.side_effect = str.split
+    mocker.patch.object(token_counter, "get_tokenizer", return_value=tokenizer)
+    return tokenizer
+
+
+@pytest.fixture
+def example_command() -> Command:
+    return Command(
+        name="read_file",
+        description="Read a file",
+        method=lambda filename: "",
+        parameters=[CommandParameter("filename", "string", "File to read", True)],
+    )
+
+
+def test_compile_prompt_counts_system_message(agent: Agent):
+    compiled = compile_prompt(agent, "You are a helpful agent", "gpt-3.5-turbo")
+
+    assert compiled.system_message.content == "You are a helpful agent"
+    # 4 tokens per message, 1 for the role and 5 for the content
+    assert compiled.system_message_tokens == 4 + 1 + 5
+    assert compiled.functions == []
+    assert compiled.functions_tokens == 0
+
+
+def test_compile_prompt_counts_functions(
+    agent: Agent, example_command: Command, mocker: MockerFixture
+):
+    mocker.patch.object(agent.config, "openai_functions", True)
+    mocker.patch.object(
+        agent.command_registry, "commands", {example_command.name: example_command}
+    )
+
+    compiled = compile_prompt(agent, "You are a helpful agent", "gpt-3.5-turbo")
+
+    assert [f.name for f in compiled.functions] == ["read_file"]
+    definitions = token_counter._format_function_definitions(
+        [compiled.functions[0].__dict__]
+    )
+    assert compiled.functions_tokens == len(definitions.split()) + 9 - 4
+
+
+def test_prompt_compiler_reuses_compiled_prompt(
+    agent: Agent, example_command: Command, mocker: MockerFixture
+):
+    mocker.patch.object(agent.command_registry, "commands", {})
+    mocker.patch.object(agent.command_registry, "commands_aliases", {})
+    compiler = PromptCompiler()
+
+    first = compiler.compile(agent, agent.system_prompt, "gpt-3.5-turbo")
+    second = compiler.compile(agent, agent.system_prompt, "gpt-3.5-turbo")
+    agent.command_registry.register(example_command)
+    after_register = compiler.compile(agent, agent.system_prompt, "gpt-3.5-turbo")
+    other_prompt = compiler.compile(agent, "Another prompt", "gpt-3.5-turbo")
+
+    assert second is first
+    assert after_register is not first
+    assert other_prompt is not after_register
+    assert other_prompt.system_message.content == "Another prompt"
+
+
+def test_function_definitions_format():
+    functions = [
+        {
+            "name": "search",
+            "description": "Search the web",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "The query"},
+                    "limit": {"type": "integer"},
+                    "mode": {"type": "string", "enum": ["fast", "full"]},
+                },
+                "required": ["query"],
+            },
+        },
+        {"name": "task_complete", "parameters": {"type": "object", "properties": {}}},
+    ]
+
+    assert token_counter._format_function_definitions(functions) == "\n".join(
+        [
+            "namespace functions {",
+            "",
+            "// Search the web",
+            "type search = (_: {",
+            "// The query",
+            "query: string,",
+            "limit?: number,",
+            'mode?: "fast" | "full",',
+            "}) => any;",
+            "",
+            "type task_complete = () => any;",
+            "",
+            "} // namespace functions",
+        ]
+    )
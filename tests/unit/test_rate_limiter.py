@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from openai.error import RateLimitError
+from pytest_mock import MockerFixture
+
+from autogpt.core.resource.model_providers.rate_limiter import (
+    RateLimiter,
+    estimate_request_tokens,
+    get_retry_after,
+)
+from autogpt.llm.priority import RequestPriority, request_priority
+from autogpt.llm.providers import openai
+
+
+@pytest.fixture
+def clock(mocker: MockerFixture):
+    """Frozen time.time() which can be moved forward through `clock.now`"""
+
+    class Clock:
+        now = 1000.0
+
+    clock = Clock()
+    mocker.patch(
+        "autogpt.core.resource.model_providers.rate_limiter.time.time",
+        side_effect=lambda: clock.now,
+    )
+    return clock
+
+
+def test_no_limits():
+    limiter = RateLimiter()
+
+    assert all(limiter.try_reserve("gpt-4", 10_000) == 0 for _ in range(100))
+    assert not limiter.penalize("gpt-4")
+
+
+def test_limits_are_looked_up_by_longest_prefix():
+    limiter = RateLimiter(
+        requests_per_minute={"*": 3500, "gpt-4": 200, "gpt-4-32k": 20},
+        tokens_per_minute={"gpt-3.5-turbo": 90_000},
+    )
+
+    assert limiter.get_limits("gpt-4-0613") == (200, None)
+    assert limiter.get_limits("gpt-4-32k-0613") == (20, None)
+    assert limiter.get_limits("gpt-3.5-turbo-16k") == (3500, 90_000)
+
+
+def test_requests_are_spaced_out(clock):
+    limiter = RateLimiter(requests_per_minute={"*": 60})
+    for _ in range(60):
+        assert limiter.try_reserve("gpt-4") == 0
+
+    # The bucket is empty, so the next request has to wait a second
+    assert limiter.try_reserve("gpt-4") == pytest.approx(1)
+    # Buckets are per model
+    assert limiter.try_reserve("gpt-3.5-turbo") == 0
+
+    clock.now += 2
+    assert limiter.try_reserve("gpt-4") == 0
+    assert limiter.try_reserve("gpt-4") == 0
+    assert limiter.try_reserve("gpt-4") == pytest.approx(1)
+
+
+def test_tokens_per_minute(clock):
+    limiter = RateLimiter(tokens_per_minute={"*": 6000})
+
+    assert limiter.try_reserve("gpt-4", 5000) == 0
+    assert limiter.try_reserve("gpt-4", 2000) == pytest.approx(10)
+
+
+def test_penalize(clock):
+    limiter = RateLimiter(requests_per_minute={"*": 60})
+
+    assert limiter.penalize("gpt-4")
+    assert limiter.try_reserve("gpt-4") == pytest.approx(1)
+
+    assert limiter.penalize("gpt-4", retry_after=20)
+    assert limiter.try_reserve("gpt-4") == pytest.approx(20)
+
+
+def test_state_is_shared_through_file(clock, tmp_path):
+    state_file = tmp_path / "rate_limits.json"
+    limiters = [
+        RateLimiter(requests_per_minute={"*": 60}, state_file=state_file)
+        for _ in range(2)
+    ]
+
+    for i in range(60):
+        assert limiters[i % 2].try_reserve("gpt-4") == 0
+    assert limiters[0].try_reserve("gpt-4") == pytest.approx(1)
+
+    clock.now += 1
+    assert limiters[1].try_reserve("gpt-4") == 0
+    assert limiters[0].try_reserve("gpt-4") == pytest.approx(1)
+
+
+def test_estimate_request_tokens():
+    messages = [{"role": "user", "content": "x" * 400}]
+
+    assert 1100 <= estimate_request_tokens(messages, max_tokens=1000) < 1200
+
+
+def test_get_retry_after():
+    assert get_retry_after(RateLimitError("Error", headers={"retry-after": "3"})) == 3
+    assert get_retry_after(RateLimitError("Error")) is None
+
+
+def test_retry_api_uses_rate_limiter(mocker: MockerFixture):
+    limiter = RateLimiter(requests_per_minute={"*": 60})
+    mocker.patch.object(openai, "_rate_limiter", limiter)
+    acquire = mocker.spy(limiter, "acquire")
+    penalize = mocker.spy(limiter, "penalize")
+    sleep = mocker.patch("autogpt.llm.providers.openai.time.sleep")
+    calls = []
+
+    @openai.retry_api()
+    def f(messages, **kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise RateLimitError("Error", headers={"retry-after": "0.01"})
+        return len(calls)
+
+    assert f([{"role": "user", "content": "Hi"}], model="gpt-4", max_tokens=10) == 2
+    assert acquire.call_count == 2
+    penalize.assert_called_once_with("gpt-4", 0.01)
+    # The limiter has taken over the exponential backoff
+    assert all(call.args[0] <= 1 for call in sleep.call_args_list)
+
+
+def test_try_reserve_does_not_go_into_debt(clock):
+    limiter = RateLimiter(requests_per_minute={"*": 60}, tokens_per_minute={"*": 600})
+
+    assert limiter.try_reserve("gpt-4", 500) == 0
+    assert limiter.try_reserve("gpt-4", 200) == pytest.approx(10)
+    assert limiter.try_reserve("gpt-4", 100) == 0
+    # A request larger than the limit only needs a full bucket
+    clock.now += 60
+    assert limiter.try_reserve("gpt-4", 1000) == 0
+
+
+def test_lower_priorities_leave_headroom(clock):
+    limiter = RateLimiter(requests_per_minute={"*": 100}, priority_headroom=0.1)
+    for _ in range(80):
+        assert limiter.try_reserve("gpt-4") == 0
+
+    # 20 requests left: priority 2 has to leave 20 unused, priority 1 only 10
+    assert limiter.try_reserve("gpt-4", priority=2) == pytest.approx(0.6)
+    assert limiter.try_reserve("gpt-4", priority=1) == 0
+    assert limiter.try_reserve("gpt-4", priority=0) == 0
+
+
+def test_acquire_serves_higher_priority_first():
+    limiter = RateLimiter(requests_per_minute={"*": 600}, priority_headroom=0)
+    for _ in range(600):
+        limiter.try_reserve("gpt-4")
+    served = []
+
+    def acquire(priority: int):
+        limiter.acquire("gpt-4", priority=priority)
+        served.append(priority)
+
+    threads = [threading.Thread(target=acquire, args=(3,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while len(limiter._waiting.get("gpt-4", [])) < 2:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=acquire, args=(0,)))
+    threads[-1].start()
+    for thread in threads:
+        thread.join(5)
+
+    assert served == [0, 3, 3]
+
+
+def test_aacquire_serves_higher_priority_first():
+    limiter = RateLimiter(requests_per_minute={"*": 600}, priority_headroom=0)
+    for _ in range(600):
+        limiter.try_reserve("gpt-4")
+    served = []
+
+    async def acquire(priority: int):
+        await limiter.aacquire("gpt-4", priority=priority)
+        served.append(priority)
+
+    async def run():
+        background = [asyncio.create_task(acquire(3)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        await asyncio.gather(acquire(0), *background)
+
+    asyncio.run(run())
+
+    assert served == [0, 3, 3]
+
+
+def test_retry_api_uses_request_priority(mocker: MockerFixture):
+    limiter = RateLimiter(requests_per_minute={"*": 60})
+    mocker.patch.object(openai, "_rate_limiter", limiter)
+    acquire = mocker.spy(limiter, "acquire")
+
+    @openai.retry_api()
+    def f(messages, **kwargs):
+        return True
+
+    f([], model="gpt-4")
+    with request_priority(RequestPriority.SUMMARY):
+        f([], model="gpt-4")
+
+    assert [call.args[2] for call in acquire.call_args_list] == [
+        RequestPriority.INTERACTIVE,
+        RequestPriority.SUMMARY,
+    ]
@@ -0,0 +1,137 @@
+from unittest.mock import MagicMock
+
+import pytest
+from openai.openai_object import OpenAIObject
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.llm.api_manager import ApiManager
+from autogpt.llm.base import ChatSequence, Message
+from autogpt.llm.response_cache import ResponseCache
+from autogpt.llm.utils import create_chat_completion
+
+
+@pytest.fixture
+def cache(tmp_path) -> ResponseCache:
+    return ResponseCache(tmp_path / "cache.sqlite3", max_size=1024)
+
+
+@pytest.fixture
+def cached_config(config: Config, tmp_path, mocker: MockerFixture) -> Config:
+    mocker.patch.multiple(
+        config,
+        llm_response_cache=True,
+        llm_response_cache_file=str(tmp_path / "llm_cache.sqlite3"),
+        llm_response_cache_max_temperature=0,
+        plugins=[],
+    )
+    return config
+
+
+def mock_chat_response(content: str) -> OpenAIObject:
+    return OpenAIObject.construct_from(
+        {"choices": [{"message": {"role": "assistant", "content": content}}]}
+    )
+
+
+def test_make_key_depends_on_request():
+    messages = [{"role": "user", "content": "Hello"}]
+    key = ResponseCache.make_key("gpt-3.5-turbo", 0, 100, messages)
+
+    assert key == ResponseCache.make_key("gpt-3.5-turbo", 0, 100, list(messages))
+    assert key != ResponseCache.make_key("gpt-4", 0, 100, messages)
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", 0.5, 100, messages)
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", 0, 200, messages)
+    assert key != ResponseCache.make_key(
+        "gpt-3.5-turbo", 0, 100, messages, functions=[{"name": "f"}]
+    )
+    assert key != ResponseCache.make_key(
+        "gpt-3.5-turbo", 0, 100, messages, stop_when_complete=True
+    )
+
+
+def test_get_put(cache: ResponseCache):
+    assert cache.get("key") is None
+
+    cache.put("key", {"content": "Hi there!"})
+
+    assert cache.get("key") == {"content": "Hi there!"}
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_used(cache: ResponseCache):
+    value = {"content": "x" * 400}
+    cache.put("a", value)
+    cache.put("b", value)
+    cache.get("a")  # "b" is now the least recently used entry
+    cache.put("c", value)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.size <= cache.max_size
+
+
+def test_skips_values_larger_than_cache(cache: ResponseCache):
+    cache.put("big", {"content": "x" * 2048})
+
+    assert cache.get("big") is None
+    assert len(cache) == 0
+
+
+def test_create_chat_completion_served_from_cache(
+    cached_config: Config, api_manager: ApiManager, mocker: MockerFixture
+):
+    mock_create = mocker.patch(
+        "autogpt.llm.utils.iopenai.create_chat_completion",
+        return_value=mock_chat_response("Hi there!"),
+    )
+    prompt = ChatSequence.for_model("gpt-3.5-turbo", [Message("user", "Hello")])
+
+    first = create_chat_completion(prompt, cached_config, max_tokens=100)
+    second = create_chat_completion(prompt, cached_config, max_tokens=100)
+
+    assert first.content == second.content == "Hi there!"
+    assert mock_create.call_count == 1
+    assert api_manager.get_cache_misses() == 1
+    assert api_manager.get_cache_hits() == 1
+
+
+def test_create_chat_completion_bypasses_cache_above_max_temperature(
+    cached_config: Config, api_manager: ApiManager, mocker: MockerFixture
+):
+    mock_create = mocker.patch(
+        "autogpt.llm.utils.iopenai.create_chat_completion",
+        return_value=mock_chat_response("Hi there!"),
+    )
+    prompt = ChatSequence.for_model("gpt-3.5-turbo", [Message("user", "Hello")])
+
+    for _ in range(2):
+        create_chat_completion(prompt, cached_config, temperature=0.7, max_tokens=100)
+
+    assert mock_create.call_count == 2
+    assert api_manager.get_cache_hits() == api_manager.get_cache_misses() == 0
+
+
+def test_on_response_plugins_run_on_cache_hit(
+    cached_config: Config, mocker: MockerFixture
+):
+    mocker.patch(
+        "autogpt.llm.utils.iopenai.create_chat_completion",
+        return_value=mock_chat_response("Hi there!"),
+    )
+    plugin = MagicMock()
+    plugin.can_handle_chat_completion.return_value = False
+    plugin.can_handle_on_response.return_value = True
+    plugin.on_response.side_effect = lambda content, function_call: (
+        content.upper(),
+        function_call,
+    )
+    cached_config.plugins = [plugin]
+    prompt = ChatSequence.for_model("gpt-3.5-turbo", [Message("user", "Hello")])
+
+    create_chat_completion(prompt, cached_config, max_tokens=100)
+    reply = create_chat_completion(prompt, cached_config, max_tokens=100)
+
+    assert reply.content == "HI THERE!"
+    assert plugin.on_response.call_count == 2
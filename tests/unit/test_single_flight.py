@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from openai.openai_object import OpenAIObject
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.llm.api_manager import ApiManager
+from autogpt.llm.base import ChatSequence, Message
+from autogpt.llm.single_flight import SingleFlight
+from autogpt.llm.utils import create_chat_completion
+
+
+def test_make_key_depends_on_request():
+    key = SingleFlight.make_key("embedding", input=["a"], model="ada")
+
+    assert key == SingleFlight.make_key("embedding", model="ada", input=["a"])
+    assert key != SingleFlight.make_key("embedding", input=["b"], model="ada")
+    assert key != SingleFlight.make_key("chat_completion", input=["a"], model="ada")
+
+
+def test_concurrent_calls_are_coalesced():
+    coalesced = []
+    flight = SingleFlight(on_coalesced=coalesced.append)
+    release = threading.Event()
+    calls = 0
+
+    def call():
+        nonlocal calls
+        calls += 1
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(flight.do, "key", call) for _ in range(3)]
+        while len(coalesced) < 2:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == ["result"] * 3
+    assert calls == 1
+    assert coalesced == ["key", "key"]
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    calls = []
+
+    for i in range(2):
+        flight.do("key", lambda: calls.append(i))
+
+    assert calls == [0, 1]
+
+
+def test_errors_are_shared_with_waiting_callers():
+    coalesced = threading.Event()
+    flight = SingleFlight(on_coalesced=lambda _: coalesced.set())
+    started = threading.Event()
+    release = threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("API error")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", call)
+        started.wait(5)
+        follower = executor.submit(flight.do, "key", lambda: "not called")
+        coalesced.wait(5)
+        release.set()
+
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="API error"):
+                future.result()
+
+
+def test_async_calls_are_coalesced():
+    flight = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", call) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["result"] * 3
+    assert calls == 1
+
+
+def test_create_chat_completion_coalesces_identical_requests(
+    config: Config, api_manager: ApiManager, mocker: MockerFixture
+):
+    mocker.patch.multiple(config, llm_response_cache=False, plugins=[])
+    started = threading.Event()
+    release = threading.Event()
+
+    def api_call(**_):
+        started.set()
+        release.wait(5)
+        return OpenAIObject.construct_from(
+            {"choices": [{"message": {"role": "assistant", "content": "Hi!"}}]}
+        )
+
+    mock_create = mocker.patch(
+        "autogpt.llm.utils.iopenai.create_chat_completion", side_effect=api_call
+    )
+    prompt = ChatSequence.for_model("gpt-3.5-turbo", [Message("user", "Hello")])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(create_chat_completion, prompt, config, max_tokens=10)
+        started.wait(5)
+        second = executor.submit(create_chat_completion, prompt, config, max_tokens=10)
+        while not api_manager.get_coalesced_calls():
+            threading.Event().wait(0.01)
+        release.set()
+
+        assert first.result().content == second.result().content == "Hi!"
+
+    assert mock_create.call_count == 1
+    assert api_manager.get_coalesced_calls() == {"chat_completion": 1}
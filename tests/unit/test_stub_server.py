@@ -0,0 +1,183 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from autogpt.ai_guidelines import guideline_report_function
+from autogpt.llm.stub_server import (
+    FaultSettings,
+    LatencySettings,
+    ScriptedResponse,
+    StubServerSettings,
+    create_app,
+)
+
+
+def make_client(**settings) -> TestClient:
+    return TestClient(create_app(StubServerSettings(seed=42, **settings)))
+
+
+def chat_request(content: str, model: str = "gpt-3.5-turbo", **kwargs) -> dict:
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        **kwargs,
+    }
+
+
+def test_list_models():
+    response = make_client(models=["gpt-4", "gpt-3.5-turbo"]).get("/v1/models")
+
+    assert response.status_code == 200
+    assert [m["id"] for m in response.json()["data"]] == ["gpt-4", "gpt-3.5-turbo"]
+
+
+def test_chat_completion_default_reply_is_valid_agent_reply():
+    response = make_client().post("/v1/chat/completions", json=chat_request("Hi"))
+
+    assert response.status_code == 200
+    body = response.json()
+    reply = json.loads(body["choices"][0]["message"]["content"])
+    assert "command" in reply
+    assert body["usage"]["total_tokens"] == (
+        body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+    )
+
+
+def test_chat_completion_scripted_response():
+    client = make_client(
+        responses=[
+            ScriptedResponse(match="summary", content="Summary for $model"),
+            ScriptedResponse(content="Fallback"),
+        ]
+    )
+
+    summary = client.post("/v1/chat/completions", json=chat_request("summary please"))
+    other = client.post("/v1/chat/completions", json=chat_request("hello"))
+
+    assert summary.json()["choices"][0]["message"]["content"] == (
+        "Summary for gpt-3.5-turbo"
+    )
+    assert other.json()["choices"][0]["message"]["content"] == "Fallback"
+
+
+def test_chat_completion_forced_function():
+    request = chat_request(
+        "Check the guidelines",
+        functions=[guideline_report_function.__dict__],
+        function_call={"name": "guideline_evaluation"},
+    )
+
+    response = make_client().post("/v1/chat/completions", json=request)
+
+    choice = response.json()["choices"][0]
+    assert choice["finish_reason"] == "function_call"
+    assert choice["message"]["function_call"]["name"] == "guideline_evaluation"
+    assert json.loads(choice["message"]["function_call"]["arguments"]) == {
+        "severity": 0
+    }
+
+
+def test_chat_completion_scripted_usage_and_function_call():
+    client = make_client(
+        responses=[
+            ScriptedResponse(
+                function_call={"name": "guideline_evaluation"}, completion_tokens=500
+            )
+        ]
+    )
+    request = chat_request(
+        "Check the guidelines",
+        functions=[guideline_report_function.__dict__],
+        function_call={"name": "guideline_evaluation"},
+    )
+
+    body = client.post("/v1/chat/completions", json=request).json()
+
+    assert body["usage"]["completion_tokens"] == 500
+    assert body["choices"][0]["message"]["function_call"] == {
+        "name": "guideline_evaluation",
+        "arguments": "{}",
+    }
+
+
+def test_unknown_model():
+    response = make_client().post(
+        "/v1/chat/completions", json=chat_request("Hi", model="gpt-5")
+    )
+
+    assert response.status_code == 404
+    assert "error" in response.json()
+
+
+@pytest.mark.parametrize(
+    "faults, status_code",
+    [
+        (FaultSettings(rate_limit_probability=1), 429),
+        (FaultSettings(bad_gateway_probability=1), 502),
+    ],
+)
+def test_error_injection(faults: FaultSettings, status_code: int):
+    client = make_client(faults=faults)
+
+    response = client.post("/v1/chat/completions", json=chat_request("Hi"))
+
+    assert response.status_code == status_code
+    assert "error" in response.json()
+    assert client.get("/stub/stats").json()["injected_errors"] == 1
+
+
+def test_tokens_per_minute_limit():
+    client = make_client(tokens_per_minute=50)
+
+    first = client.post("/v1/chat/completions", json=chat_request("Hi"))
+    second = client.post("/v1/chat/completions", json=chat_request("x" * 400))
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert client.get("/stub/stats").json()["rate_limited"] == 1
+
+
+def test_embeddings_are_deterministic_unit_vectors():
+    client = make_client(embedding_dimensions=8)
+    request = {"model": "text-embedding-ada-002", "input": ["foo", "bar", "foo"]}
+
+    data = client.post("/v1/embeddings", json=request).json()["data"]
+
+    assert [d["index"] for d in data] == [0, 1, 2]
+    assert data[0]["embedding"] == data[2]["embedding"] != data[1]["embedding"]
+    assert np.linalg.norm(data[0]["embedding"]) == pytest.approx(1, abs=1e-5)
+
+
+def test_latency_sample():
+    import random
+
+    rng = random.Random(0)
+    latency = LatencySettings(
+        distribution="uniform",
+        low=1,
+        high=2,
+        seconds_per_token=0.1,
+        stall_probability=1,
+        stall_seconds=60,
+    )
+
+    assert 62 <= latency.sample(rng, completion_tokens=10) <= 63
+
+
+def test_chat_completion_stream():
+    client = make_client(responses=[ScriptedResponse(content="x" * 40)])
+
+    response = client.post("/v1/chat/completions", json=chat_request("Hi", stream=True))
+
+    events = [
+        line[len("data: ") :]
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+    assert content == "x" * 40
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
@@ -0,0 +1,107 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from pytest_mock import MockerFixture
+
+from autogpt.config import Config
+from autogpt.processing import text as text_processing
+from autogpt.processing.summary_cache import SummaryCache
+
+SCOPE = SummaryCache.make_scope("gpt-3.5-turbo", None)
+
+
+@pytest.fixture
+def cache(tmp_path) -> SummaryCache:
+    return SummaryCache(tmp_path / "summaries.sqlite3", max_entries=3)
+
+
+def test_get_returns_summary_of_similar_text(cache: SummaryCache):
+    cache.put(SCOPE, [1.0, 0.0, 0.0], "Summary")
+
+    assert cache.get(SCOPE, [0.99, 0.05, 0.0], min_similarity=0.98) == "Summary"
+    assert cache.get(SCOPE, [0.8, 0.6, 0.0], min_similarity=0.98) is None
+
+
+def test_get_returns_most_similar_summary(cache: SummaryCache):
+    cache.put(SCOPE, [1.0, 0.0, 0.0], "First")
+    cache.put(SCOPE, [0.0, 1.0, 0.0], "Second")
+
+    assert cache.get(SCOPE, [0.1, 1.0, 0.0], min_similarity=0.9) == "Second"
+
+
+def test_summaries_are_scoped_by_model_and_instruction(cache: SummaryCache):
+    cache.put(SCOPE, [1.0, 0.0], "Summary")
+
+    other_scope = SummaryCache.make_scope("gpt-3.5-turbo", "focus on prices")
+    assert cache.get(other_scope, [1.0, 0.0], min_similarity=0.9) is None
+
+
+def test_get_keeps_embeddings_in_memory(cache: SummaryCache):
+    cache.put(SCOPE, [1.0, 0.0, 0.0], "First")
+    assert cache.get(SCOPE, [1.0, 0.0, 0.0], min_similarity=0.9) == "First"
+    cache.put(SCOPE, [0.0, 1.0, 0.0], "Second")
+    statements = []
+    cache._connection.set_trace_callback(statements.append)
+
+    assert cache.get(SCOPE, [0.0, 1.0, 0.0], min_similarity=0.9) == "Second"
+    assert not any("embedding FROM" in statement for statement in statements)
+
+
+def test_evicts_least_recently_used(cache: SummaryCache):
+    vectors = np.eye(4).tolist()
+    for i in range(3):
+        cache.put(SCOPE, vectors[i], f"Summary {i}")
+    cache.get(SCOPE, vectors[0], min_similarity=0.9)
+    cache.put(SCOPE, vectors[3], "Summary 3")
+
+    assert len(cache) == 3
+    assert cache.get(SCOPE, vectors[0], min_similarity=0.9) == "Summary 0"
+    assert cache.get(SCOPE, vectors[1], min_similarity=0.9) is None
+
+
+def test_summarize_text_reuses_summary_of_similar_text(
+    config: Config, tmp_path, mocker: MockerFixture
+):
+    mocker.patch.multiple(
+        config,
+        summary_cache=True,
+        summary_cache_file=str(tmp_path / "summaries.sqlite3"),
+        summary_cache_min_similarity=0.98,
+    )
+    embeddings = {
+        "Page at 10:00": [1.0, 0.0],
+        "Page at 10:05": [0.999, 0.01],
+        "Another page": [0.0, 1.0],
+    }
+    mocker.patch(
+        "autogpt.memory.vector.utils.get_embedding",
+        side_effect=lambda text, _: embeddings[text],
+    )
+    mocker.patch.object(text_processing, "count_string_tokens", return_value=10)
+    mocker.patch.object(text_processing, "_get_summary_prompt")
+    create_chat_completion = mocker.patch.object(
+        text_processing,
+        "create_chat_completion",
+        side_effect=[MagicMock(content="Page"), MagicMock(content="Another")],
+    )
+
+    assert text_processing.summarize_text("Page at 10:00", config) == ("Page", None)
+    assert text_processing.summarize_text("Page at 10:05", config) == ("Page", None)
+    assert text_processing.summarize_text("Another page", config) == ("Another", None)
+    assert create_chat_completion.call_count == 2
+
+
+def test_summarize_text_skips_cache_when_disabled(
+    config: Config, mocker: MockerFixture
+):
+    mocker.patch.object(config, "summary_cache", False)
+    get_embedding = mocker.patch("autogpt.memory.vector.utils.get_embedding")
+    mocker.patch.object(text_processing, "count_string_tokens", return_value=10)
+    mocker.patch.object(text_processing, "_get_summary_prompt")
+    mocker.patch.object(
+        text_processing, "create_chat_completion", return_value=MagicMock(content="S")
+    )
+
+    assert text_processing.summarize_text("Text", config) == ("S", None)
+    get_embedding.assert_not_called()
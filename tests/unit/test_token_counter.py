@@ -1,7 +1,16 @@
+from unittest.mock import MagicMock
+
 import pytest
+from pytest_mock import MockerFixture
 
 from autogpt.llm.base import Message
-from autogpt.llm.utils import count_message_tokens, count_string_tokens
+from autogpt.llm.utils import (
+    count_message_tokens,
+    count_string_tokens,
+    count_string_tokens_batch,
+    get_tokenizer,
+    token_counter,
+)
 
 
 def test_count_message_tokens():
@@ -53,3 +62,99 @@ def test_count_string_tokens_gpt_4():
 
     string = "Hello, world!"
     assert count_string_tokens(string, model_name="gpt-4-0314") == 4
+
+
+@pytest.fixture
+def fake_tokenizer(mocker: MockerFixture) -> MagicMock:
+    """Tokenizer which splits on whitespace, so tests don't need the BPE files"""
+    tokenizer = MagicMock()
+    tokenizer.name = "fake"
+    tokenizer.encode.side_effect = str.split
+    tokenizer.encode_batch.side_effect = lambda texts, **_: [t.split() for t in texts]
+    mocker.patch.object(token_counter, "get_tokenizer", return_value=tokenizer)
+    mocker.patch.object(
+        token_counter, "_token_counts", token_counter._TokenCountCache(max_size=4)
+    )
+    return tokenizer
+
+
+def test_count_string_tokens_is_cached(fake_tokenizer: MagicMock):
+    assert count_string_tokens("one two three", "gpt-3.5-turbo") == 3
+    assert count_string_tokens("one two three", "gpt-3.5-turbo") == 3
+
+    fake_tokenizer.encode.assert_called_once_with("one two three")
+
+
+def test_token_count_cache_evicts_least_recently_used(fake_tokenizer: MagicMock):
+    for text in ["a", "b", "c", "d"]:
+        count_string_tokens(text, "gpt-3.5-turbo")
+    count_string_tokens("a", "gpt-3.5-turbo")
+    count_string_tokens("e", "gpt-3.5-turbo")
+    fake_tokenizer.encode.reset_mock()
+
+    count_string_tokens("a", "gpt-3.5-turbo")
+    count_string_tokens("b", "gpt-3.5-turbo")
+
+    fake_tokenizer.encode.assert_called_once_with("b")
+
+
+def test_count_string_tokens_batch(fake_tokenizer: MagicMock):
+    count_string_tokens("a b", "gpt-3.5-turbo")
+    texts = ["a b", "c", "d e f", "c"]
+
+    assert count_string_tokens_batch(texts, "gpt-3.5-turbo") == [2, 1, 3, 1]
+    assert [c.args[0] for c in fake_tokenizer.encode.call_args_list] == [
+        "a b",
+        "c",
+        "d e f",
+    ]
+
+
+def test_count_string_tokens_batch_encodes_on_threads(fake_tokenizer: MagicMock):
+    texts = [" ".join(["word"] * i) for i in range(20)]
+
+    assert count_string_tokens_batch(texts, "gpt-3.5-turbo") == list(range(20))
+    fake_tokenizer.encode_batch.assert_called_once()
+    fake_tokenizer.encode.assert_not_called()
+
+
+def test_count_message_tokens_counts_values_in_batch(fake_tokenizer: MagicMock):
+    messages = [Message("user", "Hello there"), Message("assistant", "Hi")]
+
+    # 4 tokens per message, 1 for each role, the content and 3 to prime the reply
+    assert count_message_tokens(messages, "gpt-3.5-turbo") == 4 + 1 + 2 + 4 + 1 + 1 + 3
+
+
+def test_get_tokenizer_resolves_model_once(mocker: MockerFixture):
+    get_tokenizer.cache_clear()
+    encoding_for_model = mocker.patch("tiktoken.encoding_for_model")
+
+    assert get_tokenizer("gpt-4") is get_tokenizer("gpt-4")
+    encoding_for_model.assert_called_once_with("gpt-4")
+    get_tokenizer.cache_clear()
+
+
+def test_get_tokenizer_falls_back_to_cl100k_base(mocker: MockerFixture):
+    get_tokenizer.cache_clear()
+    mocker.patch("tiktoken.encoding_for_model", side_effect=KeyError)
+    get_encoding = mocker.patch("tiktoken.get_encoding")
+
+    assert get_tokenizer("unknown-model") is get_encoding.return_value
+    get_encoding.assert_called_once_with("cl100k_base")
+    get_tokenizer.cache_clear()
+
+
+def test_count_message_tokens_with_functions(fake_tokenizer: MagicMock):
+    messages = [Message("system", "Be helpful"), Message("user", "Hi")]
+    functions = [{"name": "task_complete", "parameters": {}}]
+    definitions = (
+        "namespace functions {\n\ntype task_complete = () => any;\n\n"
+        "} // namespace functions"
+    )
+
+    assert count_message_tokens(messages, "gpt-3.5-turbo", functions) == (
+        count_message_tokens(messages, "gpt-3.5-turbo")
+        + len(definitions.split())
+        + 9
+        - 4
+    )